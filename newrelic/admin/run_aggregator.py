@@ -0,0 +1,91 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from newrelic.admin import command, usage
+
+
+@command('run-aggregator', 'config_file [socket_path]',
+"""Runs the local aggregator for the host. Worker processes configured
+with the same 'local_aggregator.socket_path' send their harvest data to
+the local aggregator over the Unix domain socket, rather than each sending
+it to New Relic. The local aggregator merges the data from all worker
+processes and reports it to New Relic with a single upload per harvest.
+
+The socket path is taken from the configuration file if not supplied. If
+the config_file is given as '-', the configuration file is taken from the
+environment variable NEW_RELIC_CONFIG_FILE.""")
+def run_aggregator(args):
+    import os
+    import signal
+    import sys
+    import threading
+
+    if len(args) == 0:
+        usage('run-aggregator')
+        sys.exit(1)
+
+    from newrelic.config import initialize
+    from newrelic.core.agent import agent_instance
+    from newrelic.core.config import global_settings
+    from newrelic.core.local_aggregator import LocalAggregator
+
+    config_file = args[0]
+    environment = os.environ.get('NEW_RELIC_ENVIRONMENT')
+
+    if config_file == '-':
+        config_file = os.environ.get('NEW_RELIC_CONFIG_FILE')
+
+    initialize(config_file, environment, ignore_errors=False)
+
+    settings = global_settings()
+
+    socket_path = len(args) >= 2 and args[1] or \
+            settings.local_aggregator.socket_path
+
+    if not socket_path:
+        print('No socket path was supplied for the local aggregator.')
+        sys.exit(1)
+
+    # The local aggregator must itself report directly to New Relic.
+
+    settings.local_aggregator.socket_path = None
+
+    # Only data for the application configured for the local aggregator
+    # is accepted from worker processes.
+
+    app_names = [name.strip() for name in settings.app_name.split(';')]
+    applications = {app_names[0] or 'Python Application':
+            [name for name in app_names[1:] if name]}
+
+    aggregator = LocalAggregator(socket_path, agent_instance(), applications)
+    aggregator.start()
+
+    print('Local aggregator listening on %s.' % socket_path)
+
+    stopped = threading.Event()
+
+    def _stop(signum, frame):
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while not stopped.is_set():
+        stopped.wait(1.0)
+
+    aggregator.stop()
+
+    agent_instance().shutdown_agent()
@@ -19,6 +19,7 @@ from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
 from newrelic.core.database_node import DatabaseNode
+from newrelic.core.database_utils import sql_statement
 from newrelic.core.stack_trace import current_stack
 
 _logger = logging.getLogger(__name__)
@@ -242,6 +243,132 @@ class DatabaseTrace(TimeTrace):
         )
 
 
+class CoalescingDatabaseTrace(DatabaseTrace):
+
+    """Database trace for a statement executed against a cursor. When
+    enabled by the datastore_tracer.coalesce_statements.enabled setting,
+    a call of a statement with the same shape as the previous statement
+    executed on the cursor is folded into the node for the previous
+    statement, rather than being given its own node, provided no other
+    traces were created in between. Whether a call can be folded in is
+    decided when the trace is entered, with calls which then raise an
+    exception or are slower than the thresholds for explain plans and
+    stack traces still being given their own node, so slow SQL reporting
+    is unaffected. The node recorded for the statement is available as
+    the node attribute once the trace has exited, to be passed as the
+    previous node for the next statement executed on the cursor.
+
+    """
+
+    def __init__(
+        self,
+        sql,
+        dbapi2_module=None,
+        connect_params=None,
+        cursor_params=None,
+        sql_parameters=None,
+        execute_params=None,
+        previous=None,
+    ):
+        super(CoalescingDatabaseTrace, self).__init__(
+            sql, dbapi2_module, connect_params, cursor_params, sql_parameters, execute_params
+        )
+
+        self.previous = previous
+        self.node = None
+
+        self._coalesce_threshold = None
+
+    @staticmethod
+    def _coalesce_threshold_for(settings):
+        if not settings.datastore_tracer.coalesce_statements.enabled:
+            return None
+
+        tt = settings.transaction_tracer
+
+        return min(tt.explain_threshold, tt.stack_trace_threshold)
+
+    def _can_coalesce(self, parent):
+        previous = self.previous
+
+        if parent is None or parent.exited or not parent.children:
+            return False
+
+        # Nothing else can have been recorded against the parent since
+        # the previous statement, including traces still running.
+
+        if parent.children[-1] is not previous or parent.child_count != len(parent.children):
+            return False
+
+        transaction = parent.root.transaction
+
+        if transaction.stopped or not transaction.enabled:
+            return False
+
+        threshold = self._coalesce_threshold_for(transaction.settings)
+
+        if threshold is None or (previous.call_times is None and previous.duration >= threshold):
+            return False
+
+        if self.sql != previous.sql:
+            statement = sql_statement(self.sql, self.dbapi2_module)
+            if statement.obfuscated != previous.statement.obfuscated:
+                return False
+
+        return True
+
+    def __enter__(self):
+        if self.previous is not None and not self._can_coalesce(self.parent or current_trace()):
+            self.previous = None
+
+        return super(CoalescingDatabaseTrace, self).__enter__()
+
+    def __exit__(self, exc, value, tb):
+        parent = self.parent
+
+        # Calls which failed, or where another trace was started against
+        # the parent while the call was running, are given a node of
+        # their own.
+
+        if self.previous is not None and (
+            exc is not None or parent is None or parent.has_async_children or parent.children[-1] is not self.previous
+        ):
+            self.previous = None
+
+        return super(CoalescingDatabaseTrace, self).__exit__(exc, value, tb)
+
+    def finalize_data(self, transaction, exc=None, value=None, tb=None):
+        super(CoalescingDatabaseTrace, self).finalize_data(transaction, exc, value, tb)
+
+        settings = transaction.settings
+
+        self._coalesce_threshold = settings and self._coalesce_threshold_for(settings)
+
+        # Calls which were slow are given a node of their own.
+
+        if self.previous is not None and (
+            self.is_async or self._coalesce_threshold is None or self.duration >= self._coalesce_threshold
+        ):
+            self.previous = None
+
+    def create_node(self):
+        previous = self.previous
+
+        if previous is not None:
+            node = previous.coalesce(self.end_time, self.duration)
+            self.coalesced_node = previous
+        else:
+            node = super(CoalescingDatabaseTrace, self).create_node()
+
+        # Only hold on to the node if a subsequent statement could be
+        # folded into it.
+
+        if self._coalesce_threshold is not None:
+            self.node = node
+
+        return node
+
+
 def DatabaseTraceWrapper(wrapped, sql, dbapi2_module=None):
     def _nr_database_trace_wrapper_(wrapped, instance, args, kwargs):
         wrapper = async_wrapper(wrapped)
@@ -13,11 +13,13 @@
 # limitations under the License.
 
 import functools
+import inspect
 
 from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper
 from newrelic.common.object_names import callable_name
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
+from newrelic.core.attribute import EMPTY_ATTRIBUTES
 from newrelic.core.function_node import FunctionNode
 
 
@@ -84,14 +86,50 @@ class FunctionTrace(TimeTrace):
             params=self.params,
             rollup=self.rollup,
             guid=self.guid,
-            agent_attributes=self.agent_attributes,
+            agent_attributes=self.agent_attributes or EMPTY_ATTRIBUTES,
             user_attributes=self.user_attributes,
         )
 
 
 def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None, terminal=False, rollup=None):
+    # Whether the wrapped function is a coroutine or generator, and the name
+    # derived from it when a name isn't supplied, don't change from one call
+    # to the next, so are worked out on the first call and then reused. The
+    # name of a bound method depends on the class it is bound to, so names
+    # are held against that class. As the same name and group objects are
+    # then passed to each trace, the nodes for the calls share them.
+
+    _async_wrapper = []
+    _names = {}
+
+    def _wrapper_for(wrapped):
+        try:
+            return _async_wrapper[0]
+        except IndexError:
+            wrapper = async_wrapper(wrapped)
+            _async_wrapper.append(wrapper)
+            return wrapper
+
+    def _name_for(wrapped):
+        owner = getattr(wrapped, "__self__", None)
+        if owner is None:
+            owner = getattr(wrapped, "im_class", None)
+        elif not inspect.isclass(owner):
+            owner = owner.__class__
+
+        try:
+            return _names[owner]
+        except KeyError:
+            _name = _names[owner] = callable_name(wrapped)
+            return _name
+
+    name_is_callable = callable(name)
+    group_is_callable = callable(group)
+    label_is_callable = callable(label)
+    params_is_callable = callable(params)
+
     def dynamic_wrapper(wrapped, instance, args, kwargs):
-        wrapper = async_wrapper(wrapped)
+        wrapper = _wrapper_for(wrapped)
         if not wrapper:
             parent = current_trace()
             if not parent:
@@ -99,19 +137,19 @@ def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None
         else:
             parent = None
 
-        if callable(name):
+        if name_is_callable:
             if instance is not None:
                 _name = name(instance, *args, **kwargs)
             else:
                 _name = name(*args, **kwargs)
 
         elif name is None:
-            _name = callable_name(wrapped)
+            _name = _name_for(wrapped)
 
         else:
             _name = name
 
-        if callable(group):
+        if group_is_callable:
             if instance is not None:
                 _group = group(instance, *args, **kwargs)
             else:
@@ -120,7 +158,7 @@ def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None
         else:
             _group = group
 
-        if callable(label):
+        if label_is_callable:
             if instance is not None:
                 _label = label(instance, *args, **kwargs)
             else:
@@ -129,7 +167,7 @@ def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None
         else:
             _label = label
 
-        if callable(params):
+        if params_is_callable:
             if instance is not None:
                 _params = params(instance, *args, **kwargs)
             else:
@@ -147,7 +185,7 @@ def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None
             return wrapped(*args, **kwargs)
 
     def literal_wrapper(wrapped, instance, args, kwargs):
-        wrapper = async_wrapper(wrapped)
+        wrapper = _wrapper_for(wrapped)
         if not wrapper:
             parent = current_trace()
             if not parent:
@@ -155,7 +193,7 @@ def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None
         else:
             parent = None
 
-        _name = name or callable_name(wrapped)
+        _name = name or _name_for(wrapped)
 
         trace = FunctionTrace(_name, group, label, params, terminal, rollup, parent=parent)
 
@@ -165,7 +203,7 @@ def FunctionTraceWrapper(wrapped, name=None, group=None, label=None, params=None
         with trace:
             return wrapped(*args, **kwargs)
 
-    if callable(name) or callable(group) or callable(label) or callable(params):
+    if name_is_callable or group_is_callable or label_is_callable or params_is_callable:
         return FunctionWrapper(wrapped, dynamic_wrapper)
 
     return FunctionWrapper(wrapped, literal_wrapper)
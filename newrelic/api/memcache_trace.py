@@ -17,6 +17,7 @@ import functools
 from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
+from newrelic.core.attribute import EMPTY_ATTRIBUTES
 from newrelic.core.memcache_node import MemcacheNode
 
 
@@ -46,7 +47,7 @@ class MemcacheTrace(TimeTrace):
             duration=self.duration,
             exclusive=self.exclusive,
             guid=self.guid,
-            agent_attributes=self.agent_attributes,
+            agent_attributes=self.agent_attributes or EMPTY_ATTRIBUTES,
             user_attributes=self.user_attributes,
         )
 
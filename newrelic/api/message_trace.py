@@ -18,6 +18,7 @@ from newrelic.api.cat_header_mixin import CatHeaderMixin
 from newrelic.api.time_trace import TimeTrace, current_trace
 from newrelic.common.async_wrapper import async_wrapper
 from newrelic.common.object_wrapper import FunctionWrapper, wrap_object
+from newrelic.core.attribute import EMPTY_ATTRIBUTES
 from newrelic.core.message_node import MessageNode
 
 
@@ -85,7 +86,7 @@ class MessageTrace(CatHeaderMixin, TimeTrace):
             destination_type=self.destination_type,
             params=self.params,
             guid=self.guid,
-            agent_attributes=self.agent_attributes,
+            agent_attributes=self.agent_attributes or EMPTY_ATTRIBUTES,
             user_attributes=self.user_attributes,
         )
 
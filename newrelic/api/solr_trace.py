@@ -15,6 +15,7 @@
 import newrelic.api.object_wrapper
 import newrelic.api.time_trace
 import newrelic.core.solr_node
+from newrelic.core.attribute import EMPTY_ATTRIBUTES
 
 
 class SolrTrace(newrelic.api.time_trace.TimeTrace):
@@ -49,7 +50,7 @@ class SolrTrace(newrelic.api.time_trace.TimeTrace):
             duration=self.duration,
             exclusive=self.exclusive,
             guid=self.guid,
-            agent_attributes=self.agent_attributes,
+            agent_attributes=self.agent_attributes or EMPTY_ATTRIBUTES,
             user_attributes=self.user_attributes,
         )
 
@@ -21,7 +21,12 @@ import warnings
 
 from newrelic.api.settings import STRIP_EXCEPTION_MESSAGE
 from newrelic.common.object_names import parse_exc_info
-from newrelic.core.attribute import MAX_NUM_USER_ATTRIBUTES, process_user_attribute
+from newrelic.core.aggregate_node import AggregateNode, aggregate_key
+from newrelic.core.attribute import (
+    EMPTY_ATTRIBUTES,
+    MAX_NUM_USER_ATTRIBUTES,
+    process_user_attribute,
+)
 from newrelic.core.config import is_expected_error, should_ignore_error
 from newrelic.core.trace_cache import trace_cache
 
@@ -29,11 +34,18 @@ _logger = logging.getLogger(__name__)
 
 
 class TimeTrace(object):
+    # The node of the preceding sibling which the node for this trace is
+    # to replace, where the node accounts for the calls of both traces.
+    # This is set when the node is created.
+
+    coalesced_node = None
+
     def __init__(self, parent=None):
         self.parent = parent
         self.root = None
         self.child_count = 0
         self.children = []
+        self.aggregate_children = None
         self.start_time = 0.0
         self.end_time = 0.0
         self.duration = 0.0
@@ -166,7 +178,8 @@ class TimeTrace(object):
 
         self.exited = True
 
-        self.exc_data = (exc, value, tb)
+        if exc is not None:
+            self.exc_data = (exc, value, tb)
 
         # in all cases except async, the children will have exited
         # so this will create the node
@@ -439,6 +452,16 @@ class TimeTrace(object):
         self.finalize_data(transaction, *exc_data)
         exc_data = None
 
+        # No children can be added once the trace has completed, so where
+        # there are none, or no user attributes, the node shares the same
+        # empty values as all other nodes rather than holding its own.
+
+        if not self.children:
+            self.children = ()
+
+        if not self.user_attributes:
+            self.user_attributes = EMPTY_ATTRIBUTES
+
         # Give chance for derived class to create a standin node
         # object to be used in the transaction trace. If we get
         # one then give chance for transaction object to do
@@ -446,9 +469,17 @@ class TimeTrace(object):
 
         node = self.create_node()
 
-        if node:
+        if node and self.coalesced_node is not None:
+            transaction._process_coalesced_node(node, self.exclusive)
+            parent.coalesce_child(node, self.coalesced_node, self.duration)
+
+        elif node:
             transaction._process_node(node)
-            parent.process_child(node, self.is_async)
+
+            if transaction._collapse_node(node):
+                parent.aggregate_child(node, self.is_async)
+            else:
+                parent.process_child(node, self.is_async)
 
         # ----------------------------------------------------------------------
         # SYNC  | The parent will not have exited yet, so no node will be
@@ -498,6 +529,42 @@ class TimeTrace(object):
 
     def process_child(self, node, is_async):
         self.children.append(node)
+        self._update_child_time(node, is_async)
+
+    def coalesce_child(self, node, previous, duration):
+        # The node replaces that of the previous child, as it also accounts
+        # for a further synchronous call of the same operation which took
+        # duration seconds. The child count is adjusted so the call is not
+        # seen as still being outstanding.
+
+        self.children[-1] = node
+        self.child_count -= 1
+        self.exclusive -= duration
+
+    def aggregate_child(self, node, is_async):
+        # Child nodes recorded once the node budget for the transaction
+        # has been used up are folded into a single aggregate node for
+        # each distinct metric name. The child count is adjusted so the
+        # node is not seen as still being outstanding.
+
+        aggregates = self.aggregate_children
+
+        if aggregates is None:
+            aggregates = self.aggregate_children = {}
+
+        key = aggregate_key(node)
+        aggregate = aggregates.get(key)
+
+        if aggregate is None:
+            aggregates[key] = aggregate = AggregateNode(node)
+            self.children.append(aggregate)
+        else:
+            aggregate.merge(node)
+            self.child_count -= 1
+
+        self._update_child_time(node, is_async)
+
+    def _update_child_time(self, node, is_async):
         if is_async:
 
             # record the lowest start time
@@ -199,6 +199,7 @@ class Transaction(object):
         self.stopped = False
 
         self._trace_node_count = 0
+        self._collapsed_node_count = 0
 
         self._errors = []
         self._slow_sql = []
@@ -523,6 +524,11 @@ class Transaction(object):
         for key, value in six.iteritems(self._transaction_metrics):
             self.record_custom_metric(key, {"count": value})
 
+        if self._collapsed_node_count:
+            self.record_custom_metric(
+                "Supportability/Python/Transaction/Nodes/Collapsed", {"count": self._collapsed_node_count}
+            )
+
         if self._frameworks:
             for framework, version in self._frameworks:
                 self.record_custom_metric("Python/Framework/%s/%s" % (framework, version), 1)
@@ -1554,10 +1560,15 @@ class Transaction(object):
 
     def _process_node(self, node):
         self._trace_node_count += 1
-        node.node_count = self._trace_node_count
         self.total_time += node.exclusive
 
+        # The position of the node is only needed for database nodes, to
+        # know whether they are included in the transaction trace. Other
+        # nodes don't hold any state beyond their fields.
+
         if type(node) is newrelic.core.database_node.DatabaseNode:
+            node.node_count = self._trace_node_count
+
             settings = self._settings
             if not settings.collect_traces:
                 return
@@ -1569,6 +1580,30 @@ class Transaction(object):
                 return
             self._slow_sql.append(node)
 
+    def _process_coalesced_node(self, node, exclusive):
+        # The node replaces one which has already been processed, so isn't
+        # counted again, with only the time of the further call it accounts
+        # for being added. It keeps the position of the node it replaces.
+
+        self.total_time += exclusive
+
+    def _collapse_node(self, node):
+        # Once the node budget for the transaction has been used up, any
+        # further leaf nodes are folded into aggregate nodes rather than
+        # being retained individually.
+
+        maximum = self._settings.agent_limits.transaction_nodes_maximum
+
+        if maximum is None or self._trace_node_count - self._collapsed_node_count <= maximum:
+            return False
+
+        if node.children:
+            return False
+
+        self._collapsed_node_count += 1
+
+        return True
+
     def stop_recording(self):
         if not self.enabled:
             return
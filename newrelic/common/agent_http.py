@@ -16,6 +16,7 @@ from __future__ import print_function
 
 import os
 import sys
+import threading
 import time
 import zlib
 from pprint import pprint
@@ -72,8 +73,51 @@ def _urllib3_ssl_recursion_workaround(wrapped, instance, args, kwargs):
         return wrapped(*args, **kwargs)
 
 
+class _MeteredConnectionMixin(object):
+    def connect(self):
+        start = time.time()
+        super(_MeteredConnectionMixin, self).connect()
+        internal_metric("Supportability/Python/Collector/Connection/Handshake", time.time() - start)
+
+
+class MeteredHTTPConnection(_MeteredConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class MeteredHTTPSConnection(_MeteredConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class _KeepAlivePoolMixin(object):
+    def _make_request(self, conn, *args, **kwargs):
+        # A connection without a socket is yet to be established, or was
+        # dropped and is to be established again.
+
+        if getattr(conn, "sock", None) is None:
+            internal_count_metric("Supportability/Python/Collector/Connection/New", 1)
+        else:
+            internal_count_metric("Supportability/Python/Collector/Connection/Reused", 1)
+
+        return super(_KeepAlivePoolMixin, self)._make_request(conn, *args, **kwargs)
+
+
+class KeepAliveHTTPConnectionPool(_KeepAlivePoolMixin, urllib3.HTTPConnectionPool):
+    ConnectionCls = MeteredHTTPConnection
+
+
+class KeepAliveHTTPSConnectionPool(_KeepAlivePoolMixin, urllib3.HTTPSConnectionPool):
+    ConnectionCls = MeteredHTTPSConnection
+
+
+_KEEP_ALIVE_POOLS = {
+    urllib3.HTTPConnectionPool: KeepAliveHTTPConnectionPool,
+    urllib3.HTTPSConnectionPool: KeepAliveHTTPSConnectionPool,
+}
+
+
 class BaseClient(object):
     AUDIT_LOG_ID = 0
+    STREAM_PAYLOADS = False
 
     def __init__(
         self,
@@ -92,6 +136,9 @@ class BaseClient(object):
         compression_method="gzip",
         max_payload_size_in_bytes=1000000,
         audit_log_fp=None,
+        max_connections=1,
+        keep_alive=False,
+        idle_timeout=None,
     ):
         self._audit_log_fp = audit_log_fp
 
@@ -104,18 +151,33 @@ class BaseClient(object):
     def close_connection(self):
         pass
 
+    def release_connection(self):
+        self.close_connection()
+
     def finalize(self):
         pass
 
     @staticmethod
-    def _supportability_request(params, payload, body, compression_time):
+    def _supportability_request(params, payload_size, body, compression_time):
         pass
 
     @classmethod
     def log_request(
-        cls, fp, method, url, params, payload, headers, body=None, compression_time=None
+        cls,
+        fp,
+        method,
+        url,
+        params,
+        payload,
+        headers,
+        body=None,
+        compression_time=None,
+        payload_size=None,
     ):
-        cls._supportability_request(params, payload, body, compression_time)
+        if payload_size is None:
+            payload_size = len(payload) if payload is not None else 0
+
+        cls._supportability_request(params, payload_size, body, compression_time)
 
         if not fp:
             return
@@ -219,6 +281,7 @@ class BaseClient(object):
 class HttpClient(BaseClient):
     CONNECTION_CLS = urllib3.HTTPSConnectionPool
     PREFIX_SCHEME = "https://"
+    STREAM_PAYLOADS = True
     BASE_HEADERS = urllib3.make_headers(
         keep_alive=True, accept_encoding=True, user_agent=USER_AGENT
     )
@@ -240,6 +303,9 @@ class HttpClient(BaseClient):
         compression_method="gzip",
         max_payload_size_in_bytes=1000000,
         audit_log_fp=None,
+        max_connections=1,
+        keep_alive=False,
+        idle_timeout=None,
     ):
         self._host = host
         port = self._port = port
@@ -254,6 +320,7 @@ class HttpClient(BaseClient):
         self._headers = dict(self.BASE_HEADERS)
         self._connection_kwargs = connection_kwargs = {
             "timeout": timeout,
+            "maxsize": max_connections,
         }
         self._urlopen_kwargs = urlopen_kwargs = {}
 
@@ -300,7 +367,12 @@ class HttpClient(BaseClient):
         # Logging
         self._proxy = proxy
 
+        self._keep_alive = keep_alive
+        self._idle_timeout = idle_timeout
+        self._last_used = 0.0
+
         self._connection_attr = None
+        self._connection_lock = threading.Lock()
 
     @staticmethod
     def _parse_proxy(scheme, host, port, username, password):
@@ -343,23 +415,56 @@ class HttpClient(BaseClient):
         if self._connection_attr:
             return self._connection_attr
 
-        retries = urllib3.Retry(
-            total=False, connect=None, read=None, redirect=0, status=None
-        )
-        self._connection_attr = self.CONNECTION_CLS(
-            self._host,
-            self._port,
-            strict=True,
-            retries=retries,
-            **self._connection_kwargs
-        )
-        return self._connection_attr
+        # Payloads may be sent concurrently during a harvest, so guard
+        # against more than one connection pool being created.
+
+        with self._connection_lock:
+            if self._connection_attr:
+                return self._connection_attr
+
+            retries = urllib3.Retry(
+                total=False, connect=None, read=None, redirect=0, status=None
+            )
+            connection_cls = self.CONNECTION_CLS
+            if self._keep_alive:
+                connection_cls = _KEEP_ALIVE_POOLS.get(connection_cls, connection_cls)
+            self._connection_attr = connection_cls(
+                self._host,
+                self._port,
+                strict=True,
+                retries=retries,
+                **self._connection_kwargs
+            )
+            return self._connection_attr
 
     def close_connection(self):
         if self._connection_attr:
             self._connection_attr.close()
             self._connection_attr = None
 
+    def release_connection(self):
+        # When keep alive is enabled, connections are held on to between
+        # harvests rather than being closed once the harvest is done.
+
+        if not self._keep_alive:
+            self.close_connection()
+
+    def _expire_idle_connection(self):
+        # The data collector, or any proxy in between, may drop a
+        # connection which has been idle for a while, so connections
+        # which have not been used within the idle timeout are closed
+        # rather than risking a request failing on a stale connection.
+
+        now = time.time()
+
+        with self._connection_lock:
+            if self._connection_attr and self._idle_timeout is not None:
+                if now - self._last_used > self._idle_timeout:
+                    self._connection_attr.close()
+                    self._connection_attr = None
+
+            self._last_used = now
+
     def log_request(
         self,
         fp,
@@ -370,12 +475,13 @@ class HttpClient(BaseClient):
         headers,
         body=None,
         compression_time=None,
+        payload_size=None,
     ):
         if not self._prefix:
             url = self.CONNECTION_CLS.scheme + "://" + self._host + url
 
         return super(HttpClient, self).log_request(
-            fp, method, url, params, payload, headers, body, compression_time
+            fp, method, url, params, payload, headers, body, compression_time, payload_size
         )
 
     @staticmethod
@@ -392,6 +498,52 @@ class HttpClient(BaseClient):
 
         return data, compression_time
 
+    @staticmethod
+    def _compress_chunks(chunks, threshold, method="gzip", level=None):
+        """Compresses a payload supplied as an iterable of byte strings
+        without joining it together first. Compression is only started
+        once the payload is found to exceed the threshold, with a smaller
+        payload being returned as is. Returns the body, the size of the
+        uncompressed payload and the time spent compressing, which is
+        None if the body was not compressed.
+
+        """
+
+        buffered = []
+        size = 0
+        compressor = None
+        compressed = []
+        compression_time = 0.0
+
+        for chunk in chunks:
+            size += len(chunk)
+
+            if compressor is None:
+                buffered.append(chunk)
+
+                if size <= threshold:
+                    continue
+
+                level = level or zlib.Z_DEFAULT_COMPRESSION
+                wbits = 31 if method == "gzip" else 15
+
+                compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+                chunk = b"".join(buffered)
+                buffered = None
+
+            compression_start = time.time()
+            compressed.append(compressor.compress(chunk))
+            compression_time += max(time.time(), compression_start) - compression_start
+
+        if compressor is None:
+            return b"".join(buffered), size, None
+
+        compression_start = time.time()
+        compressed.append(compressor.flush())
+        compression_time += max(time.time(), compression_start) - compression_start
+
+        return b"".join(compressed), size, compression_time
+
     def send_request(
         self,
         method="POST",
@@ -412,7 +564,26 @@ class HttpClient(BaseClient):
         path = self._prefix + path
         body = payload
         compression_time = None
-        if payload is not None:
+        payload_size = None
+        if payload is not None and not isinstance(payload, bytes):
+            # The payload is being streamed as a sequence of chunks, so
+            # is compressed as it is consumed. It is not retained for the
+            # audit log.
+
+            body, payload_size, compression_time = self._compress_chunks(
+                payload,
+                self._compression_threshold,
+                method=self._compression_method,
+                level=self._compression_level,
+            )
+            payload = None
+
+            if compression_time is not None:
+                merged_headers["Content-Encoding"] = self._compression_method
+            else:
+                merged_headers["Content-Encoding"] = "Identity"
+
+        elif payload is not None:
             if len(payload) > self._compression_threshold:
                 body, compression_time = self._compress(
                     payload,
@@ -434,11 +605,15 @@ class HttpClient(BaseClient):
             merged_headers,
             body,
             compression_time,
+            payload_size,
         )
 
         if body and len(body) > self._max_payload_size_in_bytes:
             return 413, b""
 
+        if self._keep_alive:
+            self._expire_idle_connection()
+
         try:
             response = self._connection.request_encode_url(
                 method,
@@ -489,6 +664,9 @@ class InsecureHttpClient(HttpClient):
         compression_method="gzip",
         max_payload_size_in_bytes=1000000,
         audit_log_fp=None,
+        max_connections=1,
+        keep_alive=False,
+        idle_timeout=None,
     ):
         proxy = self._parse_proxy(proxy_scheme, proxy_host, None, None, None)
         if proxy and proxy.scheme == "https":
@@ -515,12 +693,15 @@ class InsecureHttpClient(HttpClient):
             compression_method,
             max_payload_size_in_bytes,
             audit_log_fp,
+            max_connections,
+            keep_alive,
+            idle_timeout,
         )
 
 
 class SupportabilityMixin(object):
     @staticmethod
-    def _supportability_request(params, payload, body, compression_time):
+    def _supportability_request(params, payload_size, body, compression_time):
         # *********
         # Used only for supportability metrics. Do not use to drive business
         # logic!
@@ -532,7 +713,7 @@ class SupportabilityMixin(object):
             if compression_time is not None:
                 internal_metric(
                     "Supportability/Python/Collector/ZLIB/Bytes/%s" % agent_method,
-                    len(payload),
+                    payload_size,
                 )
                 internal_metric(
                     "Supportability/Python/Collector/ZLIB/Compress/%s" % agent_method,
@@ -105,6 +105,63 @@ def json_encode(obj, **kwargs):
     return json.dumps(obj, **_kwargs)
 
 
+def _json_expand(o):
+    # Containers which json_encode() would encode as a JSON array.
+
+    if isinstance(o, (list, tuple, types.GeneratorType)):
+        return True
+
+    return hasattr(o, '__iter__') and not isinstance(o, (dict, six.string_types, bytes))
+
+
+def json_encode_iter(obj, depth=2, **kwargs):
+    """Generates the same JSON encoding as json_encode() as a sequence of
+    string fragments. Arrays up to the given depth are expanded element
+    by element, with each element encoded in one go, so the encoding of
+    a large array of events never exists in memory all at once.
+
+    """
+
+    if depth <= 0 or not _json_expand(obj):
+        yield json_encode(obj, **kwargs)
+        return
+
+    yield '['
+
+    separator = ''
+
+    for item in obj:
+        yield separator
+        separator = ','
+
+        for fragment in json_encode_iter(item, depth - 1, **kwargs):
+            yield fragment
+
+    yield ']'
+
+
+def json_encode_chunks(obj, chunk_size=64 * 1024, **kwargs):
+    """Generates the JSON encoding of the object as UTF-8 encoded byte
+    strings of at least chunk_size bytes, except for the last.
+
+    """
+
+    chunk = []
+    size = 0
+
+    for fragment in json_encode_iter(obj, **kwargs):
+        chunk.append(fragment)
+        size += len(fragment)
+
+        if size >= chunk_size:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
 def json_decode(s, **kwargs):
     # Nothing special to do here at this point but use a wrapper to be
     # consistent with encoding and allow for changes later.
@@ -14,8 +14,11 @@
 
 import collections
 import logging
+import struct
 import threading
 
+from newrelic.packages import six
+
 try:
     from newrelic.core.infinite_tracing_pb2 import AttributeValue
 except:
@@ -25,8 +28,9 @@ _logger = logging.getLogger(__name__)
 
 
 class StreamBuffer(object):
-    def __init__(self, maxlen):
+    def __init__(self, maxlen, batching=False):
         self._queue = collections.deque(maxlen=maxlen)
+        self.batching = batching
         self._notify = self.condition()
         self._shutdown = False
         self._seen = 0
@@ -76,6 +80,7 @@ class StreamBufferIterator(object):
         self._notify = self.stream_buffer._notify
         self._shutdown = False
         self._stream = None
+        self._batch = SpanBatch() if stream_buffer.batching else None
 
     def shutdown(self):
         with self._notify:
@@ -100,10 +105,21 @@ class StreamBufferIterator(object):
                         self.shutdown()
                     raise StopIteration
 
-                try:
-                    return self.stream_buffer._queue.popleft()
-                except IndexError:
-                    pass
+                queue = self.stream_buffer._queue
+
+                if self._batch is not None:
+                    batch = self._batch
+                    while queue and len(batch) < batch.max_spans:
+                        batch.add(queue.popleft())
+
+                    if len(batch):
+                        return batch.serialize()
+
+                else:
+                    try:
+                        return queue.popleft()
+                    except IndexError:
+                        pass
 
                 if not self.stream_closed() and not self.stream_buffer._queue:
                     self._notify.wait()
@@ -149,3 +165,175 @@ class SpanProtoAttrs(dict):
             return AttributeValue(int_value=value)
         else:
             return AttributeValue(string_value=str(value))
+
+
+# Spans are encoded directly in the protocol buffers wire format of the
+# com.newrelic.trace.v1.Span message, rather than by building Span and
+# AttributeValue messages for each attribute and serializing those.
+
+_DOUBLE = struct.Struct("<d")
+
+_SMALL_VARINTS = [six.int2byte(i) for i in range(0x80)]
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+# Tags of the fields of the Span message, and of the key and value fields
+# of the map entries and AttributeValue message, for wire types 0 (varint),
+# 1 (64 bit) and 2 (length delimited).
+
+_SPAN_TRACE_ID = b"\x0a"
+_SPAN_INTRINSICS = b"\x12"
+_SPAN_USER_ATTRIBUTES = b"\x1a"
+_SPAN_AGENT_ATTRIBUTES = b"\x22"
+
+_ENTRY_VALUE = b"\x12"
+
+_STRING_VALUE = b"\x0a"
+_BOOL_TRUE = b"\x10\x01"
+_BOOL_FALSE = b"\x10\x00"
+_INT_VALUE = b"\x18"
+_DOUBLE_VALUE = b"\x21"
+
+_SPAN_BATCH_SPANS = b"\x0a"
+
+_encoded_keys = {}
+_ENCODED_KEYS_LIMIT = 1000
+
+
+def _encode_varint(value):
+    if value < 0x80:
+        return _SMALL_VARINTS[value]
+
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+
+    return bytes(data)
+
+
+def _encode_string(value):
+    if not isinstance(value, six.text_type):
+        value = str(value)
+        if isinstance(value, bytes):
+            return value
+    return value.encode("utf-8", "replace")
+
+
+def _encode_key(key):
+    # Attribute names are drawn from a small set, so the encoded key field
+    # of the map entry is cached.
+
+    try:
+        return _encoded_keys[key]
+    except KeyError:
+        pass
+
+    data = _encode_string(key)
+    encoded = _STRING_VALUE + _encode_varint(len(data)) + data
+
+    if len(_encoded_keys) < _ENCODED_KEYS_LIMIT:
+        _encoded_keys[key] = encoded
+
+    return encoded
+
+
+def _encode_attribute_value(value):
+    # The type of the value is chosen as in
+    # SpanProtoAttrs.get_attribute_value(). The fields of AttributeValue
+    # are members of a oneof, so are encoded even when set to the default.
+
+    if isinstance(value, bool):
+        return value and _BOOL_TRUE or _BOOL_FALSE
+    elif isinstance(value, float):
+        return _DOUBLE_VALUE + _DOUBLE.pack(value)
+    elif isinstance(value, six.integer_types) and _INT64_MIN <= value <= _INT64_MAX:
+        if value < 0:
+            value += 1 << 64
+        return _INT_VALUE + _encode_varint(value)
+
+    data = _encode_string(value)
+    return _STRING_VALUE + _encode_varint(len(data)) + data
+
+
+def _encode_attributes(data, tag, attributes):
+    for key, value in attributes.items():
+        key = _encode_key(key)
+        value = _encode_attribute_value(value)
+        value_length = _encode_varint(len(value))
+
+        data += tag
+        data += _encode_varint(len(key) + 1 + len(value_length) + len(value))
+        data += key
+        data += _ENTRY_VALUE
+        data += value_length
+        data += value
+
+
+def encode_span(trace_id, intrinsics, user_attributes, agent_attributes):
+    """Returns the serialized Span message for a span event, from the
+    dictionaries of intrinsics, user attributes and agent attributes
+    generated for the span event.
+
+    """
+
+    data = bytearray()
+
+    if trace_id:
+        trace_id = _encode_string(trace_id)
+        data += _SPAN_TRACE_ID
+        data += _encode_varint(len(trace_id))
+        data += trace_id
+
+    _encode_attributes(data, _SPAN_INTRINSICS, intrinsics)
+    _encode_attributes(data, _SPAN_USER_ATTRIBUTES, user_attributes)
+    _encode_attributes(data, _SPAN_AGENT_ATTRIBUTES, agent_attributes)
+
+    return bytes(data)
+
+
+def serialize_span(span):
+    """Returns the serialized Span message for a span which is either
+    already serialized or is a Span message.
+
+    """
+
+    if isinstance(span, bytes):
+        return span
+    return span.SerializeToString()
+
+
+class SpanBatch(object):
+    """Builds the serialized SpanBatch message for spans sent together with
+    the RecordSpanBatch method. The SpanBatch message has the spans as a
+    repeated Span field, so is built by appending each serialized span to a
+    buffer which is reused for each batch.
+
+    """
+
+    max_spans = 100
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, span):
+        span = serialize_span(span)
+
+        self._buffer += _SPAN_BATCH_SPANS
+        self._buffer += _encode_varint(len(span))
+        self._buffer += span
+        self._count += 1
+
+    def serialize(self):
+        data = bytes(self._buffer)
+
+        del self._buffer[:]
+        self._count = 0
+
+        return data
@@ -341,6 +341,7 @@ def _process_configuration(section):
     _process_setting(section, "attributes.enabled", "getboolean", None)
     _process_setting(section, "attributes.exclude", "get", _map_inc_excl_attributes)
     _process_setting(section, "attributes.include", "get", _map_inc_excl_attributes)
+    _process_setting(section, "attributes.cache_size", "getint", None)
     _process_setting(section, "transaction_name.naming_scheme", "get", None)
     _process_setting(section, "gc_runtime_metrics.enabled", "getboolean", None)
     _process_setting(section, "gc_runtime_metrics.top_object_count_limit", "getint", None)
@@ -462,6 +463,7 @@ def _process_configuration(section):
     _process_setting(section, "agent_limits.sql_explain_plans_per_harvest", "getint", None)
     _process_setting(section, "agent_limits.slow_sql_data", "getint", None)
     _process_setting(section, "agent_limits.merge_stats_maximum", "getint", None)
+    _process_setting(section, "agent_limits.transaction_nodes_maximum", "getint", None)
     _process_setting(section, "agent_limits.errors_per_transaction", "getint", None)
     _process_setting(section, "agent_limits.errors_per_harvest", "getint", None)
     _process_setting(section, "agent_limits.slow_transaction_dry_harvests", "getint", None)
@@ -512,12 +514,48 @@ def _process_configuration(section):
     )
     _process_setting(section, "datastore_tracer.instance_reporting.enabled", "getboolean", None)
     _process_setting(section, "datastore_tracer.database_name_reporting.enabled", "getboolean", None)
+    _process_setting(section, "datastore_tracer.coalesce_statements.enabled", "getboolean", None)
     _process_setting(section, "heroku.use_dyno_names", "getboolean", None)
     _process_setting(section, "heroku.dyno_name_prefixes_to_shorten", "get", _map_split_strings)
     _process_setting(section, "serverless_mode.enabled", "getboolean", None)
     _process_setting(section, "apdex_t", "getfloat", None)
     _process_setting(section, "event_loop_visibility.enabled", "getboolean", None)
     _process_setting(section, "event_loop_visibility.blocking_threshold", "getfloat", None)
+    _process_setting(section, "trace_cache.implementation", "get", None)
+    _process_setting(section, "transaction_recording.sharded_stats", "getboolean", None)
+    _process_setting(section, "transaction_recording.background", "getboolean", None)
+    _process_setting(section, "transaction_recording.queue_size", "getint", None)
+    _process_setting(section, "transaction_recording.overflow_policy", "get", None)
+    _process_setting(section, "stats_engine.compact_metric_table", "getboolean", None)
+    _process_setting(section, "stats_engine.double_buffered_harvest", "getboolean", None)
+    _process_setting(section, "harvest.concurrent_uploads", "getboolean", None)
+    _process_setting(section, "harvest.upload_timeout", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.analytic_event_data", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.custom_event_data", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.error_data", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.error_event_data", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.span_event_data", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.sql_trace_data", "getfloat", None)
+    _process_setting(section, "harvest.upload_timeouts.transaction_sample_data", "getfloat", None)
+    _process_setting(section, "harvest.max_connections", "getint", None)
+    _process_setting(section, "harvest.keep_alive", "getboolean", None)
+    _process_setting(section, "harvest.idle_timeout", "getfloat", None)
+    _process_setting(section, "harvest.spool.enabled", "getboolean", None)
+    _process_setting(section, "harvest.spool.directory", "get", None)
+    _process_setting(section, "harvest.spool.max_size", "getint", None)
+    _process_setting(section, "harvest.spool.segment_size", "getint", None)
+    _process_setting(section, "local_aggregator.socket_path", "get", None)
+    _process_setting(section, "harvest.stream_payloads", "getboolean", None)
+    _process_setting(section, "harvest.scheduler", "get", None)
+    _process_setting(section, "rules_engine.cache_size", "getint", None)
+    _process_setting(section, "rules_engine.fuse_rules", "getboolean", None)
+    _process_setting(section, "sql_statement_cache.size", "getint", None)
+    _process_setting(section, "sql_statement_cache.memory_limit", "getint", None)
+    _process_setting(section, "sql_statement_cache.shape_size", "getint", None)
+    _process_setting(section, "sql_parser.single_pass", "getboolean", None)
+    _process_setting(section, "explain_plans.background", "getboolean", None)
+    _process_setting(section, "explain_plans.cache_ttl", "getfloat", None)
+    _process_setting(section, "explain_plans.harvest_time_budget", "getfloat", None)
     _process_setting(
         section,
         "event_harvest_config.harvest_limits.analytic_event_data",
@@ -530,6 +568,7 @@ def _process_configuration(section):
     _process_setting(section, "infinite_tracing.trace_observer_host", "get", None)
     _process_setting(section, "infinite_tracing.trace_observer_port", "getint", None)
     _process_setting(section, "infinite_tracing.span_queue_size", "getint", None)
+    _process_setting(section, "infinite_tracing.batching", "getboolean", None)
 
 
 # Loading of configuration from specified file and for specified
@@ -1976,6 +2015,8 @@ GREENLET_HOOK = ("greenlet", "newrelic.core.trace_cache", "greenlet_loaded")
 
 
 def _process_trace_cache_import_hooks():
+    trace_cache.select_trace_cache(_settings.trace_cache.implementation)
+
     _process_module_definition(*GREENLET_HOOK)
 
     if GREENLET_HOOK not in _module_import_hook_results:
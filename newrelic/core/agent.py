@@ -218,6 +218,8 @@ class Agent(object):
         self._default_harvest_duration = 0.0
         self._flexible_harvest_duration = 0.0
         self._scheduler = sched.scheduler(self._harvest_timer, self._harvest_shutdown.wait)
+        self._harvest_scheduler = None
+        self._harvest_lock = threading.Lock()
 
         self._process_shutdown = False
 
@@ -545,6 +547,10 @@ class Agent(object):
 
         application.record_transaction(data)
 
+        harvest_scheduler = self._harvest_scheduler
+        if harvest_scheduler is not None and harvest_scheduler.process_id != os.getpid():
+            harvest_scheduler.attach()
+
         if self._config.serverless_mode.enabled:
             application.harvest(flexible=True)
             application.harvest(flexible=False)
@@ -577,16 +583,20 @@ class Agent(object):
         else:
             _logger.debug("Commencing final harvest[flexible] of application data.")
 
-        self._flexible_harvest_count += 1
-        self._last_flexible_harvest = time.time()
+        self._perform_flexible_harvest()
+
+    def _perform_flexible_harvest(self):
+        with self._harvest_lock:
+            self._flexible_harvest_count += 1
+            self._last_flexible_harvest = time.time()
 
-        for application in list(six.itervalues(self._applications)):
-            try:
-                application.harvest(shutdown=False, flexible=True)
-            except Exception:
-                _logger.exception("Failed to harvest data for %s." % application.name)
+            for application in list(six.itervalues(self._applications)):
+                try:
+                    application.harvest(shutdown=False, flexible=True)
+                except Exception:
+                    _logger.exception("Failed to harvest data for %s." % application.name)
 
-        self._flexible_harvest_duration = time.time() - self._last_flexible_harvest
+            self._flexible_harvest_duration = time.time() - self._last_flexible_harvest
 
         _logger.debug(
             "Completed harvest[flexible] of application data in %.2f seconds.", self._flexible_harvest_duration
@@ -601,16 +611,20 @@ class Agent(object):
         else:
             _logger.debug("Commencing final harvest[default] of application data.")
 
-        self._default_harvest_count += 1
-        self._last_default_harvest = time.time()
+        self._perform_default_harvest(shutdown)
+
+    def _perform_default_harvest(self, shutdown=False):
+        with self._harvest_lock:
+            self._default_harvest_count += 1
+            self._last_default_harvest = time.time()
 
-        for application in list(six.itervalues(self._applications)):
-            try:
-                application.harvest(shutdown, flexible=False)
-            except Exception:
-                _logger.exception("Failed to harvest data for %s." % application.name)
+            for application in list(six.itervalues(self._applications)):
+                try:
+                    application.harvest(shutdown, flexible=False)
+                except Exception:
+                    _logger.exception("Failed to harvest data for %s." % application.name)
 
-        self._default_harvest_duration = time.time() - self._last_default_harvest
+            self._default_harvest_duration = time.time() - self._last_default_harvest
 
         _logger.debug("Completed harvest[default] of application data in %.2f seconds.", self._default_harvest_duration)
 
@@ -671,7 +685,7 @@ class Agent(object):
 
             # Skip this if background thread already running.
 
-            if self._harvest_thread.is_alive():
+            if self._harvest_thread.is_alive() or self._harvest_scheduler is not None:
                 return
 
             _logger.debug("Activating agent instance.")
@@ -679,9 +693,37 @@ class Agent(object):
             for callable in self._startup_callables:
                 callable()
 
-            _logger.debug("Start Python Agent main thread.")
+            scheduler = self._config.harvest.scheduler
 
-            self._harvest_thread.start()
+            if scheduler == "asyncio" and six.PY2:
+                _logger.warning(
+                    "The asyncio harvest scheduler requires Python 3. "
+                    "Falling back to running harvests on a background thread."
+                )
+                scheduler = "thread"
+
+            if scheduler == "asyncio":
+                from newrelic.core.harvest_scheduler import AsyncioHarvestScheduler
+
+                # The harvest task is started on the event loop of the
+                # application once a transaction is recorded from it, if
+                # not being activated from the event loop already.
+
+                _logger.debug("Start Python Agent harvest task.")
+
+                self._harvest_scheduler = AsyncioHarvestScheduler(self)
+                self._harvest_scheduler.attach()
+
+            else:
+                if scheduler != "thread":
+                    _logger.warning(
+                        "Unknown harvest scheduler %r. Falling back to running harvests on a background thread.",
+                        scheduler,
+                    )
+
+                _logger.debug("Start Python Agent main thread.")
+
+                self._harvest_thread.start()
 
             self._process_id = os.getpid()
 
@@ -703,6 +745,20 @@ class Agent(object):
 
         _logger.info("New Relic Python Agent Shutdown")
 
+        if self._harvest_scheduler is not None:
+            self._harvest_shutdown.set()
+            self._harvest_scheduler.shutdown()
+
+            # The event loop may no longer be running, so the final
+            # harvests are run from a thread which can be timed out.
+
+            thread = threading.Thread(target=self._final_harvest, name="NR-Harvest-Thread")
+            thread.daemon = True
+            thread.start()
+            thread.join(timeout)
+
+            return
+
         # Schedule final harvests. This is OK to schedule across threads since
         # the entries will only be added to the end of the list and won't be
         # popped until harvest_shutdown is set.
@@ -719,6 +775,14 @@ class Agent(object):
             self._harvest_thread.join(timeout)
 
 
+    def _final_harvest(self):
+        _logger.debug("Commencing final harvest[flexible] of application data.")
+        self._perform_flexible_harvest()
+
+        _logger.debug("Commencing final harvest[default] of application data.")
+        self._perform_default_harvest(shutdown=True)
+
+
 def agent_instance():
     """Returns the agent object. This function should always be used and
     instances of the agent object should never be created directly to
@@ -22,6 +22,7 @@ from newrelic.core.internal_metrics import internal_count_metric
 from newrelic.common.encoding_utils import (
     json_decode,
     json_encode,
+    json_encode_chunks,
     serverless_payload_encode,
 )
 from newrelic.common.utilization import (
@@ -175,6 +176,16 @@ class AgentProtocol(object):
             compression_method=settings.compressed_content_encoding,
             max_payload_size_in_bytes=settings.max_payload_size_in_bytes,
             audit_log_fp=audit_log_fp,
+            max_connections=settings.harvest.max_connections if settings.harvest.concurrent_uploads else 1,
+            keep_alive=settings.harvest.keep_alive,
+            idle_timeout=settings.harvest.idle_timeout,
+        )
+
+        # Payloads are only streamed to clients which support it, and
+        # never where the payload needs to be written to the audit log.
+
+        self._stream_payloads = bool(
+            settings.harvest.stream_payloads and self.client.STREAM_PAYLOADS and audit_log_fp is None
         )
 
         self._params = {
@@ -215,8 +226,14 @@ class AgentProtocol(object):
     def close_connection(self):
         self.client.close_connection()
 
+    def release_connection(self):
+        self.client.release_connection()
+
     def send(self, method, payload=()):
-        params, headers, payload = self._to_http(method, payload)
+        if self._stream_payloads:
+            params, headers, payload = self._to_http_chunks(method, payload)
+        else:
+            params, headers, payload = self._to_http(method, payload)
 
         try:
             response = self.client.send_request(
@@ -257,13 +274,21 @@ class AgentProtocol(object):
         if status == 200:
             return json_decode(data.decode("utf-8"))["return_value"]
 
-    def _to_http(self, method, payload=()):
+    def _request_params(self, method):
         params = dict(self._params)
         params["method"] = method
         if self._run_token:
             params["run_id"] = self._run_token
+        return params
+
+    def _to_http(self, method, payload=()):
+        params = self._request_params(method)
         return params, self._headers, json_encode(payload).encode("utf-8")
 
+    def _to_http_chunks(self, method, payload=()):
+        params = self._request_params(method)
+        return params, self._headers, json_encode_chunks(payload)
+
     @staticmethod
     def _connect_payload(app_name, linked_applications, environment, settings):
         settings = global_settings_dump(settings)
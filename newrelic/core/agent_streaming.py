@@ -18,10 +18,12 @@ import threading
 try:
     import grpc
 
-    from newrelic.core.infinite_tracing_pb2 import RecordStatus, Span
+    from newrelic.core.infinite_tracing_pb2 import RecordStatus
 except ImportError:
     grpc = None
 
+from newrelic.common.streaming_utils import serialize_span
+
 _logger = logging.getLogger(__name__)
 
 
@@ -31,9 +33,13 @@ class StreamingRpc(object):
     This class keeps a stream_stream RPC alive, retrying after a timeout when
     errors are encountered. If grpc.StatusCode.UNIMPLEMENTED is encountered, a
     retry will not occur.
+
+    When batching, spans are taken from the stream buffer as serialized
+    SpanBatch messages and sent with the RecordSpanBatch method.
     """
 
     PATH = "/com.newrelic.trace.v1.IngestService/RecordSpan"
+    BATCH_PATH = "/com.newrelic.trace.v1.IngestService/RecordSpanBatch"
     RETRY_POLICY = (
         (15, False),
         (15, False),
@@ -47,6 +53,7 @@ class StreamingRpc(object):
     def __init__(self, endpoint, stream_buffer, metadata, record_metric, ssl=True):
         self._endpoint = endpoint
         self._ssl = ssl
+        self.batching = stream_buffer.batching
         self.metadata = metadata
         self.stream_buffer = stream_buffer
         self.request_iterator = iter(stream_buffer)
@@ -67,7 +74,10 @@ class StreamingRpc(object):
         else:
             self.channel = grpc.insecure_channel(self._endpoint, options=self.OPTIONS)
 
-        self.rpc = self.channel.stream_stream(self.PATH, Span.SerializeToString, RecordStatus.FromString)
+        if self.batching:
+            self.rpc = self.channel.stream_stream(self.BATCH_PATH, serialize_span, RecordStatus.FromString)
+        else:
+            self.rpc = self.channel.stream_stream(self.PATH, serialize_span, RecordStatus.FromString)
 
     def create_response_iterator(self):
         with self.stream_buffer._notify:
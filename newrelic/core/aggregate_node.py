@@ -0,0 +1,138 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import newrelic.core.trace_node
+from newrelic.core.metric import AggregateTimeMetric
+
+
+def aggregate_key(node):
+    """Returns the key identifying the nodes which can be folded into the
+    same aggregate node, being those which would generate the same
+    metrics.
+
+    """
+
+    return (
+        type(node),
+        node.name,
+        getattr(node, "group", None),
+        getattr(node, "host", None),
+        getattr(node, "port_path_or_id", None),
+    )
+
+
+class AggregateNode(object):
+
+    """Stands in for the leaf nodes with the same metric name recorded
+    against a parent once the node budget for the transaction has been
+    used up. Metrics are generated from the first of the nodes, but with
+    the call count and timings accumulated across all of them. The first
+    node also stands in for the rest in transaction traces and span
+    events.
+
+    """
+
+    children = ()
+
+    def __init__(self, node):
+        self.node = node
+
+        self.start_time = node.start_time
+        self.end_time = node.end_time
+
+        self.call_count = 0
+        self.duration = 0.0
+        self.exclusive = 0.0
+        self.min_call_time = 0.0
+        self.max_call_time = 0.0
+        self.sum_of_squares = 0.0
+
+        self.merge(node)
+
+    @property
+    def guid(self):
+        return self.node.guid
+
+    @property
+    def name(self):
+        return self.node.name
+
+    def merge(self, node):
+        # The node may itself already stand in for a number of calls, as
+        # is the case for coalesced database statements.
+
+        call_count = getattr(node, "call_count", 1)
+        call_times = getattr(node, "call_times", None) or (node.duration, node.duration, node.duration**2)
+
+        min_call_time, max_call_time, sum_of_squares = call_times
+
+        if self.call_count:
+            self.min_call_time = min(self.min_call_time, min_call_time)
+        else:
+            self.min_call_time = min_call_time
+
+        self.max_call_time = max(self.max_call_time, max_call_time)
+        self.sum_of_squares += sum_of_squares
+
+        self.call_count += call_count
+        self.duration += node.duration
+        self.exclusive += node.exclusive
+
+        self.start_time = min(self.start_time, node.start_time)
+        self.end_time = max(self.end_time, node.end_time)
+
+    def time_metrics(self, stats, root, parent):
+        """Return a generator yielding the timed metrics for the nodes
+        this node stands in for.
+
+        """
+
+        for metric in self.node.time_metrics(stats, root, parent):
+            yield AggregateTimeMetric(
+                name=metric.name,
+                scope=metric.scope,
+                duration=self.duration,
+                exclusive=(self.exclusive if metric.exclusive is not None else None),
+                call_count=self.call_count,
+                min_call_time=self.min_call_time,
+                max_call_time=self.max_call_time,
+                sum_of_squares=self.sum_of_squares,
+            )
+
+    def trace_node(self, stats, root, connections):
+        trace_node = self.node.trace_node(stats, root, connections)
+
+        # The params of the first node aren't changed, as they may be
+        # shared with the node itself.
+
+        params = dict(trace_node.params)
+        params["call_count"] = self.call_count
+
+        return trace_node._replace(
+            start_time=newrelic.core.trace_node.node_start_time(root, self),
+            end_time=newrelic.core.trace_node.node_end_time(root, self),
+            params=params,
+        )
+
+    def span_events(self, settings, base_attrs=None, parent_guid=None, attr_class=dict):
+        i_attrs, u_attrs, a_attrs = self.node.span_event(
+            settings, base_attrs=base_attrs, parent_guid=parent_guid, attr_class=attr_class
+        )
+
+        i_attrs["duration"] = self.duration
+
+        yield [i_attrs, u_attrs, a_attrs]
+
+    def span_event_count(self):
+        return 1
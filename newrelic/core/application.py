@@ -25,24 +25,40 @@ import threading
 import time
 import traceback
 import warnings
+import zlib
 from functools import partial
 
+try:
+    import thread
+except ImportError:
+    import _thread as thread
+
 from newrelic.common.object_names import callable_name
 from newrelic.core.adaptive_sampler import AdaptiveSampler
 from newrelic.core.config import global_settings
 from newrelic.core.custom_event import create_custom_event
 from newrelic.core.data_collector import create_session
-from newrelic.core.database_utils import SQLConnections
+from newrelic.core.database_utils import SQLConnections, sql_statement_cache
 from newrelic.core.environment import environment_settings
+from newrelic.core.explain_plans import ExplainPlanWorker
+from newrelic.core.harvest_uploads import (
+    HarvestUpload,
+    HarvestUploadPool,
+    send_concurrently,
+    send_sequentially,
+)
 from newrelic.core.internal_metrics import (
     InternalTrace,
     InternalTraceContext,
     internal_count_metric,
     internal_metric,
 )
+from newrelic.core.local_aggregator import AggregatorClient
+from newrelic.core.payload_spool import PayloadSpool
 from newrelic.core.profile_sessions import profile_session_manager
 from newrelic.core.rules_engine import RulesEngine, SegmentCollapseEngine
 from newrelic.core.stats_engine import CustomMetrics, StatsEngine
+from newrelic.core.transaction_queue import TransactionQueue
 from newrelic.network.exceptions import (
     DiscardDataForRequest,
     ForceAgentDisconnect,
@@ -56,6 +72,38 @@ from newrelic.samplers.data_sampler import DataSampler
 _logger = logging.getLogger(__name__)
 
 
+class StatsShard(object):
+
+    """Holds a stats engine which transactions completed on a single
+    thread are recorded into directly. The lock is only ever contended
+    by the harvest thread when it swaps out the stats engine, so request
+    threads never block on each other when recording a transaction.
+
+    """
+
+    def __init__(self, stats_engine):
+        self.lock = threading.Lock()
+        self.stats_engine = stats_engine
+        self.transaction_count = 0
+        self.last_transaction = 0.0
+
+    def swap(self, stats_engine):
+        """Replaces the stats engine with a fresh one, returning the
+        prior stats engine along with the transaction count and time of
+        the last transaction recorded into it.
+
+        """
+
+        with self.lock:
+            result = (self.stats_engine, self.transaction_count, self.last_transaction)
+
+            self.stats_engine = stats_engine
+            self.transaction_count = 0
+            self.last_transaction = 0.0
+
+        return result
+
+
 class Application(object):
 
     """Class which maintains recorded data for a single application."""
@@ -103,6 +151,40 @@ class Application(object):
         self._stats_lock = threading.RLock()
         self._stats_engine = StatsEngine()
 
+        # Per thread stats engine shards used when sharded stats
+        # accumulation is enabled, keyed by thread ID. Shards are only
+        # ever added to or removed from the dictionary while holding
+        # the stats lock.
+
+        self._stats_shards = {}
+
+        # Queue of completed transactions recorded by a background
+        # worker thread when background transaction recording is
+        # enabled. Created on first use.
+
+        self._transaction_queue = None
+
+        # Worker thread gathering explain plans when explain plans are
+        # being gathered in the background. Created on first use.
+
+        self._explain_plan_worker = None
+
+        # Pool of worker threads from which harvest payloads are sent
+        # when they are being sent concurrently. Created on first use.
+
+        self._upload_pool = None
+
+        # Spool on disk for payloads which could not be sent when the
+        # data collector was unreachable. Carried over between agent
+        # sessions so spooled payloads can be replayed after a restart.
+
+        self._payload_spool = None
+
+        # Errors and traces forwarded from worker processes when acting
+        # as the local aggregator, to be sent with the next harvest.
+
+        self._forwarded_payloads = {}
+
         self._stats_custom_lock = threading.RLock()
         self._stats_custom_engine = StatsEngine()
 
@@ -419,9 +501,17 @@ class Application(object):
                             configuration.transaction_name_rules,
                         )
 
-                    self._rules_engine["url"] = RulesEngine(configuration.url_rules)
-                    self._rules_engine["metric"] = RulesEngine(configuration.metric_name_rules)
-                    self._rules_engine["transaction"] = RulesEngine(configuration.transaction_name_rules)
+                    rules_settings = configuration.rules_engine
+                    rules_options = {
+                        "cache_size": rules_settings.cache_size,
+                        "fuse_rules": rules_settings.fuse_rules,
+                    }
+
+                    self._rules_engine["url"] = RulesEngine(configuration.url_rules, **rules_options)
+                    self._rules_engine["metric"] = RulesEngine(configuration.metric_name_rules, **rules_options)
+                    self._rules_engine["transaction"] = RulesEngine(
+                        configuration.transaction_name_rules, **rules_options
+                    )
                     self._rules_engine["segment"] = SegmentCollapseEngine(configuration.transaction_segment_terms)
 
                 except Exception:
@@ -498,6 +588,7 @@ class Application(object):
 
         with self._stats_lock:
             self._stats_engine.reset_stats(configuration, reset_stream=True)
+            self._stats_shards = {}
 
             if configuration.serverless_mode.enabled:
                 sampling_target_period = 60.0
@@ -539,6 +630,27 @@ class Application(object):
 
         self._stats_engine.merge_custom_metrics(internal_metrics.metrics())
 
+        spool_settings = configuration.harvest.spool
+
+        if spool_settings.enabled and not configuration.serverless_mode.enabled:
+            if self._payload_spool is None:
+                self._payload_spool = PayloadSpool(
+                    spool_settings.directory,
+                    "%08x" % (zlib.crc32(self._app_name.encode("utf-8")) & 0xFFFFFFFF),
+                    max_size=spool_settings.max_size,
+                    segment_size=spool_settings.segment_size,
+                )
+
+            active_session.spool = self._payload_spool
+
+        # Harvest payloads are sent to the local aggregator for the host
+        # rather than to the data collector, when one is being used.
+
+        if configuration.local_aggregator.socket_path and not configuration.serverless_mode.enabled:
+            active_session.aggregator = AggregatorClient(
+                configuration.local_aggregator.socket_path, self._app_name, self._linked_applications
+            )
+
         # Update the active session in this object. This will the
         # recording of transactions to start.
 
@@ -611,6 +723,50 @@ class Application(object):
 
             self._process_id = 0
 
+    # The limits on the number of errors and traces forwarded from worker
+    # processes which are sent with each harvest.
+
+    _FORWARDED_LIMITS = {
+        "error_data": "errors_per_harvest",
+        "sql_trace_data": "slow_sql_data",
+        "transaction_sample_data": "synthetics_transactions",
+    }
+
+    def merge_forwarded_payload(self, method, payload):
+        """Merges a payload prepared for the data collector by a worker
+        process, and forwarded by the local aggregator, into the data for
+        the next harvest. Returns False if the payload could not be merged
+        as the application is not active, in which case the worker process
+        sends the payload itself.
+
+        """
+
+        if not self._active_session:
+            return False
+
+        configuration = self._active_session.configuration
+
+        with self._stats_lock:
+            if method in self._FORWARDED_LIMITS:
+                limit = getattr(configuration.agent_limits, self._FORWARDED_LIMITS[method])
+                forwarded = self._forwarded_payloads.setdefault(method, [])
+
+                # SQL traces are the only payload not to reference the
+                # agent run.
+
+                items = payload[0] if method == "sql_trace_data" else payload[1]
+
+                forwarded.extend(items[: max(limit - len(forwarded), 0)])
+
+            else:
+                self._stats_engine.merge_forwarded_payload(method, payload)
+
+        return True
+
+    def _take_forwarded_payload(self, method):
+        with self._stats_lock:
+            return self._forwarded_payloads.pop(method, [])
+
     def normalize_name(self, name, rule_type):
         """Applies the agent normalization rules of the the specified
         rule type to the supplied name.
@@ -839,6 +995,65 @@ class Application(object):
     def record_transaction(self, data):
         """Record a single transaction against this application."""
 
+        settings = self._transaction_settings(data)
+
+        if settings is None:
+            return
+
+        # When background recording is enabled the transaction is handed
+        # off to a worker thread so that conversion of the transaction
+        # into metrics and events is not done on the request thread. It
+        # is only recorded inline if the queue is full and the overflow
+        # policy says to do so.
+
+        if settings.transaction_recording.background and not settings.serverless_mode.enabled:
+            if self._transaction_recorder(settings).put(data):
+                return
+
+        self._record_transaction(data, settings)
+
+    def _record_queued_transaction(self, data):
+        """Records a transaction taken from the transaction queue by the
+        background worker thread. The checks against the current agent
+        run are repeated as it may have changed while the transaction
+        was queued.
+
+        """
+
+        settings = self._transaction_settings(data)
+
+        if settings is None:
+            return
+
+        self._record_transaction(data, settings)
+
+    def _transaction_recorder(self, settings):
+        """Returns the queue used for background transaction recording,
+        creating it if required.
+
+        """
+
+        transaction_queue = self._transaction_queue
+
+        if transaction_queue is None:
+            with self._stats_lock:
+                if self._transaction_queue is None:
+                    self._transaction_queue = TransactionQueue(
+                        self._app_name,
+                        self._record_queued_transaction,
+                        settings.transaction_recording.queue_size,
+                        settings.transaction_recording.overflow_policy,
+                    )
+                transaction_queue = self._transaction_queue
+
+        return transaction_queue
+
+    def _transaction_settings(self, data):
+        """Returns the settings a transaction should be recorded with, or
+        None if the transaction should be discarded.
+
+        """
+
         if not self._active_session:
             return
 
@@ -868,6 +1083,17 @@ class Application(object):
 
         self.validate_process()
 
+        return settings
+
+    def _record_transaction(self, data, settings):
+        """Generates the metrics and events for a single transaction and
+        merges them into the stats engine.
+
+        """
+
+        if settings.transaction_recording.sharded_stats:
+            return self._record_transaction_sharded(data, settings)
+
         internal_metrics = CustomMetrics()
 
         with InternalTraceContext(internal_metrics):
@@ -920,6 +1146,87 @@ class Application(object):
                     if settings.debug.record_transaction_failure:
                         raise
 
+    def _stats_shard(self, settings):
+        """Returns the stats engine shard for the current thread,
+        creating it if required. A shard created against settings from a
+        prior agent run is replaced.
+
+        """
+
+        thread_id = thread.get_ident()
+
+        shard = self._stats_shards.get(thread_id)
+
+        if shard is None or shard.stats_engine.settings is not settings:
+            with self._stats_lock:
+                shard = StatsShard(self._stats_engine.create_workarea())
+                self._stats_shards[thread_id] = shard
+
+        return shard
+
+    def _record_transaction_sharded(self, data, settings):
+        """Records a single transaction directly into the stats engine
+        shard owned by the current thread. The shards are only merged
+        into the main stats engine when a harvest is performed.
+
+        """
+
+        shard = self._stats_shard(settings)
+
+        internal_metrics = CustomMetrics()
+
+        with shard.lock:
+            with InternalTraceContext(internal_metrics):
+                with InternalTrace("Supportability/Python/RecordTransaction/Calls/record"):
+                    try:
+                        shard.stats_engine.record_transaction(data)
+
+                    except Exception:
+                        _logger.exception(
+                            "The generation of transaction data has "
+                            "failed. This would indicate some sort of internal "
+                            "implementation issue with the agent. Please report "
+                            "this problem to New Relic support for further "
+                            "investigation."
+                        )
+
+                        if settings.debug.record_transaction_failure:
+                            raise
+
+            shard.transaction_count += 1
+            shard.last_transaction = data.end_time
+
+            shard.stats_engine.merge_custom_metrics(internal_metrics.metrics())
+
+    def merge_stats_shards(self):
+        """Merges the data accumulated in all stats engine shards into
+        the main stats engine. Each shard has its stats engine swapped
+        for an empty one so recording on other threads can continue
+        while the merge is done. Shards for threads which have since
+        exited are discarded.
+
+        """
+
+        if not self._stats_shards:
+            return
+
+        active_threads = set(t.ident for t in threading.enumerate())
+
+        for thread_id, shard in list(self._stats_shards.items()):
+            stats, transaction_count, last_transaction = shard.swap(self._stats_engine.create_workarea())
+
+            with self._stats_lock:
+                self._transaction_count += transaction_count
+                self._last_transaction = max(self._last_transaction, last_transaction)
+
+                if stats.settings is self._stats_engine.settings:
+                    self._stats_engine.merge_shard(stats)
+
+                if thread_id not in active_threads:
+                    with shard.lock:
+                        if not shard.transaction_count:
+                            self._stats_shards.pop(thread_id, None)
+
     def cmd_start_profiler(self, command_id=0, **kwargs):
         """Triggered by the start_profiler agent command to start a
         thread profiling session.
@@ -1053,6 +1360,8 @@ class Application(object):
 
                 start = time.time()
 
+                configuration = self._active_session.configuration
+
                 # Create a snapshot of the transaction stats and
                 # application specific custom metrics stats, then merge
                 # them together. The originals will be reset at the time
@@ -1062,7 +1371,51 @@ class Application(object):
 
                 _logger.debug("Snapshotting for harvest[%s] of %r.", call_metric, self._app_name)
 
-                configuration = self._active_session.configuration
+                # Give the background recording worker a chance to drain
+                # any queued transactions if this is the final harvest,
+                # and report on how the queue has been coping.
+
+                transaction_queue = self._transaction_queue
+
+                if transaction_queue is not None:
+                    if shutdown:
+                        if not transaction_queue.flush(configuration.shutdown_timeout):
+                            _logger.debug(
+                                "Timed out waiting for queued transactions to be recorded for %r.", self._app_name
+                            )
+
+                    dropped, inline = transaction_queue.harvest_counts()
+
+                    internal_metric("Supportability/Python/RecordTransaction/Queue/Depth", transaction_queue.depth)
+                    internal_count_metric("Supportability/Python/RecordTransaction/Queue/Dropped", dropped)
+                    internal_count_metric("Supportability/Python/RecordTransaction/Queue/Inline", inline)
+
+                # Report how effective caching of the results of applying
+                # normalization rules has been.
+
+                for rule_type in ("url", "metric", "transaction"):
+                    rules_engine = self._rules_engine[rule_type]
+
+                    if rules_engine.cache_size:
+                        hits, misses = rules_engine.harvest_counts()
+
+                        internal_count_metric("Supportability/Python/RulesEngine/%s/Cache/Hits" % rule_type, hits)
+                        internal_count_metric("Supportability/Python/RulesEngine/%s/Cache/Misses" % rule_type, misses)
+
+                # Likewise for the cache of parsed SQL statements, which
+                # is shared by all applications in the process.
+
+                statement_cache = sql_statement_cache()
+
+                if statement_cache is not None:
+                    for name, count in sorted(statement_cache.harvest_counts().items()):
+                        internal_count_metric("Supportability/Python/DatabaseUtils/SQLStatementCache/%s" % name, count)
+
+                # Fold in any data recorded into per thread stats engine
+                # shards before the snapshot is taken.
+
+                self.merge_stats_shards()
+
                 transaction_count = self._transaction_count
 
                 with self._stats_lock:
@@ -1168,159 +1521,43 @@ class Application(object):
                         period_end = self._period_start + 1.001
 
                 try:
-                    # Send the transaction and custom metric data.
-
-                    # Send data set for analytics, which is Synthetic analytic
-                    # events, and the sampled data set of regular requests sent
-                    # as separate requests.
-
-                    synthetics_events = stats.synthetics_events
-                    if synthetics_events:
-                        if synthetics_events.num_samples:
-                            _logger.debug("Sending synthetics event data for harvest of %r.", self._app_name)
-
-                            self._active_session.send_transaction_events(
-                                synthetics_events.sampling_info, synthetics_events
-                            )
-
-                        stats.reset_synthetics_events()
-
-                    if configuration.collect_analytics_events and configuration.transaction_events.enabled:
-
-                        transaction_events = stats.transaction_events
-
-                        if transaction_events:
-                            # As per spec
-                            internal_metric(
-                                "Supportability/Python/RequestSampler/requests", transaction_events.num_seen
-                            )
-                            internal_metric(
-                                "Supportability/Python/RequestSampler/samples", transaction_events.num_samples
-                            )
-
-                            if transaction_events.num_samples:
-                                _logger.debug("Sending analytics event data for harvest of %r.", self._app_name)
-
-                                self._active_session.send_transaction_events(
-                                    transaction_events.sampling_info, transaction_events
-                                )
+                    # Send the transaction and custom metric data. The
+                    # payloads other than the metric data are independent
+                    # of each other so can optionally be sent concurrently.
 
-                            stats.reset_transaction_events()
+                    uploads = self._harvest_uploads(stats, configuration, flexible)
 
-                    # Send span events
+                    harvest_settings = configuration.harvest
 
                     if (
-                        configuration.span_events.enabled
-                        and configuration.collect_span_events
-                        and configuration.distributed_tracing.enabled
+                        harvest_settings.concurrent_uploads
+                        and not configuration.serverless_mode.enabled
+                        and not configuration.audit_log_file
                     ):
-                        if configuration.infinite_tracing.enabled:
-                            span_stream = stats.span_stream
-                            # Only merge stats as part of default harvest
-                            if span_stream and not flexible:
-                                spans_seen, spans_dropped = span_stream.stats()
-                                spans_sent = spans_seen - spans_dropped
-
-                                internal_count_metric("Supportability/InfiniteTracing/Span/Seen", spans_seen)
-                                internal_count_metric("Supportability/InfiniteTracing/Span/Sent", spans_sent)
-                        else:
-                            spans = stats.span_events
-                            if spans:
-                                if spans.num_samples > 0:
-                                    span_samples = list(spans)
-
-                                    _logger.debug("Sending span event data for harvest of %r.", self._app_name)
-
-                                    self._active_session.send_span_events(spans.sampling_info, span_samples)
-                                    span_samples = None
-
-                                # As per spec
-                                spans_seen = spans.num_seen
-                                spans_sampled = spans.num_samples
-                                internal_count_metric("Supportability/SpanEvent/TotalEventsSeen", spans_seen)
-                                internal_count_metric("Supportability/SpanEvent/TotalEventsSent", spans_sampled)
-
-                                stats.reset_span_events()
-
-                    # Send error events
-
-                    if (
-                        configuration.collect_error_events
-                        and configuration.error_collector.capture_events
-                        and configuration.error_collector.enabled
-                    ):
-
-                        error_events = stats.error_events
-                        if error_events:
-                            num_error_samples = error_events.num_samples
-                            if num_error_samples > 0:
-                                error_event_samples = list(error_events)
-
-                                _logger.debug("Sending error event data for harvest of %r.", self._app_name)
-
-                                samp_info = error_events.sampling_info
-                                self._active_session.send_error_events(samp_info, error_event_samples)
-                                error_event_samples = None
-
-                            # As per spec
-                            internal_count_metric("Supportability/Events/TransactionError/Seen", error_events.num_seen)
-                            internal_count_metric("Supportability/Events/TransactionError/Sent", num_error_samples)
-
-                            stats.reset_error_events()
-
-                    # Send custom events
-
-                    if configuration.collect_custom_events and configuration.custom_insights_events.enabled:
-
-                        customs = stats.custom_events
-
-                        if customs:
-                            if customs.num_samples > 0:
-                                custom_samples = list(customs)
-
-                                _logger.debug("Sending custom event data for harvest of %r.", self._app_name)
-
-                                self._active_session.send_custom_events(customs.sampling_info, custom_samples)
-                                custom_samples = None
-
-                            # As per spec
-                            internal_count_metric("Supportability/Events/Customer/Seen", customs.num_seen)
-                            internal_count_metric("Supportability/Events/Customer/Sent", customs.num_samples)
-
-                            stats.reset_custom_events()
-
-                    # Send the accumulated error data.
-
-                    if configuration.collect_errors:
-                        error_data = stats.error_data()
+                        if self._upload_pool is None or self._upload_pool.size != harvest_settings.max_connections:
+                            if self._upload_pool is not None:
+                                self._upload_pool.merge_abandoned(internal_metrics)
+                                self._upload_pool.shutdown()
+
+                            self._upload_pool = HarvestUploadPool(self._app_name, harvest_settings.max_connections)
+
+                        send_concurrently(
+                            uploads,
+                            internal_metrics,
+                            self._upload_pool,
+                            harvest_settings.upload_timeout or configuration.agent_limits.data_collector_timeout,
+                            dict((name, value) for name, value in harvest_settings.upload_timeouts if value),
+                        )
+                    else:
+                        send_sequentially(uploads)
 
-                        if error_data:
-                            _logger.debug("Sending error data for harvest of %r.", self._app_name)
+                    # Resend any payloads spooled while the data
+                    # collector was unreachable, if it has now been
+                    # reached again.
 
-                            self._active_session.send_errors(error_data)
+                    self._active_session.replay_spooled_payloads()
 
                     if not flexible:
-                        if configuration.collect_traces:
-                            connections = SQLConnections(configuration.agent_limits.max_sql_connections)
-
-                            with connections:
-                                if configuration.slow_sql.enabled:
-                                    _logger.debug("Processing slow SQL data for harvest of %r.", self._app_name)
-
-                                    slow_sql_data = stats.slow_sql_data(connections)
-
-                                    if slow_sql_data:
-                                        _logger.debug("Sending slow SQL data for harvest of %r.", self._app_name)
-
-                                        self._active_session.send_sql_traces(slow_sql_data)
-
-                                slow_transaction_data = stats.transaction_trace_data(connections)
-
-                                if slow_transaction_data:
-                                    _logger.debug("Sending slow transaction data for harvest of %r.", self._app_name)
-
-                                    self._active_session.send_transaction_traces(slow_transaction_data)
-
                         # Create a metric_normalizer based on normalize_name
                         # If metric rename rules are empty, set normalizer
                         # to None and the stats engine will skip steps as
@@ -1470,12 +1707,13 @@ class Application(object):
                 _logger.debug("Completed harvest[%s] for %r in %.2f seconds.", call_metric, self._app_name, duration)
 
                 # Force close the socket connection which has been
-                # created for this harvest if session still exists.
-                # New connection will be create automatically on the
-                # next harvest.
+                # created for this harvest if session still exists,
+                # unless connections are being kept alive between
+                # harvests. New connection will be create automatically
+                # on the next harvest.
 
                 if self._active_session:
-                    self._active_session.close_connection()
+                    self._active_session.release_connection()
 
         # Merge back in statistics recorded about the last harvest
         # and communication with the data collector. This will be
@@ -1484,6 +1722,205 @@ class Application(object):
         with self._stats_lock:
             self._stats_engine.merge_custom_metrics(internal_metrics.metrics())
 
+    def _harvest_uploads(self, stats, configuration, flexible):
+        """Returns the list of payloads, other than the metric data, to be
+        sent to the data collector for a harvest of the stats snapshot.
+        Each data set in the snapshot is only reset once its payload has
+        been sent, so that anything not sent can be rolled back.
+
+        """
+
+        session = self._active_session
+        uploads = []
+
+        def _upload(message, send, *args):
+            def _send():
+                _logger.debug("Sending %s for harvest of %r.", message, self._app_name)
+                send(*args)
+
+            return _send
+
+        # Send data set for analytics, which is Synthetic analytic
+        # events, and the sampled data set of regular requests sent
+        # as separate requests.
+
+        synthetics_events = stats.synthetics_events
+        if synthetics_events:
+            send = None
+            if synthetics_events.num_samples:
+                send = _upload(
+                    "synthetics event data",
+                    session.send_transaction_events,
+                    synthetics_events.sampling_info,
+                    list(synthetics_events),
+                )
+
+            uploads.append(HarvestUpload("analytic_event_data", send, stats.reset_synthetics_events))
+
+        if configuration.collect_analytics_events and configuration.transaction_events.enabled:
+
+            transaction_events = stats.transaction_events
+
+            if transaction_events:
+                # As per spec
+                internal_metric("Supportability/Python/RequestSampler/requests", transaction_events.num_seen)
+                internal_metric("Supportability/Python/RequestSampler/samples", transaction_events.num_samples)
+
+                send = None
+                if transaction_events.num_samples:
+                    send = _upload(
+                        "analytics event data",
+                        session.send_transaction_events,
+                        transaction_events.sampling_info,
+                        list(transaction_events),
+                    )
+
+                uploads.append(HarvestUpload("analytic_event_data", send, stats.reset_transaction_events))
+
+        # Send span events
+
+        if (
+            configuration.span_events.enabled
+            and configuration.collect_span_events
+            and configuration.distributed_tracing.enabled
+        ):
+            if configuration.infinite_tracing.enabled:
+                span_stream = stats.span_stream
+                # Only merge stats as part of default harvest
+                if span_stream and not flexible:
+                    spans_seen, spans_dropped = span_stream.stats()
+                    spans_sent = spans_seen - spans_dropped
+
+                    internal_count_metric("Supportability/InfiniteTracing/Span/Seen", spans_seen)
+                    internal_count_metric("Supportability/InfiniteTracing/Span/Sent", spans_sent)
+            else:
+                spans = stats.span_events
+                if spans:
+                    send = None
+                    if spans.num_samples > 0:
+                        send = _upload("span event data", session.send_span_events, spans.sampling_info, list(spans))
+
+                    # As per spec
+                    spans_seen = spans.num_seen
+                    spans_sampled = spans.num_samples
+
+                    def _spans_sent():
+                        internal_count_metric("Supportability/SpanEvent/TotalEventsSeen", spans_seen)
+                        internal_count_metric("Supportability/SpanEvent/TotalEventsSent", spans_sampled)
+                        stats.reset_span_events()
+
+                    uploads.append(HarvestUpload("span_event_data", send, _spans_sent))
+
+        # Send error events
+
+        if (
+            configuration.collect_error_events
+            and configuration.error_collector.capture_events
+            and configuration.error_collector.enabled
+        ):
+
+            error_events = stats.error_events
+            if error_events:
+                num_error_samples = error_events.num_samples
+                num_error_seen = error_events.num_seen
+
+                send = None
+                if num_error_samples > 0:
+                    send = _upload(
+                        "error event data",
+                        session.send_error_events,
+                        error_events.sampling_info,
+                        list(error_events),
+                    )
+
+                def _error_events_sent():
+                    # As per spec
+                    internal_count_metric("Supportability/Events/TransactionError/Seen", num_error_seen)
+                    internal_count_metric("Supportability/Events/TransactionError/Sent", num_error_samples)
+                    stats.reset_error_events()
+
+                uploads.append(HarvestUpload("error_event_data", send, _error_events_sent))
+
+        # Send custom events
+
+        if configuration.collect_custom_events and configuration.custom_insights_events.enabled:
+
+            customs = stats.custom_events
+
+            if customs:
+                num_custom_samples = customs.num_samples
+                num_custom_seen = customs.num_seen
+
+                send = None
+                if num_custom_samples > 0:
+                    send = _upload(
+                        "custom event data",
+                        session.send_custom_events,
+                        customs.sampling_info,
+                        list(customs),
+                    )
+
+                def _custom_events_sent():
+                    # As per spec
+                    internal_count_metric("Supportability/Events/Customer/Seen", num_custom_seen)
+                    internal_count_metric("Supportability/Events/Customer/Sent", num_custom_samples)
+                    stats.reset_custom_events()
+
+                uploads.append(HarvestUpload("custom_event_data", send, _custom_events_sent))
+
+        # Send the accumulated error data.
+
+        if configuration.collect_errors:
+            error_data = list(stats.error_data()) + self._take_forwarded_payload("error_data")
+
+            if error_data:
+                uploads.append(
+                    HarvestUpload("error_data", _upload("error data", session.send_errors, error_data))
+                )
+
+        if not flexible:
+            if configuration.collect_traces:
+                if configuration.explain_plans.background:
+                    if self._explain_plan_worker is None:
+                        self._explain_plan_worker = ExplainPlanWorker(
+                            self._app_name,
+                            configuration.agent_limits.max_sql_connections,
+                            configuration.explain_plans.cache_ttl,
+                        )
+
+                    connections = self._explain_plan_worker.session(configuration.explain_plans.harvest_time_budget)
+
+                else:
+                    connections = SQLConnections(configuration.agent_limits.max_sql_connections)
+
+                with connections:
+                    if configuration.slow_sql.enabled:
+                        _logger.debug("Processing slow SQL data for harvest of %r.", self._app_name)
+
+                        slow_sql_data = list(stats.slow_sql_data(connections))
+                        slow_sql_data.extend(self._take_forwarded_payload("sql_trace_data"))
+
+                        if slow_sql_data:
+                            uploads.append(
+                                HarvestUpload(
+                                    "sql_trace_data",
+                                    _upload("slow SQL data", session.send_sql_traces, slow_sql_data),
+                                )
+                            )
+
+                    slow_transaction_data = list(stats.transaction_trace_data(connections))
+                    slow_transaction_data.extend(self._take_forwarded_payload("transaction_sample_data"))
+
+                    if slow_transaction_data:
+                        uploads.append(
+                            HarvestUpload(
+                                "transaction_sample_data",
+                                _upload("slow transaction data", session.send_transaction_traces, slow_transaction_data),
+                            )
+                        )
+
+        return uploads
+
     def report_profile_data(self):
         """Report back any profile data."""
 
@@ -1517,6 +1954,19 @@ class Application(object):
 
         self.stop_data_samplers()
 
+        # Stop any worker gathering explain plans, which will close the
+        # database connections it is holding open.
+
+        if self._explain_plan_worker is not None:
+            self._explain_plan_worker.shutdown()
+            self._explain_plan_worker = None
+
+        # Stop the threads used for sending harvest payloads concurrently.
+
+        if self._upload_pool is not None:
+            self._upload_pool.shutdown()
+            self._upload_pool = None
+
         # Now shutdown the actual agent session.
 
         try:
@@ -1534,6 +1984,10 @@ class Application(object):
         self._active_session = None
         self._harvest_enabled = False
 
+        if self._payload_spool is not None and not restart:
+            self._payload_spool.close()
+            self._payload_spool = None
+
         # Initiate a new session if required, otherwise mark the agent
         # as shutdown.
 
@@ -28,6 +28,15 @@ _logger = logging.getLogger(__name__)
 _Attribute = namedtuple('_Attribute',
         ['name', 'value', 'destinations'])
 
+# Nodes without any attributes all share the same read only empty
+# attributes, rather than each holding an empty dictionary.
+
+try:
+    from types import MappingProxyType
+    EMPTY_ATTRIBUTES = MappingProxyType({})
+except ImportError:
+    EMPTY_ATTRIBUTES = {}
+
 # The following destinations are created here, never changed, and only
 # used in create_agent_attributes. It is placed at the module level here
 # as an optimization.
@@ -64,7 +73,9 @@ _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES = set((
         'aws.lambda.arn',
         'aws.lambda.coldStart',
         'aws.lambda.eventSource.arn',
+        'db.callCount',
         'db.instance',
+        'db.maxDuration',
         'db.operation',
         'db.statement',
         'error.class',
@@ -81,6 +92,9 @@ _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES = set((
         'graphql.operation.query',
 ))
 
+_TRANSACTION_EVENT_DEFAULT_DESTINATIONS = dict.fromkeys(
+        _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES, _DESTINATIONS_WITH_EVENTS)
+
 MAX_NUM_USER_ATTRIBUTES = 128
 MAX_ATTRIBUTE_LENGTH = 255
 MAX_64_BIT_INT = 2 ** 63 - 1
@@ -110,42 +124,30 @@ class Attribute(_Attribute):
 
 
 def create_attributes(attr_dict, destinations, attribute_filter):
-    attributes = []
-
-    for k, v in attr_dict.items():
-        dest = attribute_filter.apply(k, destinations)
-        attributes.append(Attribute(k, v, dest))
+    dests = attribute_filter.apply_many(attr_dict, destinations)
 
-    return attributes
+    return [Attribute(k, v, dest)
+            for (k, v), dest in zip(attr_dict.items(), dests)]
 
 
 def create_agent_attributes(attr_dict, attribute_filter):
-    attributes = []
+    items = [(k, v) for k, v in attr_dict.items() if v is not None]
 
-    for k, v in attr_dict.items():
-        if v is None:
-            continue
+    dests = attribute_filter.apply_many([k for k, _ in items], _DESTINATIONS,
+            _TRANSACTION_EVENT_DEFAULT_DESTINATIONS)
 
-        if k in _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES:
-            dest = attribute_filter.apply(k, _DESTINATIONS_WITH_EVENTS)
-        else:
-            dest = attribute_filter.apply(k, _DESTINATIONS)
-
-        attributes.append(Attribute(k, v, dest))
-
-    return attributes
+    return [Attribute(k, v, dest) for (k, v), dest in zip(items, dests)]
 
 
 def resolve_user_attributes(
             attr_dict, attribute_filter, target_destination, attr_class=dict):
     u_attrs = attr_class()
 
-    for attr_name, attr_value in attr_dict.items():
-        if attr_value is None:
-            continue
+    items = [(k, v) for k, v in attr_dict.items() if v is not None]
 
-        dest = attribute_filter.apply(attr_name, DST_ALL)
+    dests = attribute_filter.apply_many([k for k, _ in items], DST_ALL)
 
+    for (attr_name, attr_value), dest in zip(items, dests):
         if dest & target_destination:
             u_attrs[attr_name] = attr_value
 
@@ -156,15 +158,12 @@ def resolve_agent_attributes(
             attr_dict, attribute_filter, target_destination, attr_class=dict):
     a_attrs = attr_class()
 
-    for attr_name, attr_value in attr_dict.items():
-        if attr_value is None:
-            continue
+    items = [(k, v) for k, v in attr_dict.items() if v is not None]
 
-        if attr_name in _TRANSACTION_EVENT_DEFAULT_ATTRIBUTES:
-            dest = attribute_filter.apply(attr_name, _DESTINATIONS_WITH_EVENTS)
-        else:
-            dest = attribute_filter.apply(attr_name, _DESTINATIONS)
+    dests = attribute_filter.apply_many([k for k, _ in items], _DESTINATIONS,
+            _TRANSACTION_EVENT_DEFAULT_DESTINATIONS)
 
+    for (attr_name, attr_value), dest in zip(items, dests):
         if dest & target_destination:
             a_attrs[attr_name] = attr_value
 
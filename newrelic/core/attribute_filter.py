@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
+from collections import OrderedDict
+
 # Attribute "destinations" represented as bitfields.
 
 DST_NONE = 0x0
@@ -57,12 +61,33 @@ class AttributeFilter(object):
     #      the bitfield.
     #
     #   4. Return the resulting bitfield after all rules have been applied.
+    #
+    # Each rule either sets or clears the bits of its destinations, so any
+    # run of rules can be compiled into an AND mask and an OR mask, with
+    # the resulting bitfield being (destinations & AND) | OR. The rules are
+    # compiled in this way for each distinct rule name, with the masks for
+    # wildcard rules being indexed by the prefix they match. As the rules
+    # are sorted by name, those matching an attribute are applied in order
+    # by taking the wildcard prefixes of the attribute name from shortest to
+    # longest, followed by the attribute name itself for exact rules.
+    #
+    # The result for each attribute name and set of default destinations is
+    # cached. Attribute names can include values such as request IDs, so
+    # the cache is bounded by the 'attributes.cache_size' setting, with the
+    # oldest entry being evicted once full. Unlike least recently used
+    # eviction, this doesn't need a lock when there is a cache hit. The
+    # lock is shared by all filters, as the settings holding a filter can
+    # be deep copied, which a lock can't be.
+
+    _cache_lock = threading.Lock()
 
     def __init__(self, flattened_settings):
 
         self.enabled_destinations = self._set_enabled_destinations(flattened_settings)
         self.rules = self._build_rules(flattened_settings)
-        self.cache = {}
+        self.cache = OrderedDict()
+        self.cache_size = flattened_settings.get('attributes.cache_size', None)
+        self._compile_rules()
 
     def __repr__(self):
         return "<AttributeFilter: destinations: %s, rules: %s>" % (
@@ -135,28 +160,97 @@ class AttributeFilter(object):
 
         return tuple(rules)
 
+    def _compile_rules(self):
+        exact = {}
+        wildcards = {}
+
+        for rule in self.rules:
+            masks = wildcards if rule.is_wildcard else exact
+            and_mask, or_mask = masks.get(rule.name, (DST_ALL, DST_NONE))
+
+            if rule.is_include:
+                or_mask |= rule.destinations & self.enabled_destinations
+            else:
+                and_mask &= ~rule.destinations
+                or_mask &= ~rule.destinations
+
+            masks[rule.name] = (and_mask, or_mask)
+
+        self._exact_masks = exact
+        self._wildcard_masks = wildcards
+        self._prefix_lengths = sorted(set(len(prefix) for prefix in wildcards))
+
+    def _resolve(self, name, default_destinations):
+        destinations = self.enabled_destinations & default_destinations
+
+        wildcards = self._wildcard_masks
+
+        for length in self._prefix_lengths:
+            if length > len(name):
+                break
+
+            masks = wildcards.get(name[:length])
+
+            if masks is not None:
+                destinations = (destinations & masks[0]) | masks[1]
+
+        masks = self._exact_masks.get(name)
+
+        if masks is not None:
+            destinations = (destinations & masks[0]) | masks[1]
+
+        cache = self.cache
+
+        with self._cache_lock:
+            cache[(name, default_destinations)] = destinations
+
+            if self.cache_size is not None:
+                while len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+
+        return destinations
+
     def apply(self, name, default_destinations):
         if self.enabled_destinations == DST_NONE:
             return DST_NONE
 
-        cache_index = (name, default_destinations)
-
-        if cache_index in self.cache:
-            return self.cache[cache_index]
+        destinations = self.cache.get((name, default_destinations))
 
-        destinations = self.enabled_destinations & default_destinations
+        if destinations is None:
+            destinations = self._resolve(name, default_destinations)
 
-        for rule in self.rules:
-            if rule.name_match(name):
-                if rule.is_include:
-                    inc_dest = rule.destinations & self.enabled_destinations
-                    destinations |= inc_dest
-                else:
-                    destinations &= ~rule.destinations
-
-        self.cache[cache_index] = destinations
         return destinations
 
+    def apply_many(self, names, default_destinations, name_defaults=None):
+
+        # Returns a list of the destinations for each of the names, in
+        # order. Where name_defaults is supplied, it maps any names for
+        # which the default destinations differ to those to be used.
+
+        if self.enabled_destinations == DST_NONE:
+            return [DST_NONE] * len(names)
+
+        cache_get = self.cache.get
+        resolve = self._resolve
+
+        results = []
+
+        for name in names:
+            if name_defaults:
+                default = name_defaults.get(name, default_destinations)
+            else:
+                default = default_destinations
+
+            destinations = cache_get((name, default))
+
+            if destinations is None:
+                destinations = resolve(name, default)
+
+            results.append(destinations)
+
+        return results
+
+
 class AttributeFilterRule(object):
 
     def __init__(self, name, destinations, is_include):
@@ -223,6 +223,10 @@ class DatastoreTracerDatabaseNameReportingSettings(Settings):
     pass
 
 
+class DatastoreTracerCoalesceStatementsSettings(Settings):
+    pass
+
+
 class HerokuSettings(Settings):
     pass
 
@@ -255,6 +259,50 @@ class EventLoopVisibilitySettings(Settings):
     pass
 
 
+class TraceCacheSettings(Settings):
+    pass
+
+
+class TransactionRecordingSettings(Settings):
+    pass
+
+
+class StatsEngineSettings(Settings):
+    pass
+
+
+class HarvestSettings(Settings):
+    pass
+
+
+class HarvestSpoolSettings(Settings):
+    pass
+
+
+class HarvestUploadTimeoutsSettings(Settings):
+    pass
+
+
+class LocalAggregatorSettings(Settings):
+    pass
+
+
+class RulesEngineSettings(Settings):
+    pass
+
+
+class SqlStatementCacheSettings(Settings):
+    pass
+
+
+class SqlParserSettings(Settings):
+    pass
+
+
+class ExplainPlansSettings(Settings):
+    pass
+
+
 class InfiniteTracingSettings(Settings):
     _trace_observer_host = None
 
@@ -345,6 +393,17 @@ _settings.browser_monitoring.attributes = BrowserMonitorAttributesSettings()
 _settings.transaction_name = TransactionNameSettings()
 _settings.transaction_metrics = TransactionMetricsSettings()
 _settings.event_loop_visibility = EventLoopVisibilitySettings()
+_settings.trace_cache = TraceCacheSettings()
+_settings.transaction_recording = TransactionRecordingSettings()
+_settings.stats_engine = StatsEngineSettings()
+_settings.rules_engine = RulesEngineSettings()
+_settings.sql_statement_cache = SqlStatementCacheSettings()
+_settings.sql_parser = SqlParserSettings()
+_settings.explain_plans = ExplainPlansSettings()
+_settings.harvest = HarvestSettings()
+_settings.harvest.spool = HarvestSpoolSettings()
+_settings.harvest.upload_timeouts = HarvestUploadTimeoutsSettings()
+_settings.local_aggregator = LocalAggregatorSettings()
 _settings.rum = RumSettings()
 _settings.slow_sql = SlowSqlSettings()
 _settings.agent_limits = AgentLimitsSettings()
@@ -362,6 +421,7 @@ _settings.strip_exception_messages = StripExceptionMessageSettings()
 _settings.datastore_tracer = DatastoreTracerSettings()
 _settings.datastore_tracer.instance_reporting = DatastoreTracerInstanceReportingSettings()
 _settings.datastore_tracer.database_name_reporting = DatastoreTracerDatabaseNameReportingSettings()
+_settings.datastore_tracer.coalesce_statements = DatastoreTracerCoalesceStatementsSettings()
 _settings.heroku = HerokuSettings()
 _settings.span_events = SpanEventSettings()
 _settings.span_events.attributes = SpanEventAttributesSettings()
@@ -617,6 +677,7 @@ _settings.max_payload_size_in_bytes = 1000000
 _settings.attributes.enabled = True
 _settings.attributes.exclude = []
 _settings.attributes.include = []
+_settings.attributes.cache_size = 1000
 
 _settings.thread_profiler.enabled = True
 _settings.cross_application_tracer.enabled = False
@@ -693,6 +754,7 @@ _settings.agent_limits.sql_explain_plans = 30
 _settings.agent_limits.sql_explain_plans_per_harvest = 60
 _settings.agent_limits.slow_sql_data = 10
 _settings.agent_limits.merge_stats_maximum = None
+_settings.agent_limits.transaction_nodes_maximum = None
 _settings.agent_limits.errors_per_transaction = 5
 _settings.agent_limits.errors_per_harvest = 20
 _settings.agent_limits.slow_transaction_dry_harvests = 5
@@ -706,6 +768,7 @@ _settings.infinite_tracing.trace_observer_host = os.environ.get("NEW_RELIC_INFIN
 _settings.infinite_tracing.trace_observer_port = _environ_as_int("NEW_RELIC_INFINITE_TRACING_TRACE_OBSERVER_PORT", 443)
 _settings.infinite_tracing.ssl = True
 _settings.infinite_tracing.span_queue_size = _environ_as_int("NEW_RELIC_INFINITE_TRACING_SPAN_QUEUE_SIZE", 10000)
+_settings.infinite_tracing.batching = _environ_as_bool("NEW_RELIC_INFINITE_TRACING_BATCHING", default=True)
 
 _settings.event_harvest_config.harvest_limits.analytic_event_data = _environ_as_int(
     "NEW_RELIC_ANALYTICS_EVENTS_MAX_SAMPLES_STORED", DEFAULT_RESERVOIR_SIZE
@@ -767,6 +830,7 @@ _settings.strip_exception_messages.whitelist = []
 
 _settings.datastore_tracer.instance_reporting.enabled = True
 _settings.datastore_tracer.database_name_reporting.enabled = True
+_settings.datastore_tracer.coalesce_statements.enabled = False
 
 _settings.heroku.use_dyno_names = _environ_as_bool("NEW_RELIC_HEROKU_USE_DYNO_NAMES", default=True)
 _settings.heroku.dyno_name_prefixes_to_shorten = list(
@@ -779,6 +843,50 @@ _settings.aws_lambda_metadata = {}
 _settings.event_loop_visibility.enabled = True
 _settings.event_loop_visibility.blocking_threshold = 0.1
 
+_settings.trace_cache.implementation = os.environ.get("NEW_RELIC_TRACE_CACHE_IMPLEMENTATION", "default")
+
+_settings.transaction_recording.sharded_stats = False
+_settings.transaction_recording.background = False
+_settings.transaction_recording.queue_size = 1000
+_settings.transaction_recording.overflow_policy = "inline"
+
+_settings.stats_engine.compact_metric_table = False
+_settings.stats_engine.double_buffered_harvest = False
+
+_settings.harvest.concurrent_uploads = False
+_settings.harvest.upload_timeout = None
+_settings.harvest.upload_timeouts.analytic_event_data = None
+_settings.harvest.upload_timeouts.custom_event_data = None
+_settings.harvest.upload_timeouts.error_data = None
+_settings.harvest.upload_timeouts.error_event_data = None
+_settings.harvest.upload_timeouts.span_event_data = None
+_settings.harvest.upload_timeouts.sql_trace_data = None
+_settings.harvest.upload_timeouts.transaction_sample_data = None
+_settings.harvest.max_connections = 4
+_settings.harvest.stream_payloads = False
+_settings.harvest.scheduler = "thread"
+_settings.harvest.keep_alive = False
+_settings.harvest.idle_timeout = 120.0
+_settings.harvest.spool.enabled = False
+_settings.harvest.spool.directory = None
+_settings.harvest.spool.max_size = 64 * 1024 * 1024
+_settings.harvest.spool.segment_size = 1024 * 1024
+
+_settings.local_aggregator.socket_path = None
+
+_settings.rules_engine.cache_size = 0
+_settings.rules_engine.fuse_rules = False
+
+_settings.sql_statement_cache.size = 0
+_settings.sql_statement_cache.memory_limit = 4 * 1024 * 1024
+_settings.sql_statement_cache.shape_size = 1000
+
+_settings.sql_parser.single_pass = False
+
+_settings.explain_plans.background = False
+_settings.explain_plans.cache_ttl = 300.0
+_settings.explain_plans.harvest_time_budget = 5.0
+
 
 def global_settings():
     """This returns the default global settings. Generally only used
@@ -64,23 +64,17 @@ class ContextOf(object):
         if self.trace:
             self.thread_id = self.trace_cache.current_thread_id()
 
-            # Save previous cache contents
-            self.restore = self.trace_cache._cache.get(self.thread_id, None)
+            # Set context in trace cache, saving previous cache contents
+            self.restore = self.trace_cache.set_current(self.thread_id, self.trace)
             self.should_restore = True
 
-            # Set context in trace cache
-            self.trace_cache._cache[self.thread_id] = self.trace
-
         return self
 
     def __exit__(self, exc, value, tb):
         if self.should_restore:
-            if self.restore is not None:
-                # Restore previous contents
-                self.trace_cache._cache[self.thread_id] = self.restore
-            else:
-                # Remove entry from cache
-                self.trace_cache._cache.pop(self.thread_id)
+            # Restore previous contents, removing the entry from the cache
+            # if there were none
+            self.trace_cache.set_current(self.thread_id, self.restore)
 
 
 def context_wrapper(func, trace=None, request=None, trace_cache_id=None, strict=True):
@@ -28,14 +28,40 @@ from newrelic.common.agent_http import (
 from newrelic.core.agent_protocol import AgentProtocol, ServerlessModeProtocol
 from newrelic.core.agent_streaming import StreamingRpc
 from newrelic.core.config import global_settings
+from newrelic.core.local_aggregator import AggregatorUnavailable
+from newrelic.network.exceptions import RetryDataForRequest
 
 _logger = logging.getLogger(__name__)
 
+# Payloads for these methods can be spooled to disk when the data
+# collector is unreachable, to be replayed later. All but the SQL traces
+# reference the agent run they were recorded in as the first item.
+
+SPOOLED_METHODS = frozenset(
+    (
+        "analytic_event_data",
+        "custom_event_data",
+        "error_data",
+        "error_event_data",
+        "span_event_data",
+        "sql_trace_data",
+        "transaction_sample_data",
+    )
+)
+
+# Payloads for these methods are sent to the local aggregator, when one
+# is being used, to be merged with those from other processes.
+
+AGGREGATED_METHODS = SPOOLED_METHODS | frozenset(("metric_data",))
+
 
 class Session(object):
     PROTOCOL = AgentProtocol
     CLIENT = ApplicationModeClient
 
+    spool = None
+    aggregator = None
+
     def __init__(self, app_name, linked_applications, environment, settings):
         self._protocol = self.PROTOCOL.connect(
             app_name, linked_applications, environment, settings, client_cls=self.CLIENT
@@ -53,6 +79,9 @@ class Session(object):
     def close_connection(self):
         self._protocol.close_connection()
 
+    def release_connection(self):
+        self._protocol.release_connection()
+
     def connect_span_stream(self, span_iterator, record_metric):
         if not self._rpc:
             host = self.configuration.infinite_tracing.trace_observer_host
@@ -84,6 +113,64 @@ class Session(object):
         if self._rpc:
             self._rpc.close()
 
+    def _send(self, method, payload):
+        aggregator = self.aggregator
+
+        if aggregator is not None and method in AGGREGATED_METHODS:
+            # If the local aggregator can't be reached, the payload is
+            # sent directly to the data collector instead.
+
+            try:
+                return aggregator.send(method, payload)
+            except AggregatorUnavailable as exc:
+                _logger.debug("Sending %r data directly as the local aggregator is unavailable. %s", method, exc)
+
+        spool = self.spool
+
+        if spool is None or method not in SPOOLED_METHODS:
+            return self._protocol.send(method, payload)
+
+        # Once sending has failed, payloads are spooled without trying
+        # to send them until the backoff period has passed, rather than
+        # waiting on a connection timeout for every payload.
+
+        if spool.deferring() and spool.append(method, payload):
+            return
+
+        try:
+            result = self._protocol.send(method, payload)
+        except RetryDataForRequest:
+            spool.failed()
+            if not spool.append(method, payload):
+                raise
+            return
+
+        spool.succeeded()
+
+        return result
+
+    def _replay(self, method, payload):
+        # The payload may have been spooled during an earlier agent run
+        # so is updated to reference the current one.
+
+        if method != "sql_trace_data":
+            payload[0] = self.agent_run_id
+
+        return self._protocol.send(method, payload)
+
+    def replay_spooled_payloads(self):
+        """Resends payloads which were spooled when the data collector
+        was unreachable. Returns the number of payloads resent.
+
+        """
+
+        spool = self.spool
+
+        if spool is None or not spool.pending or spool.deferring():
+            return 0
+
+        return spool.replay(self._replay)
+
     def send_transaction_traces(self, transaction_traces):
         """Called to submit transaction traces. The transaction traces
         should be an iterable of individual traces.
@@ -98,25 +185,25 @@ class Session(object):
             return
 
         payload = (self.agent_run_id, transaction_traces)
-        return self._protocol.send("transaction_sample_data", payload)
+        return self._send("transaction_sample_data", payload)
 
     def send_transaction_events(self, sampling_info, sample_set):
         """Called to submit sample set for analytics."""
 
         payload = (self.agent_run_id, sampling_info, sample_set)
-        return self._protocol.send("analytic_event_data", payload)
+        return self._send("analytic_event_data", payload)
 
     def send_custom_events(self, sampling_info, custom_event_data):
         """Called to submit sample set for custom events."""
 
         payload = (self.agent_run_id, sampling_info, custom_event_data)
-        return self._protocol.send("custom_event_data", payload)
+        return self._send("custom_event_data", payload)
 
     def send_span_events(self, sampling_info, span_event_data):
         """Called to submit sample set for span events."""
 
         payload = (self.agent_run_id, sampling_info, span_event_data)
-        return self._protocol.send("span_event_data", payload)
+        return self._send("span_event_data", payload)
 
     def send_metric_data(self, start_time, end_time, metric_data):
         """Called to submit metric data for specified period of time.
@@ -126,7 +213,7 @@ class Session(object):
         """
 
         payload = (self.agent_run_id, start_time, end_time, metric_data)
-        return self._protocol.send("metric_data", payload)
+        return self._send("metric_data", payload)
 
     def get_agent_commands(self):
         """Receive agent commands from the data collector.
@@ -146,13 +233,13 @@ class Session(object):
 
         """
         payload = (self.agent_run_id, errors)
-        return self._protocol.send("error_data", payload)
+        return self._send("error_data", payload)
 
     def send_error_events(self, sampling_info, error_data):
         """Called to submit sample set for error events."""
 
         payload = (self.agent_run_id, sampling_info, error_data)
-        return self._protocol.send("error_event_data", payload)
+        return self._send("error_event_data", payload)
 
     def send_sql_traces(self, sql_traces):
         """Called to sub SQL traces. The SQL traces should be an
@@ -164,7 +251,7 @@ class Session(object):
         """
 
         payload = (sql_traces,)
-        return self._protocol.send("sql_trace_data", payload)
+        return self._send("sql_trace_data", payload)
 
     def send_agent_command_results(self, cmd_results):
         """Acknowledge the receipt of an agent command."""
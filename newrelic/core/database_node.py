@@ -20,7 +20,7 @@ import newrelic.core.trace_node
 from newrelic.common import system_info
 from newrelic.core.database_utils import sql_statement, explain_plan
 from newrelic.core.node_mixin import DatastoreNodeMixin
-from newrelic.core.metric import TimeMetric
+from newrelic.core.metric import AggregateTimeMetric, TimeMetric
 
 
 _SlowSqlNode = namedtuple('_SlowSqlNode',
@@ -56,11 +56,53 @@ _DatabaseNode = namedtuple('_DatabaseNode',
 
 class DatabaseNode(_DatabaseNode, DatastoreNodeMixin):
 
+    # Number of calls of the statement the node accounts for, where
+    # consecutive calls have been coalesced into the one node. For
+    # coalesced calls, the duration and exclusive time are the totals
+    # across all the calls, with call times holding the minimum, maximum
+    # and sum of squares of the individual call times.
+
+    call_count = 1
+    call_times = None
+
     def __new__(cls, *args, **kwargs):
         node = _DatabaseNode.__new__(cls, *args, **kwargs)
         node.statement = sql_statement(node.sql, node.dbapi2_module)
         return node
 
+    def coalesce(self, end_time, duration):
+        """Returns a node to be used in place of this one, which also
+        accounts for a further call of the same statement which ended at
+        end_time and took duration seconds.
+
+        """
+
+        min_call_time, max_call_time, sum_of_squares = self.call_times or (
+                self.duration, self.duration, self.duration ** 2)
+
+        call_count = self.call_count + 1
+        call_times = (min(min_call_time, duration),
+                max(max_call_time, duration), sum_of_squares + duration ** 2)
+
+        # The attributes are copied, as the previous node may still be
+        # referenced elsewhere.
+
+        agent_attributes = dict(self.agent_attributes)
+        agent_attributes['db.callCount'] = call_count
+        agent_attributes['db.maxDuration'] = call_times[1]
+
+        node = self._replace(end_time=end_time,
+                duration=self.duration + duration,
+                exclusive=self.exclusive + duration,
+                agent_attributes=agent_attributes)
+
+        node.__dict__.update(self.__dict__)
+
+        node.call_count = call_count
+        node.call_times = call_times
+
+        return node
+
     @property
     def product(self):
         return self.dbapi2_module and self.dbapi2_module._nr_database_product
@@ -96,6 +138,24 @@ class DatabaseNode(_DatabaseNode, DatastoreNodeMixin):
 
         """
 
+        metrics = self._time_metrics(stats, root, parent)
+
+        if self.call_times is None:
+            return metrics
+
+        # Metrics for coalesced calls carry the number of calls so they
+        # are counted the same as if each call had its own node.
+
+        call_count = self.call_count
+        min_call_time, max_call_time, sum_of_squares = self.call_times
+
+        return (AggregateTimeMetric(name=metric.name, scope=metric.scope,
+                duration=metric.duration, exclusive=metric.exclusive,
+                call_count=call_count, min_call_time=min_call_time,
+                max_call_time=max_call_time, sum_of_squares=sum_of_squares)
+                for metric in metrics)
+
+    def _time_metrics(self, stats, root, parent):
         product = self.product
         operation = self.operation or 'other'
         target = self.target
@@ -19,8 +19,11 @@ explain plans for SQL etc.
 
 import logging
 import re
+import threading
 import weakref
 
+from collections import OrderedDict
+
 import newrelic.packages.six as six
 
 from newrelic.core.internal_metrics import internal_metric
@@ -421,6 +424,187 @@ def _parse_target(sql, operation):
     parse = _operation_table.get(operation, None)
     return parse and parse(sql) or ''
 
+# Single pass tokenizer which produces the obfuscated, normalized and
+# uncommented forms of a SQL statement in one scan, rather than applying
+# the separate series of regular expressions above one after the other.
+#
+# Most of the cost of the separate regular expressions is in trying the
+# literal patterns at every position within the statement. The scanner
+# instead consumes runs of identifiers, keywords, white space and
+# punctuation in one go, only trying the patterns for quoted strings,
+# comments, literals and parameters where one could start. The run is
+# captured within a lookahead and then matched with a backreference so
+# the regular expression engine will not backtrack into it.
+#
+# As identifiers are consumed as a whole, a literal is only recognised
+# at the start of a word. Where the separate regular expressions would
+# replace something which looks like a hex value or UUID within an
+# identifier, the tokenizer leaves the identifier as is. Comments are
+# also recognised as part of the same scan, so comment markers within
+# quoted strings are not treated as the start of a comment.
+
+_tokenize_word_p = (r"(?!(?:%s)|(?:true|false|null)\b|q')[^\W\d]\w*" %
+        _uuid_p)
+_tokenize_other_p = r"[^\w'\"$#/(){}%:\-]+"
+_tokenize_run_p = r'(?=(?P<run>(?:%s|%s)*))(?P=run)' % (_tokenize_word_p,
+        _tokenize_other_p)
+
+_tokenize_comment_p = r'(?:#|--).*?(?=\r|\n|$)|\/\*(?:[^\/]|\/[^*])*?(?:\*\/|\/\*[\s\S]*)'
+_tokenize_literal_p = '|'.join([_uuid_p, _hex_p,
+        r'(?<!:)-?\b(?:[0-9]+\.)?[0-9]+(?:e[+-]?[0-9]+)?', _bool_p])
+_tokenize_param_p = r'%\([^)]*\)s|%s|:\w+'
+
+# The patterns for quoted strings, where the pattern for dollar quotes
+# needs a distinct group name for each place it is used.
+
+_tokenize_quotes_table = {
+    'single': _single_quotes_p,
+    'single+double': _any_quotes_p,
+    'single+dollar': (_single_quotes_p + '|' +
+            r'(?P<%(name)s>\$(?!\d)[^$]*?\$).*?(?:(?P=%(name)s)|$)'),
+    'single+oracle': _single_oracle_p,
+}
+
+# A sequence of values separated by commas is matched as one token, with
+# the values after the first then being replaced by a separate regular
+# expression, rather than each value being a token of its own.
+
+_tokenize_values_p = r'(?P<value>%s|%s)(?P<values>(?:\s*,\s*(?:%s|%s))*)'
+
+_tokenize_re_table = {}
+
+
+def _tokenize_re(quoting_style):
+    result = _tokenize_re_table.get(quoting_style)
+
+    if result is None:
+        quotes_p = _tokenize_quotes_table.get(quoting_style,
+                _single_quotes_p)
+
+        values_p = _tokenize_values_p % (quotes_p % {'name': 'dollar1'},
+                _tokenize_literal_p, quotes_p % {'name': 'dollar2'},
+                _tokenize_literal_p)
+
+        pattern = (r'%s(?:%s|(?P<comment>%s)|(?P<param>%s)|(?P<open>\()|'
+                r'(?P<close>\))|(?P<other>[\s\S])|\Z)' % (_tokenize_run_p,
+                values_p, _tokenize_comment_p, _tokenize_param_p))
+
+        value_p = r'%s|%s' % (quotes_p % {'name': 'dollar'},
+                _tokenize_literal_p)
+
+        result = (re.compile(pattern, re.IGNORECASE),
+                re.compile(value_p, re.IGNORECASE))
+
+        _tokenize_re_table[quoting_style] = result
+
+    return result
+
+
+_tokenize_whitespace_p = r'(?<![\w\s])\s+|\s+(?![\w\s])'
+_tokenize_whitespace_re = re.compile(_tokenize_whitespace_p)
+
+
+def _tokenize_sql(sql, database):
+    """Returns a tuple of the obfuscated, normalized and uncommented
+    forms of the SQL statement.
+
+    """
+
+    quoting_style = database.quoting_style
+
+    # The pieces of the obfuscated statement are recorded along with the
+    # parameters and parenthesised sets of values, so the normalized form
+    # can be derived from them afterwards. Any set of values is collapsed
+    # to a single value, from the first opening parenthesis up to the
+    # next closing parenthesis.
+
+    pieces = []
+    params = []
+    values = []
+    comments = []
+
+    append = pieces.append
+
+    values_start = None
+
+    tokenize_re, value_re = _tokenize_re(quoting_style)
+
+    for match in tokenize_re.finditer(sql):
+        run = match.group(1)
+
+        if run:
+            append(run)
+
+        kind = match.lastgroup
+
+        if kind == 'values':
+            append('?')
+
+            remainder = match.group(kind)
+
+            if remainder:
+                append(value_re.sub('?', remainder))
+
+        elif kind == 'comment':
+            comments.append(match.span(kind))
+
+        elif kind == 'param':
+            params.append(len(pieces))
+            append(match.group(kind))
+
+        elif kind == 'open':
+            append('(')
+
+            if values_start is None:
+                values_start = len(pieces)
+
+        elif kind == 'close':
+            if values_start is not None:
+                if values_start != len(pieces):
+                    values.append((values_start, len(pieces)))
+                values_start = None
+
+            append(')')
+
+        elif kind == 'other':
+            append(match.group(kind))
+
+    obfuscated = ''.join(pieces)
+
+    normalized = pieces
+
+    for index in params:
+        normalized[index] = '?'
+
+    for start, end in reversed(values):
+        normalized[start:end] = ['?']
+
+    # Determine if the obfuscated query was malformed by searching for
+    # remaining quote characters.
+
+    quotes_cleanup_re = _quotes_table.get(quoting_style,
+            (_single_quotes_re, _single_quotes_cleanup_re))[1]
+
+    if quotes_cleanup_re.search(obfuscated):
+        obfuscated = '?'
+        normalized = '?'
+    else:
+        normalized = _tokenize_whitespace_re.sub('', ''.join(normalized))
+        normalized = _normalize_whitespace_1_re.sub(' ', normalized)
+
+    if comments:
+        uncommented = []
+        start = 0
+        for comment_start, comment_end in comments:
+            uncommented.append(sql[start:comment_start])
+            start = comment_end
+        uncommented.append(sql[start:])
+        uncommented = ''.join(uncommented)
+    else:
+        uncommented = sql
+
+    return obfuscated, normalized, uncommented
+
 # For explain plan obfuscation, the regular expression for matching the
 # explain plan needs to give precedence to replacing double quotes from
 # around table names, then single quotes from any text, typed or
@@ -546,6 +730,12 @@ class SQLConnection(object):
 
         return cursor
 
+    def rollback(self):
+        try:
+            self.connection.rollback()
+        except (AttributeError, self.database.NotSupportedError):
+            pass
+
     def cleanup(self):
         settings = global_settings()
 
@@ -553,11 +743,7 @@ class SQLConnection(object):
             _logger.debug('Cleanup database connection for %r.',
                     self.database)
 
-        try:
-            self.connection.rollback()
-            pass
-        except (AttributeError, self.database.NotSupportedError):
-            pass
+        self.rollback()
 
         self.connection.close()
 
@@ -621,6 +807,37 @@ class SQLConnections(object):
 
         return connection
 
+    def rollback(self, database, args, kwargs):
+        """Rolls back any transaction left open on the connection held
+        for the database. If this fails the connection is closed and
+        dropped, as it is likely no longer usable.
+
+        """
+
+        key = (database.client, args, kwargs)
+
+        for i, item in enumerate(self.connections):
+            if item[0] == key:
+                connection = item[1]
+
+                try:
+                    connection.rollback()
+
+                except Exception:
+                    self.connections.pop(i)
+
+                    try:
+                        connection.connection.close()
+                    except Exception:
+                        pass
+
+                break
+
+    def explain_plan(self, sql_statement, connect_params, cursor_params,
+            sql_parameters, execute_params):
+        return _explain_plan(self, sql_statement.sql, sql_statement.database,
+                connect_params, cursor_params, sql_parameters, execute_params)
+
     def cleanup(self):
         settings = global_settings()
 
@@ -757,8 +974,8 @@ def explain_plan(connections, sql_statement, connect_params, cursor_params,
     if sql_statement.operation not in database.explain_stmts:
         return
 
-    details = _explain_plan(connections, sql_statement.sql, database,
-            connect_params, cursor_params, sql_parameters, execute_params)
+    details = connections.explain_plan(sql_statement, connect_params,
+            cursor_params, sql_parameters, execute_params)
 
     if details is not None and sql_format != 'raw':
         return _obfuscate_explain_plan(database, *details)
@@ -812,6 +1029,10 @@ class SQLDatabase(object):
         return result
 
 
+def _single_pass():
+    return global_settings().sql_parser.single_pass
+
+
 class SQLStatement(object):
 
     def __init__(self, sql, database=None):
@@ -855,22 +1076,42 @@ class SQLStatement(object):
     @property
     def uncommented(self):
         if self._uncommented is None:
-            self._uncommented = _uncomment_sql(self.sql)
+            if _single_pass():
+                self._tokenize()
+            else:
+                self._uncommented = _uncomment_sql(self.sql)
         return self._uncommented
 
     @property
     def obfuscated(self):
         if self._obfuscated is None:
-            self._obfuscated = _uncomment_sql(_obfuscate_sql(self.sql,
-                self.database))
+            if _single_pass():
+                self._tokenize()
+            else:
+                self._obfuscated = _uncomment_sql(_obfuscate_sql(self.sql,
+                    self.database))
         return self._obfuscated
 
     @property
     def normalized(self):
         if self._normalized is None:
-            self._normalized = _normalize_sql(self.obfuscated)
+            if _single_pass():
+                self._tokenize()
+            else:
+                self._normalized = _normalize_sql(self.obfuscated)
         return self._normalized
 
+    def _tokenize(self):
+        obfuscated, normalized, uncommented = _tokenize_sql(self.sql,
+                self.database)
+
+        if self._obfuscated is None:
+            self._obfuscated = obfuscated
+        if self._normalized is None:
+            self._normalized = normalized
+        if self._uncommented is None:
+            self._uncommented = uncommented
+
     @property
     def identifier(self):
         if self._identifier is None:
@@ -888,10 +1129,188 @@ class SQLStatement(object):
             return self.obfuscated
 
 
+# Statements generated by an ORM frequently differ only in the literal
+# values used, or the number of values in a set. The shape of a statement
+# is a cheap fingerprint with such values stripped out, used to reuse the
+# operation and target parsed from an earlier statement of the same
+# shape. Quoted identifiers are kept as is so numbers within them are not
+# replaced, and single quoted strings are only replaced where they follow
+# an operator or keyword, as SQLite allows table names to be given as
+# single quoted strings. The shape is not used where a statement contains
+# comments, as the operation and target are parsed from the statement
+# with comments removed, and comment markers may appear in literals.
+
+_sql_shape_p = (r'("(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])|'
+        r"((?:[=<>,(]|\b(?:LIKE|AND|OR|THEN|ELSE|BETWEEN))\s*)'(?:[^']|'')*'|"
+        r'(?<![\w$.:])-?[0-9]+(?:\.[0-9]+)?(?![\w$])')
+_sql_shape_re = re.compile(_sql_shape_p, re.IGNORECASE)
+
+_sql_shape_values_p = r'\(\s*\?(?:\s*,\s*\?)*\s*\)'
+_sql_shape_values_re = re.compile(_sql_shape_values_p)
+
+
+def _sql_shape_replacement(match):
+    quoted, prefix = match.group(1, 2)
+
+    if quoted is not None:
+        return quoted
+
+    return (prefix or '') + '?'
+
+
+def _sql_shape(sql):
+    if '--' in sql or '/*' in sql or '#' in sql:
+        return None
+
+    shape = _sql_shape_re.sub(_sql_shape_replacement, sql)
+
+    return _sql_shape_values_re.sub('(?)', shape)
+
+
+class SQLStatementCache(object):
+    """Two level cache of parsed SQL statements. The first level holds
+    the most recently used statements keyed on their exact text, bounded
+    both by the number of statements and by the total length of their
+    text. The second level holds the operation and target for the most
+    recently used statement shapes.
+
+    """
+
+    def __init__(self, maximum=1000, memory_limit=4 * 1024 * 1024,
+            shape_maximum=1000):
+        self.maximum = maximum
+        self.memory_limit = memory_limit
+        self.shape_maximum = shape_maximum
+
+        self._lock = threading.Lock()
+
+        self._statements = OrderedDict()
+        self._statements_size = 0
+        self._shapes = OrderedDict()
+
+        self._counts = dict.fromkeys(self.COUNTS, 0)
+
+    COUNTS = ('Exact/Hits', 'Exact/Misses', 'Exact/Evictions',
+            'Shape/Hits', 'Shape/Misses', 'Shape/Evictions')
+
+    def get(self, sql, dbapi2_module):
+        key = (sql, dbapi2_module)
+
+        with self._lock:
+            counts = self._counts
+
+            result = self._statements.pop(key, None)
+
+            if result is not None:
+                self._statements[key] = result
+                counts['Exact/Hits'] += 1
+                return result
+
+            counts['Exact/Misses'] += 1
+
+        result = SQLStatement(sql, SQLDatabase(dbapi2_module))
+
+        if self.shape_maximum and result._operation is None:
+            self._apply_shape(result, dbapi2_module)
+
+        size = len(sql)
+
+        with self._lock:
+            if key not in self._statements:
+                self._statements_size += size
+
+            self._statements[key] = result
+
+            statements = self._statements
+
+            while statements and (len(statements) > self.maximum or
+                    self._statements_size > self.memory_limit):
+                (evicted, _), _ = statements.popitem(last=False)
+                self._statements_size -= len(evicted)
+                self._counts['Exact/Evictions'] += 1
+
+        return result
+
+    def _apply_shape(self, statement, dbapi2_module):
+        shape = _sql_shape(statement.sql)
+
+        if shape is None:
+            return
+
+        key = (shape, dbapi2_module)
+
+        with self._lock:
+            counts = self._counts
+
+            parsed = self._shapes.pop(key, None)
+
+            if parsed is not None:
+                self._shapes[key] = parsed
+                counts['Shape/Hits'] += 1
+
+            else:
+                counts['Shape/Misses'] += 1
+
+        if parsed is not None:
+            statement._operation, statement._target = parsed
+            return
+
+        parsed = (statement.operation, statement.target)
+
+        with self._lock:
+            self._shapes[key] = parsed
+
+            while len(self._shapes) > self.shape_maximum:
+                self._shapes.popitem(last=False)
+                self._counts['Shape/Evictions'] += 1
+
+    def harvest_counts(self):
+        """Returns the hit, miss and eviction counts for each level of
+        the cache since the last call, resetting the counts.
+
+        """
+
+        with self._lock:
+            counts = self._counts
+            self._counts = dict.fromkeys(self.COUNTS, 0)
+
+        return counts
+
+
 _sql_statements = weakref.WeakValueDictionary()
 
+_sql_statement_cache = None
+_sql_statement_cache_lock = threading.Lock()
+
+
+def sql_statement_cache():
+    """Returns the bounded cache of parsed SQL statements, or None where
+    it has been disabled.
+
+    """
+
+    global _sql_statement_cache
+
+    if _sql_statement_cache is None:
+        settings = global_settings().sql_statement_cache
+
+        if not settings.size:
+            return None
+
+        with _sql_statement_cache_lock:
+            if _sql_statement_cache is None:
+                _sql_statement_cache = SQLStatementCache(settings.size,
+                        settings.memory_limit, settings.shape_size)
+
+    return _sql_statement_cache
+
 
 def sql_statement(sql, dbapi2_module):
+    cache = sql_statement_cache()
+
+    if cache is not None:
+        return cache.get(sql, dbapi2_module)
+
     key = (sql, dbapi2_module)
 
     result = _sql_statements.get(key, None)
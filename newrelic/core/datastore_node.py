@@ -28,6 +28,8 @@ _DatastoreNode = namedtuple('_DatastoreNode',
 
 class DatastoreNode(_DatastoreNode, DatastoreNodeMixin):
 
+    __slots__ = ()
+
     @property
     def instance_hostname(self):
         if self.host in system_info.LOCALHOST_EQUIVALENTS:
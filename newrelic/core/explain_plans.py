@@ -0,0 +1,273 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements gathering of explain plans for slow SQL by a
+background worker thread, so that a slow database does not hold up the
+harvest. The worker keeps its database connections open between harvests
+and remembers the explain plans it has gathered for a period of time.
+
+"""
+
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from newrelic.core.database_utils import SQLConnections, _explain_plan
+from newrelic.core.internal_metrics import internal_count_metric
+from newrelic.packages.six.moves import queue
+
+_logger = logging.getLogger(__name__)
+
+
+def _cache_key(sql_statement, connect_params):
+    # Connection parameters are compared by equality when looking up a
+    # connection, so may not be hashable, in which case the explain plan
+    # is not cached.
+
+    obfuscated = sql_statement.obfuscated
+
+    if not obfuscated or obfuscated == "?":
+        return None
+
+    args, kwargs = connect_params
+
+    key = (sql_statement.database.client, obfuscated, args, tuple(sorted(kwargs.items())))
+
+    try:
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+
+class ExplainPlanRequest(object):
+    def __init__(self, key, sql_statement, connect_params, cursor_params, sql_parameters, execute_params):
+        self.key = key
+        self.sql_statement = sql_statement
+        self.connect_params = connect_params
+        self.cursor_params = cursor_params
+        self.sql_parameters = sql_parameters
+        self.execute_params = execute_params
+
+        self.done = threading.Event()
+        self.details = None
+
+
+class ExplainPlanWorker(object):
+
+    """Worker thread which executes explain plan queries. Connections
+    are held open between harvests, with at most maximum connections
+    being kept. Explain plans are cached against the obfuscated SQL for
+    ttl seconds. The worker thread is started on first use, and is
+    restarted if a process fork is detected.
+
+    """
+
+    def __init__(self, name, maximum=4, ttl=300.0, cache_size=1000):
+        self.name = name
+        self.maximum = maximum
+        self.ttl = ttl
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._process_id = None
+
+        self._cache = OrderedDict()
+        self._pending = {}
+
+    def _start(self):
+        with self._lock:
+            if self._process_id == os.getpid():
+                return
+
+            self._queue = queue.Queue()
+            self._pending = {}
+
+            self._thread = threading.Thread(target=self._run, name="NR-Explain-Plans/%s" % self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+            self._process_id = os.getpid()
+
+    def _run(self):
+        requests = self._queue
+
+        # Connections are only ever used from the worker thread.
+
+        connections = SQLConnections(self.maximum)
+
+        while True:
+            request = requests.get()
+
+            if request is None:
+                connections.cleanup()
+                return
+
+            try:
+                request.details = _explain_plan(
+                    connections,
+                    request.sql_statement.sql,
+                    request.sql_statement.database,
+                    request.connect_params,
+                    request.cursor_params,
+                    request.sql_parameters,
+                    request.execute_params,
+                )
+
+                # Don't leave a transaction open on a connection which is
+                # being held on to.
+
+                args, kwargs = request.connect_params
+                connections.rollback(request.sql_statement.database, args, kwargs)
+
+            except Exception:
+                _logger.exception(
+                    "Unexpected exception when gathering an explain plan. "
+                    "Please report this problem to New Relic support for "
+                    "further investigation."
+                )
+
+            finally:
+                with self._lock:
+                    if request.key is not None:
+                        self._pending.pop(request.key, None)
+
+                        if request.details is not None:
+                            self._cache.pop(request.key, None)
+                            self._cache[request.key] = (time.time() + self.ttl, request.details)
+
+                            while len(self._cache) > self.cache_size:
+                                self._cache.popitem(last=False)
+
+                request.done.set()
+
+    def cached(self, key):
+        """Returns the explain plan cached for the key, or None if there
+        is none or it has expired.
+
+        """
+
+        with self._lock:
+            entry = self._cache.get(key)
+
+            if entry is None:
+                return None
+
+            expires, details = entry
+
+            if expires < time.time():
+                del self._cache[key]
+                return None
+
+            return details
+
+    def submit(self, sql_statement, connect_params, cursor_params, sql_parameters, execute_params, key=None):
+        """Queues an explain plan to be gathered, returning the request.
+        A request for the same key which is already queued is returned
+        rather than queueing a new one.
+
+        """
+
+        if self._process_id != os.getpid():
+            self._start()
+
+        with self._lock:
+            request = key is not None and self._pending.get(key)
+
+            if request:
+                return request
+
+            request = ExplainPlanRequest(
+                key, sql_statement, connect_params, cursor_params, sql_parameters, execute_params
+            )
+
+            if key is not None:
+                self._pending[key] = request
+
+        self._queue.put(request)
+
+        return request
+
+    def session(self, budget):
+        return ExplainPlanSession(self, budget)
+
+    def shutdown(self):
+        """Stops the worker thread, closing any connections once queued
+        explain plans have been gathered.
+
+        """
+
+        with self._lock:
+            if self._process_id != os.getpid():
+                return
+
+            self._process_id = None
+
+        self._queue.put(None)
+
+
+class ExplainPlanSession(object):
+
+    """Used in place of the SQL connections cache for the duration of a
+    harvest. Explain plans are handed off to the worker, with the harvest
+    waiting on them only until the time budget for the harvest has been
+    used up. Any explain plans after that point are skipped. Explain plans
+    still being gathered at that point are cached when done, so can be
+    reported in a subsequent harvest.
+
+    """
+
+    def __init__(self, worker, budget):
+        self.worker = worker
+        self.deadline = time.time() + budget
+
+        self.cache_hits = 0
+        self.skipped = 0
+
+    def explain_plan(self, sql_statement, connect_params, cursor_params, sql_parameters, execute_params):
+        key = _cache_key(sql_statement, connect_params)
+
+        if key is not None:
+            details = self.worker.cached(key)
+
+            if details is not None:
+                self.cache_hits += 1
+                return details
+
+        remaining = self.deadline - time.time()
+
+        if remaining > 0.0:
+            request = self.worker.submit(
+                sql_statement, connect_params, cursor_params, sql_parameters, execute_params, key=key
+            )
+
+            if request.done.wait(remaining):
+                return request.details
+
+        self.skipped += 1
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        internal_count_metric("Supportability/Python/ExplainPlans/CacheHits", self.cache_hits)
+        internal_count_metric("Supportability/Python/ExplainPlans/Skipped", self.skipped)
@@ -29,6 +29,8 @@ _FunctionNode = namedtuple('_FunctionNode',
 
 class FunctionNode(_FunctionNode, GenericNodeMixin):
 
+    __slots__ = ()
+
     def time_metrics(self, stats, root, parent):
         """Return a generator yielding the timed metrics for this
         function node as well as all the child nodes.
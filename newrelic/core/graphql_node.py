@@ -30,6 +30,9 @@ _GraphQLResolverNode = namedtuple('_GraphQLNode',
     'exclusive', 'guid', 'agent_attributes', 'user_attributes', 'product'])
 
 class GraphQLNodeMixin(GenericNodeMixin):
+
+    __slots__ = ()
+
     def trace_node(self, stats, root, connections):
         name = root.string_table.cache(self.name)
 
@@ -55,6 +58,9 @@ class GraphQLNodeMixin(GenericNodeMixin):
                 label=None)
 
 class GraphQLResolverNode(_GraphQLResolverNode, GraphQLNodeMixin):
+
+    __slots__ = ()
+
     @property
     def name(self):
         field_name = self.field_name or "<unknown>"
@@ -90,6 +96,9 @@ class GraphQLResolverNode(_GraphQLResolverNode, GraphQLNodeMixin):
 
 
 class GraphQLOperationNode(_GraphQLOperationNode, GraphQLNodeMixin):
+
+    __slots__ = ()
+
     @property
     def name(self):
         operation_type = self.operation_type
@@ -0,0 +1,149 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements scheduling of harvests by a task running on the
+asyncio event loop of the monitored application, as an alternative to the
+dedicated harvest thread. Sending data to the data collector still makes
+blocking calls, so each harvest is run using the default executor of the
+event loop, keeping the event loop itself free to serve requests.
+
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+def _running_loop():
+    get_running_loop = getattr(asyncio, "_get_running_loop", None)
+    return get_running_loop and get_running_loop()
+
+
+class AsyncioHarvestScheduler(object):
+
+    """Runs the flexible and default harvest cycles of the agent from an
+    asyncio task. The task is started on the first event loop the
+    scheduler is attached to, and is started again on the event loop of
+    a forked process when attached from within that process.
+
+    """
+
+    default_period = 60.0
+
+    def __init__(self, agent):
+        self._agent = agent
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+
+        self.process_id = None
+
+    @property
+    def flexible_period(self):
+        event_harvest_config = self._agent.global_settings().event_harvest_config
+        return event_harvest_config.report_period_ms / 1000.0
+
+    def attach(self, loop=None):
+        """Starts the harvest task on the event loop, which defaults to
+        the event loop running in the current thread. Returns whether
+        the harvest task is running for the current process.
+
+        """
+
+        loop = loop or _running_loop()
+
+        with self._lock:
+            if self.process_id == os.getpid():
+                return True
+
+            if loop is None or loop.is_closed() or self._agent._harvest_shutdown_is_set():
+                return False
+
+            self._loop = loop
+            self._task = None
+            self.process_id = os.getpid()
+
+        _logger.debug("Starting harvest task on event loop %r.", loop)
+
+        loop.call_soon_threadsafe(self._start, loop)
+
+        return True
+
+    def _start(self, loop):
+        if self._task is None and not self._agent._harvest_shutdown_is_set():
+            self._task = loop.create_task(self._run(loop))
+
+    async def _run(self, loop):
+        agent = self._agent
+
+        next_flexible = loop.time() + self.flexible_period
+        next_default = loop.time() + self.default_period
+
+        try:
+            while True:
+                await asyncio.sleep(max(min(next_flexible, next_default) - loop.time(), 0.0))
+
+                if agent._harvest_shutdown_is_set():
+                    return
+
+                # The next harvest of each kind is scheduled relative to
+                # when the current one starts, as with the harvest thread.
+
+                if loop.time() >= next_flexible:
+                    next_flexible = loop.time() + self.flexible_period
+                    _logger.debug("Commencing harvest[flexible] of application data.")
+                    await loop.run_in_executor(None, agent._perform_flexible_harvest)
+
+                if agent._harvest_shutdown_is_set():
+                    return
+
+                if loop.time() >= next_default:
+                    next_default = loop.time() + self.default_period
+                    _logger.debug("Commencing harvest[default] of application data.")
+                    await loop.run_in_executor(None, agent._perform_default_harvest)
+
+        except asyncio.CancelledError:
+            pass
+
+        except Exception:
+            _logger.exception(
+                "Unexpected exception in harvest task. Please report this "
+                "problem to New Relic support for further investigation."
+            )
+
+    def shutdown(self):
+        """Stops the harvest task. Final harvests on shutdown are left to
+        the caller.
+
+        """
+
+        with self._lock:
+            loop, self._loop = self._loop, None
+            self.process_id = None
+
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._cancel)
+            except RuntimeError:
+                pass
+
+    def _cancel(self):
+        task, self._task = self._task, None
+
+        if task is not None:
+            task.cancel()
@@ -0,0 +1,327 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements dispatch of the independent payloads sent to the
+data collector during a harvest. Payloads can either be sent one after the
+other on the harvest thread, or concurrently from a bounded pool of worker
+threads.
+
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+from newrelic.core.internal_metrics import (
+    InternalTraceContext,
+    internal_count_metric,
+    internal_metric,
+)
+from newrelic.core.stats_engine import CustomMetrics
+from newrelic.network.exceptions import RetryDataForRequest
+from newrelic.packages import six
+from newrelic.packages.six.moves import queue
+
+_logger = logging.getLogger(__name__)
+
+
+class HarvestUpload(object):
+
+    """A single payload to be sent to the data collector. The send
+    callable performs the request, with the on_success callable being
+    called on the harvest thread once the payload has been sent. Either
+    may be None.
+
+    An upload which is still being sent when the harvest thread stops
+    waiting on it is abandoned. Its data has already been treated as
+    sent, so if the send subsequently fails the loss of the payload is
+    logged and counted.
+
+    """
+
+    def __init__(self, method, send=None, on_success=None):
+        self.method = method
+        self.send = send
+        self.on_success = on_success
+
+        self.done = threading.Event()
+        self.duration = 0.0
+        self.exc_info = None
+        self.metrics = CustomMetrics()
+
+        self._lock = threading.Lock()
+        self._started = False
+        self._cancelled = False
+        self._finished = False
+        self._abandoned = False
+
+    def cancel(self):
+        """Cancels the upload if it has not yet been started, returning
+        whether it was cancelled.
+
+        """
+
+        with self._lock:
+            if not self._started:
+                self._cancelled = True
+
+            return self._cancelled
+
+    def abandon(self):
+        """Abandons the upload if it is still being sent, returning
+        whether it was abandoned.
+
+        """
+
+        with self._lock:
+            if not self._finished:
+                self._abandoned = True
+
+            return self._abandoned
+
+    def run(self):
+        with self._lock:
+            if self._cancelled:
+                return
+
+            self._started = True
+
+        start = time.time()
+
+        try:
+            # Internal metrics are recorded against a thread local
+            # context, so those recorded when sending from a separate
+            # thread are captured and merged in after the upload is done.
+
+            with InternalTraceContext(self.metrics):
+                self.send()
+
+        except Exception:
+            self.exc_info = sys.exc_info()
+
+        finally:
+            self.duration = time.time() - start
+
+            with self._lock:
+                self._finished = True
+                abandoned = self._abandoned
+
+            if abandoned and self.exc_info is not None:
+                _logger.warning(
+                    "Sending of %r data to the data collector failed after it was timed out. The data has been lost.",
+                    self.method,
+                )
+
+                with InternalTraceContext(self.metrics):
+                    internal_count_metric("Supportability/Python/Harvest/Upload/%s/Lost" % self.method, 1)
+
+            self.done.set()
+
+
+class HarvestUploadPool(object):
+
+    """Pool of worker threads from which payloads are sent concurrently.
+    The number of threads never exceeds size, so a worker blocked on a
+    data collector which has stopped responding holds on to its place in
+    the pool rather than more threads being started. The worker threads
+    are started on first use, and are restarted if a process fork is
+    detected. Uploads which were abandoned while still being sent are
+    kept so their internal metrics can be merged once they complete.
+
+    """
+
+    def __init__(self, name, size=4):
+        self.name = name
+        self.size = max(size, 1)
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._process_id = None
+        self._abandoned = []
+
+    def _start(self):
+        with self._lock:
+            if self._process_id == os.getpid():
+                return
+
+            self._queue = queue.Queue()
+
+            for _ in range(self.size):
+                thread = threading.Thread(target=self._run, args=(self._queue,), name="NR-Harvest-Upload/%s" % self.name)
+                thread.daemon = True
+                thread.start()
+
+            self._process_id = os.getpid()
+
+    def _run(self, uploads):
+        while True:
+            upload = uploads.get()
+
+            if upload is None:
+                return
+
+            upload.run()
+
+    def submit(self, upload):
+        if self._process_id != os.getpid():
+            self._start()
+
+        self._queue.put(upload)
+
+    def abandon(self, upload):
+        with self._lock:
+            self._abandoned.append(upload)
+
+    def merge_abandoned(self, metrics):
+        """Merges the internal metrics of any abandoned uploads which
+        have since completed into metrics.
+
+        """
+
+        with self._lock:
+            completed = [upload for upload in self._abandoned if upload.done.is_set()]
+            self._abandoned = [upload for upload in self._abandoned if not upload.done.is_set()]
+
+        for upload in completed:
+            metrics.merge_metrics(upload.metrics.metrics())
+            _record_duration(upload)
+
+    def shutdown(self):
+        """Stops the worker threads once any queued payloads have been
+        dealt with.
+
+        """
+
+        with self._lock:
+            if self._process_id != os.getpid():
+                return
+
+            self._process_id = None
+
+        for _ in range(self.size):
+            self._queue.put(None)
+
+
+def _record_duration(upload):
+    internal_metric("Supportability/Python/Harvest/Upload/%s" % upload.method, upload.duration)
+
+
+def send_sequentially(uploads):
+    """Sends each of the payloads in turn on the calling thread. Any
+    exception aborts sending of the remaining payloads.
+
+    """
+
+    for upload in uploads:
+        if upload.send is not None:
+            start = time.time()
+            upload.send()
+            upload.duration = time.time() - start
+            _record_duration(upload)
+
+        if upload.on_success is not None:
+            upload.on_success()
+
+
+def send_concurrently(uploads, metrics, pool, timeout=None, timeouts=None):
+    """Sends the payloads concurrently from the pool of worker threads,
+    and waits for them to complete. Internal metrics recorded while
+    sending are merged into metrics.
+
+    The time allowed for each payload to be sent is looked up by the
+    name of the endpoint in timeouts, defaulting to timeout, and is
+    measured from when the payloads were handed to the pool. A payload
+    which is still being sent when its time is up is given up on and
+    treated as being in flight, so its data is not retained for a
+    subsequent harvest. Its internal metrics are merged by a later call
+    once it completes. A payload which the pool never got to is not
+    sent, and is treated as having failed with a recoverable error so
+    its data is retained.
+
+    Once all payloads have been dealt with, the first exception raised
+    when sending a payload, in the order the payloads were supplied, is
+    re-raised.
+
+    """
+
+    pool.merge_abandoned(metrics)
+
+    start = time.time()
+
+    for upload in uploads:
+        if upload.send is not None:
+            pool.submit(upload)
+
+    exc_info = None
+
+    for upload in uploads:
+        if upload.send is not None:
+            upload_timeout = (timeouts or {}).get(upload.method, timeout)
+
+            if upload_timeout is None:
+                upload.done.wait()
+            else:
+                upload.done.wait(max(start + upload_timeout - time.time(), 0.0))
+
+            if not upload.done.is_set():
+                internal_count_metric("Supportability/Python/Harvest/Upload/%s/Timeout" % upload.method, 1)
+
+                if upload.cancel():
+                    _logger.debug(
+                        "Timed out after %.2f seconds before %r data could be sent to the data collector.",
+                        upload_timeout,
+                        upload.method,
+                    )
+
+                    try:
+                        raise RetryDataForRequest("Timed out before %r data could be sent." % upload.method)
+                    except RetryDataForRequest:
+                        exc_info = exc_info or sys.exc_info()
+
+                    continue
+
+                if upload.abandon():
+                    _logger.debug(
+                        "Timed out after %.2f seconds waiting for %r data to be sent to the data collector.",
+                        upload_timeout,
+                        upload.method,
+                    )
+
+                    pool.abandon(upload)
+
+                    if upload.on_success is not None:
+                        upload.on_success()
+
+                    continue
+
+                # The upload completed after the wait timed out but
+                # before it could be abandoned.
+
+                upload.done.wait()
+
+            metrics.merge_metrics(upload.metrics.metrics())
+
+            _record_duration(upload)
+
+            if upload.exc_info is not None:
+                exc_info = exc_info or upload.exc_info
+                continue
+
+        if upload.on_success is not None:
+            upload.on_success()
+
+    if exc_info is not None:
+        six.reraise(*exc_info)
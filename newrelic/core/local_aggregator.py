@@ -0,0 +1,249 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements aggregation of the data reported by the worker
+processes of a pre-fork web server in a single daemon process on the host.
+Rather than sending harvest payloads to the data collector, each worker
+sends them over a Unix domain socket to the daemon, which merges them into
+the data for its own harvest and performs a single upload.
+
+"""
+
+import errno
+import logging
+import os
+import socket
+import struct
+import threading
+import zlib
+
+from newrelic.common.encoding_utils import json_decode, json_encode
+
+_logger = logging.getLogger(__name__)
+
+_MESSAGE_HEADER = struct.Struct(">I")
+
+# Limits on the size of a message, before and after it is decompressed,
+# so a misbehaving client can't exhaust the memory of the daemon.
+
+_MAXIMUM_MESSAGE_SIZE = 16 * 1024 * 1024
+_MAXIMUM_DECOMPRESSED_SIZE = 128 * 1024 * 1024
+
+_ACCEPTED = b"\x01"
+_REJECTED = b"\x00"
+
+
+class AggregatorUnavailable(Exception):
+    pass
+
+
+def _encode_message(message):
+    data = zlib.compress(json_encode(message).encode("utf-8"))
+    return _MESSAGE_HEADER.pack(len(data)) + data
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+
+    while size:
+        chunk = sock.recv(min(size, 64 * 1024))
+
+        if not chunk:
+            raise AggregatorUnavailable("Connection closed before the message was received.")
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _read_message(sock):
+    (size,) = _MESSAGE_HEADER.unpack(_recv_exactly(sock, _MESSAGE_HEADER.size))
+
+    if size > _MAXIMUM_MESSAGE_SIZE:
+        raise ValueError("Message of %d bytes exceeds the maximum message size." % size)
+
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(_recv_exactly(sock, size), _MAXIMUM_DECOMPRESSED_SIZE)
+
+    if decompressor.unconsumed_tail:
+        raise ValueError("Message exceeds the maximum decompressed message size.")
+
+    return json_decode(data.decode("utf-8"))
+
+
+class AggregatorClient(object):
+
+    """Sends payloads for the named application to the local aggregator
+    listening on the Unix domain socket at path.
+
+    """
+
+    timeout = 5.0
+
+    def __init__(self, path, app_name, linked_applications=()):
+        self.path = path
+        self.app_name = app_name
+        self.linked_applications = list(linked_applications)
+
+    def send(self, method, payload):
+        """Sends the payload, raising AggregatorUnavailable if it was not
+        accepted by the local aggregator.
+
+        """
+
+        message = {
+            "app_name": self.app_name,
+            "linked_applications": self.linked_applications,
+            "method": method,
+            "payload": payload,
+        }
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+
+        try:
+            sock.connect(self.path)
+            sock.sendall(_encode_message(message))
+            response = sock.recv(1)
+
+        except (socket.error, socket.timeout) as exc:
+            raise AggregatorUnavailable(str(exc))
+
+        finally:
+            sock.close()
+
+        if response != _ACCEPTED:
+            raise AggregatorUnavailable("The %r data was not accepted." % method)
+
+
+class LocalAggregator(object):
+
+    """Listens on the Unix domain socket at path for payloads sent from
+    worker processes, merging each into the data of the application of
+    the same name in this process. The socket is only accessible to the
+    user the daemon runs as.
+
+    Only payloads for the applications configured for the daemon are
+    accepted, with applications mapping each application name to its
+    linked applications. Applications are activated on first use, with
+    payloads being rejected until the application has been registered
+    with the data collector, in which case the worker process reports
+    the data itself.
+
+    """
+
+    def __init__(self, path, agent, applications):
+        self.path = path
+        self.agent = agent
+        self.applications = dict(applications)
+
+        self._socket = None
+        self._thread = None
+
+    def start(self):
+        try:
+            os.unlink(self.path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+
+        # No connections are accepted until listening, so access is
+        # restricted before then.
+
+        os.chmod(self.path, 0o600)
+
+        sock.listen(128)
+
+        self._socket = sock
+
+        self._thread = threading.Thread(target=self._run, name="NR-Local-Aggregator")
+        self._thread.daemon = True
+        self._thread.start()
+
+        _logger.info("Local aggregator listening on %r.", self.path)
+
+    def _run(self):
+        sock = self._socket
+
+        while True:
+            try:
+                connection, _ = sock.accept()
+            except (socket.error, OSError):
+                # The socket has been closed on shutdown.
+
+                return
+
+            try:
+                connection.settimeout(AggregatorClient.timeout)
+                message = _read_message(connection)
+
+                accepted = self.merge(message)
+
+                connection.sendall(_ACCEPTED if accepted else _REJECTED)
+
+            except Exception:
+                _logger.debug("Unable to handle message sent to the local aggregator.", exc_info=True)
+
+            finally:
+                connection.close()
+
+    def merge(self, message):
+        """Merges the payload in the message into the data for the next
+        harvest of the application. Returns whether the payload was
+        merged.
+
+        """
+
+        app_name = message["app_name"]
+
+        if app_name not in self.applications:
+            _logger.debug("Rejected %r data for the unconfigured application %r.", message["method"], app_name)
+            return False
+
+        application = self.agent.application(app_name)
+
+        if application is None:
+            self.agent.activate_application(app_name, self.applications[app_name])
+            application = self.agent.application(app_name)
+
+        if application is None:
+            return False
+
+        return application.merge_forwarded_payload(message["method"], message["payload"])
+
+    def stop(self):
+        sock, self._socket = self._socket, None
+
+        if sock is None:
+            return
+
+        # Shutting down the socket interrupts the pending accept.
+
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+
+        sock.close()
+
+        self._thread.join(AggregatorClient.timeout)
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
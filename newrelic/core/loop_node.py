@@ -25,6 +25,8 @@ _LoopNode = namedtuple('_LoopNode',
 
 class LoopNode(_LoopNode, GenericNodeMixin):
 
+    __slots__ = ()
+
     @property
     def exclusive(self):
         return self.duration
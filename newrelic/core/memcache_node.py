@@ -26,6 +26,8 @@ _MemcacheNode = namedtuple('_MemcacheNode',
 
 class MemcacheNode(_MemcacheNode, GenericNodeMixin):
 
+    __slots__ = ()
+
     @property
     def name(self):
         return 'Memcache/%s' % self.command
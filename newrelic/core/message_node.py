@@ -28,6 +28,8 @@ _MessageNode = namedtuple('_MessageNode',
 
 class MessageNode(_MessageNode, GenericNodeMixin):
 
+    __slots__ = ()
+
     @property
     def name(self):
         name = 'MessageBroker/%s/%s/%s/Named/%s' % (self.library,
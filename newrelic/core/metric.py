@@ -21,3 +21,11 @@ ApdexMetric = namedtuple('ApdexMetric',
 
 TimeMetric = namedtuple('TimeMetric',
         ['name', 'scope', 'duration', 'exclusive'])
+
+# Time metric standing in for a number of calls which have already been
+# aggregated, such as for coalesced database statements. The duration and
+# exclusive time are the totals across all the calls.
+
+AggregateTimeMetric = namedtuple('AggregateTimeMetric',
+        ['name', 'scope', 'duration', 'exclusive', 'call_count',
+        'min_call_time', 'max_call_time', 'sum_of_squares'])
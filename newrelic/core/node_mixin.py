@@ -19,12 +19,14 @@ from newrelic.core.attribute_filter import (DST_SPAN_EVENTS,
 
 
 class GenericNodeMixin(object):
+    # Nodes hold no state other than their fields, so don't need the
+    # dictionary which instances would otherwise have.
+
+    __slots__ = ()
+
     @property
     def processed_user_attributes(self):
-        if hasattr(self, '_processed_user_attributes'):
-            return self._processed_user_attributes
-
-        self._processed_user_attributes = u_attrs = {}
+        u_attrs = {}
         user_attributes = getattr(self, 'user_attributes', u_attrs)
         for k, v in user_attributes.items():
             k, v = attribute.process_user_attribute(k, v)
@@ -97,9 +99,19 @@ class GenericNodeMixin(object):
                     attr_class=attr_class):
                 yield event
 
+    def span_event_count(self):
+        """Returns the number of span events which would be generated
+        by span_events() without constructing them.
+
+        """
+
+        return 1 + sum(child.span_event_count() for child in self.children)
+
 
 class DatastoreNodeMixin(GenericNodeMixin):
 
+    __slots__ = ()
+
     @property
     def name(self):
         product = self.product
@@ -116,15 +128,11 @@ class DatastoreNodeMixin(GenericNodeMixin):
 
     @property
     def db_instance(self):
-        if hasattr(self, '_db_instance'):
-            return self._db_instance
-
         db_instance_attr = None
         if self.database_name:
             _, db_instance_attr = attribute.process_user_attribute(
                     'db.instance', self.database_name)
 
-        self._db_instance = db_instance_attr
         return db_instance_attr
 
     def span_event(self, *args, **kwargs):
@@ -0,0 +1,336 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements a bounded spool on disk for payloads which could
+not be sent to the data collector because it was unreachable. Payloads are
+appended compressed to segment files and are replayed, oldest first, once
+the data collector can be reached again. This caps the growth of data held
+in memory during an extended outage.
+
+"""
+
+import errno
+import logging
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from newrelic.common.encoding_utils import json_decode, json_encode
+from newrelic.core.internal_metrics import internal_count_metric
+from newrelic.network.exceptions import DiscardDataForRequest, RetryDataForRequest
+
+_logger = logging.getLogger(__name__)
+
+# Each record is the length of the method name and of the compressed
+# payload, followed by the method name and the compressed payload.
+
+_RECORD_HEADER = struct.Struct(">HI")
+
+# Segment files are never opened through a symbolic link, and are only
+# ever created, never reused, when a new segment is started.
+
+_O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+class PayloadSpool(object):
+
+    """Spools payloads to segment files in directory. Segment files are
+    only ever appended to, with a new segment being started once the
+    current one reaches segment_size. Once the total size of the segment
+    files would exceed max_size, the oldest segment is discarded. Segment
+    files are specific to the process which wrote them, so a forked
+    process starts with an empty spool.
+
+    Where no directory is given, a private directory is created for the
+    spool in the temporary directory. A directory which is given must be
+    owned by the current user and not writable by any other user, as the
+    payloads can hold SQL and attributes of the application.
+
+    Once sending a payload fails, further payloads are spooled without
+    attempting to send them until a backoff period has passed. The
+    backoff period doubles with each successive failure.
+
+    """
+
+    initial_backoff = 15.0
+    maximum_backoff = 300.0
+    replay_limit = 50
+
+    def __init__(self, directory, name, max_size=64 * 1024 * 1024, segment_size=1024 * 1024):
+        self.directory = directory
+        self.name = name
+        self.max_size = max_size
+        self.segment_size = segment_size
+
+        self._lock = threading.Lock()
+        self._process_id = os.getpid()
+        self._private_directory = directory is None
+
+        # Each segment is held as [path, size, number of records], oldest
+        # first, with offset being the position up to which the oldest
+        # segment has been replayed.
+
+        self._segments = []
+        self._sequence = 0
+        self._offset = 0
+        self._replayed = 0
+        self._size = 0
+
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+
+    @property
+    def pending(self):
+        return bool(self._segments) and self._process_id == os.getpid()
+
+    def deferring(self):
+        """Returns whether payloads should be spooled without attempting
+        to send them, as sending recently failed.
+
+        """
+
+        return time.time() < self._next_attempt
+
+    def failed(self):
+        with self._lock:
+            self._backoff = min(max(self._backoff * 2, self.initial_backoff), self.maximum_backoff)
+            self._next_attempt = time.time() + self._backoff
+
+    def succeeded(self):
+        with self._lock:
+            self._backoff = 0.0
+            self._next_attempt = 0.0
+
+    def _check_process(self):
+        if self._process_id != os.getpid():
+            self._segments = []
+            self._sequence = 0
+            self._offset = 0
+            self._replayed = 0
+            self._size = 0
+            self._process_id = os.getpid()
+
+    def _check_directory(self):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="newrelic-spool-")
+            return
+
+        try:
+            os.makedirs(self.directory, 0o700)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        info = os.lstat(self.directory)
+
+        if not stat.S_ISDIR(info.st_mode):
+            raise OSError(errno.ENOTDIR, "The spool directory is not a directory.", self.directory)
+
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            raise OSError(errno.EPERM, "The spool directory is owned by another user.", self.directory)
+
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise OSError(errno.EPERM, "The spool directory is writable by other users.", self.directory)
+
+    def _new_segment(self):
+        if not self._segments:
+            self._check_directory()
+
+        self._sequence += 1
+
+        path = os.path.join(self.directory, "%s-%d-%08d.spool" % (self.name, self._process_id, self._sequence))
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_NOFOLLOW | _O_BINARY, 0o600)
+        os.close(fd)
+
+        self._segments.append([path, 0, 0])
+
+    def _remove_oldest(self):
+        path, size, records = self._segments.pop(0)
+
+        dropped = records - self._replayed
+
+        self._offset = 0
+        self._replayed = 0
+        self._size -= size
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+        return dropped
+
+    def append(self, method, payload):
+        """Appends the payload for method to the spool. Returns whether
+        the payload was spooled.
+
+        """
+
+        data = zlib.compress(json_encode(payload).encode("utf-8"))
+        method_bytes = method.encode("utf-8")
+
+        record = _RECORD_HEADER.pack(len(method_bytes), len(data)) + method_bytes + data
+
+        if len(record) > self.max_size:
+            return False
+
+        dropped = 0
+
+        with self._lock:
+            self._check_process()
+
+            while self._segments and self._size + len(record) > self.max_size:
+                dropped += self._remove_oldest()
+
+            try:
+                if not self._segments or self._segments[-1][1] >= self.segment_size:
+                    self._new_segment()
+
+                segment = self._segments[-1]
+
+                fd = os.open(segment[0], os.O_WRONLY | os.O_APPEND | _O_NOFOLLOW | _O_BINARY)
+
+                with os.fdopen(fd, "ab") as fp:
+                    fp.write(record)
+
+            except (IOError, OSError):
+                _logger.debug("Unable to write %r data to the spool in %r.", method, self.directory, exc_info=True)
+                return False
+
+            segment[1] += len(record)
+            segment[2] += 1
+            self._size += len(record)
+
+        if dropped:
+            internal_count_metric("Supportability/Python/Harvest/Spool/Dropped", dropped)
+
+        internal_count_metric("Supportability/Python/Harvest/Spool/Spooled", 1)
+
+        return True
+
+    def _next_record(self):
+        path, size, _ = self._segments[0]
+
+        with os.fdopen(os.open(path, os.O_RDONLY | _O_NOFOLLOW | _O_BINARY), "rb") as fp:
+            if size <= self._offset:
+                return None
+
+            buf = mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ)
+
+            try:
+                method_length, data_length = _RECORD_HEADER.unpack_from(buf, self._offset)
+                start = self._offset + _RECORD_HEADER.size
+                end = start + method_length + data_length
+
+                method = buf[start : start + method_length].decode("utf-8")
+                data = buf[start + method_length : end]
+
+            finally:
+                buf.close()
+
+        return path, end, method, json_decode(zlib.decompress(data).decode("utf-8"))
+
+    def _advance(self, path, end):
+        # The segment may have been discarded to make room while the
+        # record was being replayed.
+
+        if not self._segments or self._segments[0][0] != path:
+            return
+
+        self._offset = end
+        self._replayed += 1
+
+        if self._offset >= self._segments[0][1]:
+            self._remove_oldest()
+
+    def replay(self, send, limit=None):
+        """Replays up to limit spooled payloads, oldest first, by calling
+        send with the method and payload for each. Replaying stops should
+        sending fail with a recoverable error, with the backoff period
+        being started again. Returns the number of payloads replayed.
+
+        """
+
+        limit = self.replay_limit if limit is None else limit
+
+        replayed = 0
+        discarded = 0
+
+        while replayed + discarded < limit:
+            with self._lock:
+                self._check_process()
+
+                if not self._segments:
+                    break
+
+                try:
+                    record = self._next_record()
+                except Exception:
+                    # A segment which can't be read is discarded, rather
+                    # than blocking replay of those after it.
+
+                    _logger.debug("Unable to read spooled data from %r.", self._segments[0][0], exc_info=True)
+                    discarded += self._remove_oldest()
+                    continue
+
+            if record is None:
+                break
+
+            path, end, method, payload = record
+
+            try:
+                send(method, payload)
+                replayed += 1
+
+            except RetryDataForRequest:
+                self.failed()
+                break
+
+            except DiscardDataForRequest:
+                discarded += 1
+
+            with self._lock:
+                self._advance(path, end)
+
+        if replayed:
+            internal_count_metric("Supportability/Python/Harvest/Spool/Replayed", replayed)
+
+        if discarded:
+            internal_count_metric("Supportability/Python/Harvest/Spool/Dropped", discarded)
+
+        return replayed
+
+    def close(self):
+        """Discards any payloads remaining in the spool."""
+
+        with self._lock:
+            self._check_process()
+
+            while self._segments:
+                self._remove_oldest()
+
+            if self._private_directory and self.directory is not None:
+                try:
+                    os.rmdir(self.directory)
+                except OSError:
+                    pass
+
+                self.directory = None
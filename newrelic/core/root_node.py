@@ -27,6 +27,9 @@ _RootNode = namedtuple('_RootNode',
 
 
 class RootNode(_RootNode, GenericNodeMixin):
+
+    __slots__ = ()
+
     def span_event(self, *args, **kwargs):
         span = super(RootNode, self).span_event(*args, **kwargs)
         i_attrs = span[0]
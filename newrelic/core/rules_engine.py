@@ -13,8 +13,9 @@
 # limitations under the License.
 
 import re
+import threading
 
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 
 _NormalizationRule = namedtuple('_NormalizationRule',
         ['match_expression', 'replacement', 'ignore', 'eval_order',
@@ -36,8 +37,29 @@ class NormalizationRule(_NormalizationRule):
 
 
 class RulesEngine(object):
+    """Applies normalization rules from the data collector to names.
 
-    def __init__(self, rules):
+    Where cache_size is non zero, the result of normalizing a name is
+    remembered in a least recently used cache of that size, as the same
+    names are normalized over and over. The rules for an engine never
+    change, with a new engine being created when rules are received on
+    reconnecting to the data collector, so the cache never needs to be
+    invalidated.
+
+    Where fuse_rules is true, each run of consecutive rules which are
+    not applied to each segment is combined into a single regular
+    expression. This is used to check in one pass whether any rule in
+    the run could match, with the rules only being applied individually
+    when one does.
+
+    """
+
+    # Backreferences within a pattern would refer to the wrong group
+    # once combined with other patterns, so such rules are never fused.
+
+    BACKREFERENCE_RE = re.compile(r'\\[1-9]|\(\?P=')
+
+    def __init__(self, rules, cache_size=0, fuse_rules=False):
         self.__rules = []
 
         for rule in rules:
@@ -49,10 +71,64 @@ class RulesEngine(object):
 
         self.__rules = sorted(self.__rules, key=lambda rule: rule.eval_order)
 
+        self.__passes = fuse_rules and self._fuse_rules(self.__rules) or None
+
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     @property
     def rules(self):
         return self.__rules
 
+    @classmethod
+    def _fuse_rules(cls, rules):
+        # Returns a list of passes, each being a list of rules along with
+        # a single regular expression to check first whether any of the
+        # rules match, or None when the rules must always be applied.
+
+        passes = []
+        run = []
+
+        def _add_run():
+            if len(run) > 1:
+                try:
+                    pattern = u'|'.join(u'(?:%s)' % rule.match_expression for rule in run)
+                    passes.append((re.compile(pattern, re.IGNORECASE), list(run)))
+                except re.error:
+                    passes.extend((None, [rule]) for rule in run)
+            else:
+                passes.extend((None, [rule]) for rule in run)
+            del run[:]
+
+        for rule in rules:
+            if rule.each_segment or cls.BACKREFERENCE_RE.search(rule.match_expression):
+                _add_run()
+                passes.append((None, [rule]))
+            else:
+                run.append(rule)
+
+        _add_run()
+
+        return passes
+
+    def harvest_counts(self):
+        """Returns the number of cache hits and misses since the last
+        call, resetting the counts.
+
+        """
+
+        with self._cache_lock:
+            counts = (self.cache_hits, self.cache_misses)
+            self.cache_hits = 0
+            self.cache_misses = 0
+
+        return counts
+
     def normalize(self, string):
         # URLs are supposed to be ASCII but can get a
         # URL with illegal non ASCII characters. As the
@@ -66,44 +142,80 @@ class RulesEngine(object):
         if isinstance(string, bytes):
             string = string.decode('Latin-1')
 
+        if not self.__rules:
+            return (string, False)
+
+        if not self.cache_size:
+            return self._normalize(string)
+
+        cache = self._cache
+
+        with self._cache_lock:
+            result = cache.pop(string, None)
+            if result is not None:
+                cache[string] = result
+                self.cache_hits += 1
+                return result
+            self.cache_misses += 1
+
+        result = self._normalize(string)
+
+        with self._cache_lock:
+            cache[string] = result
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+        return result
+
+    def _normalize(self, string):
         final_string = string
         ignore = False
-        for rule in self.__rules:
-            if rule.each_segment:
-                matched = False
-
-                segments = final_string.split('/')
-
-                # FIXME This fiddle is to skip leading segment
-                # when splitting on '/' where it is empty.
-                # Should the rule just be to skip any empty
-                # segment when matching keeping it as empty
-                # but not matched. Wouldn't then have to treat
-                # this as special.
-
-                if segments and not segments[0]:
-                    rule_segments = ['']
-                    segments = segments[1:]
-                else:
-                    rule_segments = []
 
-                for segment in segments:
-                    rule_segment, match_count = rule.apply(segment)
-                    matched = matched or (match_count > 0)
-                    rule_segments.append(rule_segment)
+        if self.__passes is None:
+            passes = ((None, self.__rules),)
+        else:
+            passes = self.__passes
+
+        for match_any_re, rules in passes:
+            if match_any_re is not None and not match_any_re.search(final_string):
+                continue
+
+            for rule in rules:
+                if rule.each_segment:
+                    matched = False
+
+                    segments = final_string.split('/')
+
+                    # FIXME This fiddle is to skip leading segment
+                    # when splitting on '/' where it is empty.
+                    # Should the rule just be to skip any empty
+                    # segment when matching keeping it as empty
+                    # but not matched. Wouldn't then have to treat
+                    # this as special.
+
+                    if segments and not segments[0]:
+                        rule_segments = ['']
+                        segments = segments[1:]
+                    else:
+                        rule_segments = []
+
+                    for segment in segments:
+                        rule_segment, match_count = rule.apply(segment)
+                        matched = matched or (match_count > 0)
+                        rule_segments.append(rule_segment)
+
+                    if matched:
+                        final_string = '/'.join(rule_segments)
+                else:
+                    rule_string, match_count = rule.apply(final_string)
+                    matched = match_count > 0
+                    final_string = rule_string
 
                 if matched:
-                    final_string = '/'.join(rule_segments)
-            else:
-                rule_string, match_count = rule.apply(final_string)
-                matched = match_count > 0
-                final_string = rule_string
-
-            if matched:
-                ignore = ignore or rule.ignore
+                    ignore = ignore or rule.ignore
 
-            if matched and rule.terminate_chain:
-                break
+                if matched and rule.terminate_chain:
+                    return (final_string, ignore)
 
         return (final_string, ignore)
 
@@ -27,6 +27,8 @@ _SolrNode = namedtuple('_SolrNode',
 
 class SolrNode(_SolrNode, GenericNodeMixin):
 
+    __slots__ = ()
+
     @property
     def name(self):
         return 'SolrClient/%s/%s' % (self.library, self.command)
@@ -28,7 +28,8 @@ import sys
 import time
 import warnings
 import zlib
-from heapq import heapify, heapreplace
+from array import array
+from heapq import heapify, heapreplace, nlargest
 
 import newrelic.packages.six as six
 from newrelic.api.settings import STRIP_EXCEPTION_MESSAGE
@@ -40,7 +41,8 @@ from newrelic.core.attribute_filter import DST_ERROR_COLLECTOR
 from newrelic.core.config import is_expected_error, should_ignore_error
 from newrelic.core.database_utils import explain_plan
 from newrelic.core.error_collector import TracedError
-from newrelic.core.metric import TimeMetric
+from newrelic.core.internal_metrics import internal_count_metric
+from newrelic.core.metric import AggregateTimeMetric, TimeMetric
 from newrelic.core.stack_trace import exception_stack
 
 _logger = logging.getLogger(__name__)
@@ -55,6 +57,37 @@ EVENT_HARVEST_METHODS = {
     "error_event_data": ("reset_error_events",),
 }
 
+# Maps the methods used to reset each of the event data sets to the
+# attribute of the stats engine holding the data set.
+
+EVENT_DATA_SETS = {
+    "reset_transaction_events": "_transaction_events",
+    "reset_synthetics_events": "_synthetics_events",
+    "reset_span_events": "_span_events",
+    "reset_custom_events": "_custom_events",
+    "reset_error_events": "_error_events",
+}
+
+# The event data sets into which the events in payloads for these methods
+# are merged when forwarded from another process.
+
+FORWARDED_EVENT_DATA_SETS = {
+    "analytic_event_data": "_transaction_events",
+    "custom_event_data": "_custom_events",
+    "error_event_data": "_error_events",
+    "span_event_data": "_span_events",
+}
+
+# Metrics counting the events seen and sent, which are not merged in from
+# forwarded metric data as they are recorded again when the merged events
+# are sent.
+
+FORWARDED_EVENT_METRIC_PREFIXES = (
+    "Supportability/Events/",
+    "Supportability/SpanEvent/",
+    "Supportability/Python/RequestSampler/",
+)
+
 
 def c2t(count=0, total=0.0, min=0.0, max=0.0, sum_of_squares=0.0):
     return (count, total, total, min, max, sum_of_squares)
@@ -170,6 +203,17 @@ class TimeStats(list):
         self.merge_raw_time_metric(value)
 
 
+def _aggregate_time_stats(metric):
+    return TimeStats(
+        call_count=metric.call_count,
+        total_call_time=metric.duration,
+        total_exclusive_call_time=metric.exclusive,
+        min_call_time=metric.min_call_time,
+        max_call_time=metric.max_call_time,
+        sum_of_squares=metric.sum_of_squares,
+    )
+
+
 class CountStats(TimeStats):
     def merge_stats(self, other):
         self[0] += other[0]
@@ -178,6 +222,318 @@ class CountStats(TimeStats):
         pass
 
 
+# Kinds of metric held in a row of the compact metric table. The kind
+# determines how data is merged into the row, mirroring the merge rules
+# of the respective stats classes.
+
+METRIC_TIME = 0
+METRIC_COUNT = 1
+METRIC_APDEX = 2
+
+_METRIC_KIND_TYPES = {
+    METRIC_TIME: TimeStats,
+    METRIC_COUNT: CountStats,
+    METRIC_APDEX: ApdexStats,
+}
+
+
+def _metric_kind(stats):
+    if isinstance(stats, MetricRow):
+        return stats._table._kinds[stats._index]
+    elif isinstance(stats, ApdexStats):
+        return METRIC_APDEX
+    elif isinstance(stats, CountStats):
+        return METRIC_COUNT
+    return METRIC_TIME
+
+
+def _integral(value):
+    try:
+        if value == int(value):
+            return int(value)
+    except (OverflowError, ValueError):
+        pass
+    return value
+
+
+class MetricRow(object):
+
+    """Live view onto a single metric held by a compact metric table.
+    Provides the same merge methods and accessors as the stats classes
+    so it can be used in their place by the stats engine, but all data
+    is read from and written to the columns of the table.
+
+    """
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __len__(self):
+        return 6
+
+    def __iter__(self):
+        return iter(self._table.values_at(self._index))
+
+    def __getitem__(self, item):
+        return self._table.values_at(self._index)[item]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._table.values_at(self._index))
+
+    def __copy__(self):
+        return self._table.stats_at(self._index)
+
+    @property
+    def call_count(self):
+        return _integral(self._table.call_count[self._index])
+
+    @property
+    def total_call_time(self):
+        return self._table.total_call_time[self._index]
+
+    @property
+    def total_exclusive_call_time(self):
+        return self._table.total_exclusive_call_time[self._index]
+
+    @property
+    def min_call_time(self):
+        return self._table.min_call_time[self._index]
+
+    @property
+    def max_call_time(self):
+        return self._table.max_call_time[self._index]
+
+    @property
+    def sum_of_squares(self):
+        return self._table.sum_of_squares[self._index]
+
+    satisfying = call_count
+
+    @property
+    def tolerating(self):
+        return _integral(self._table.total_call_time[self._index])
+
+    @property
+    def frustrating(self):
+        return _integral(self._table.total_exclusive_call_time[self._index])
+
+    def merge_stats(self, other):
+        """Merge data from an instance of one of the stats classes."""
+
+        self._table.merge_values(self._index, other)
+
+    def merge_raw_time_metric(self, duration, exclusive=None):
+        """Merge time value."""
+
+        self._table.merge_raw_time_metric(self._index, duration, exclusive)
+
+    def merge_time_metric(self, metric):
+        """Merge data from a time metric object."""
+
+        self._table.merge_raw_time_metric(self._index, metric.duration, metric.exclusive)
+
+    def merge_custom_metric(self, value):
+        """Merge data value."""
+
+        self._table.merge_raw_time_metric(self._index, value)
+
+    def merge_apdex_metric(self, metric):
+        """Merge data from an apdex metric object."""
+
+        self._table.merge_values(
+            self._index, (metric.satisfying, metric.tolerating, metric.frustrating, metric.apdex_t, metric.apdex_t, 0)
+        )
+
+
+class CompactMetricTable(object):
+
+    """Columnar replacement for the dictionary of stats objects used by
+    the stats engine as the metric stats table. Each distinct metric key
+    of (name, scope) is interned into an integer ID which indexes a set
+    of parallel arrays of doubles, one per field of the metric data. This
+    avoids the overhead of a list of six boxed values for every metric.
+
+    The table supports the subset of the mapping protocol used by the
+    stats engine and test validators. Looking up a key returns a live
+    view of the metric whereas iterating over the items returns detached
+    stats objects, which is what is required when the metric data is
+    being reported or merged into another table.
+
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._keys = []
+        self._kinds = array("b")
+        self.call_count = array("d")
+        self.total_call_time = array("d")
+        self.total_exclusive_call_time = array("d")
+        self.min_call_time = array("d")
+        self.max_call_time = array("d")
+        self.sum_of_squares = array("d")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __getitem__(self, key):
+        return MetricRow(self, self._index[key])
+
+    def __setitem__(self, key, stats):
+        index = self._index.get(key)
+        if index is None:
+            index = self._intern(key, _metric_kind(stats))
+        else:
+            self._kinds[index] = _metric_kind(stats)
+        self.set_values(index, stats)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        if index is None:
+            return default
+        return MetricRow(self, index)
+
+    def keys(self):
+        return list(self._keys)
+
+    def iteritems(self):
+        for index, key in enumerate(self._keys):
+            yield key, self.stats_at(index)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def _intern(self, key, kind):
+        index = len(self._keys)
+        self._index[key] = index
+        self._keys.append(key)
+        self._kinds.append(kind)
+        self.call_count.append(0.0)
+        self.total_call_time.append(0.0)
+        self.total_exclusive_call_time.append(0.0)
+        self.min_call_time.append(0.0)
+        self.max_call_time.append(0.0)
+        self.sum_of_squares.append(0.0)
+        return index
+
+    def values_at(self, index):
+        values = [
+            self.call_count[index],
+            self.total_call_time[index],
+            self.total_exclusive_call_time[index],
+            self.min_call_time[index],
+            self.max_call_time[index],
+            self.sum_of_squares[index],
+        ]
+
+        # Counts are held as doubles in the table so restore them to
+        # integers where they were originally recorded as such.
+
+        values[0] = _integral(values[0])
+        if self._kinds[index] == METRIC_APDEX:
+            values[1] = _integral(values[1])
+            values[2] = _integral(values[2])
+            values[5] = _integral(values[5])
+
+        return values
+
+    def stats_at(self, index):
+        stats = _METRIC_KIND_TYPES[self._kinds[index]]()
+        stats[:] = self.values_at(index)
+        return stats
+
+    def set_values(self, index, values):
+        self.call_count[index] = values[0]
+        self.total_call_time[index] = values[1]
+        self.total_exclusive_call_time[index] = values[2]
+        self.min_call_time[index] = values[3]
+        self.max_call_time[index] = values[4]
+        self.sum_of_squares[index] = values[5]
+
+    def merge_values(self, index, other):
+        """Merge the six values of a metric into the row, applying the
+        merge rules for the kind of metric held in the row.
+
+        """
+
+        kind = self._kinds[index]
+
+        if kind == METRIC_COUNT:
+            self.call_count[index] += other[0]
+
+        elif kind == METRIC_APDEX:
+            self.call_count[index] += other[0]
+            self.total_call_time[index] += other[1]
+            self.total_exclusive_call_time[index] += other[2]
+
+            self.min_call_time[index] = (
+                (self.call_count[index] or self.total_call_time[index] or self.total_exclusive_call_time[index])
+                and min(self.min_call_time[index], other[3])
+                or other[3]
+            )
+            self.max_call_time[index] = max(self.max_call_time[index], other[3])
+
+        else:
+            count = self.call_count[index]
+
+            self.total_call_time[index] += other[1]
+            self.total_exclusive_call_time[index] += other[2]
+            self.min_call_time[index] = count and min(self.min_call_time[index], other[3]) or other[3]
+            self.max_call_time[index] = max(self.max_call_time[index], other[4])
+            self.sum_of_squares[index] += other[5]
+            self.call_count[index] = count + other[0]
+
+    def merge_raw_time_metric(self, index, duration, exclusive=None):
+        if self._kinds[index] == METRIC_COUNT:
+            return
+
+        if exclusive is None:
+            exclusive = duration
+
+        count = self.call_count[index]
+
+        self.total_call_time[index] += duration
+        self.total_exclusive_call_time[index] += exclusive
+        self.min_call_time[index] = count and min(self.min_call_time[index], duration) or duration
+        self.max_call_time[index] = max(self.max_call_time[index], duration)
+        self.sum_of_squares[index] += duration ** 2
+        self.call_count[index] = count + 1
+
+    def merge_table(self, other):
+        """Merge all metrics from another compact metric table."""
+
+        for other_index, key in enumerate(other._keys):
+            values = (
+                other.call_count[other_index],
+                other.total_call_time[other_index],
+                other.total_exclusive_call_time[other_index],
+                other.min_call_time[other_index],
+                other.max_call_time[other_index],
+                other.sum_of_squares[other_index],
+            )
+
+            index = self._index.get(key)
+            if index is None:
+                index = self._intern(key, other._kinds[other_index])
+                self.set_values(index, values)
+            else:
+                self.merge_values(index, values)
+
+
 class CustomMetrics(object):
 
     """Table for collection a set of value metrics."""
@@ -216,6 +572,19 @@ class CustomMetrics(object):
 
         return six.iteritems(self.__stats_table)
 
+    def merge_metrics(self, metrics):
+        """Merges in an iterable of metric name and stats pairs, such as
+        returned by metrics() for another set of value metrics.
+
+        """
+
+        for name, other in metrics:
+            stats = self.__stats_table.get(name)
+            if stats is None:
+                self.__stats_table[name] = other
+            else:
+                stats.merge_stats(other)
+
     def reset_metric_stats(self):
         """Resets the accumulated statistics back to initial state for
         metric data.
@@ -303,11 +672,12 @@ class SampledDataSet(object):
 
     def should_sample(self, priority):
         if self.heap:
-            # self.pq[0] is always the minimal
-            # priority sample in the queue
-            if priority > self.pq[0][0]:
-                return True
-            return False
+            # self.pq[0] is always the minimal priority sample in the
+            # queue. This may be called for the data set of a parent stats
+            # engine without holding its lock, so allow for the data set
+            # having been reset in the meantime.
+            pq = self.pq
+            return not pq or priority > pq[0][0]
 
         # Always sample if under capacity
         return True
@@ -318,26 +688,62 @@ class SampledDataSet(object):
         if priority is None:
             priority = random.random()  # nosec
 
-        entry = (priority, self.num_seen, sample)
-        if self.num_seen == self.capacity:
-            self.pq.append(entry)
-            self.heap = self.heap or heapify(self.pq) or True
-        elif not self.heap:
-            self.pq.append(entry)
-        else:
-            sampled = self.should_sample(priority)
-            if not sampled:
-                return
-            heapreplace(self.pq, entry)
+        pq = self.pq
+
+        # Once the reservoir is full, anything which would not displace
+        # the minimal priority sample is rejected before creating an
+        # entry for it.
+
+        if self.heap:
+            if priority > pq[0][0]:
+                heapreplace(pq, (priority, self.num_seen, sample))
+            return
+
+        pq.append((priority, self.num_seen, sample))
+
+        if len(pq) >= self.capacity:
+            heapify(pq)
+            self.heap = True
 
     def merge(self, other_data_set):
-        for priority, seen_at, sample in other_data_set.pq:
-            self.add(sample, priority)
+        other_pq = other_data_set.pq
+        num_seen = self.num_seen
 
-        # Merge the num_seen from the other_data_set, but take care not to
-        # double-count the actual samples of other_data_set since the .add
-        # call above will add one to self.num_seen each time
-        self.num_seen += other_data_set.num_seen - other_data_set.num_samples
+        # Merge the num_seen from the other_data_set as a whole, with the
+        # samples being renumbered as if they had been added one at a
+        # time after those already in this data set.
+
+        self.num_seen += other_data_set.num_seen
+
+        if not other_pq or self.capacity <= 0:
+            return
+
+        pq = self.pq
+
+        # Where the reservoir is already full and only a few samples are
+        # being merged in, such as when merging a single transaction,
+        # they are pushed onto the heap individually. Otherwise both sets
+        # of samples are combined and those with the highest priority are
+        # selected in a single pass.
+
+        if self.heap and len(other_pq) * 8 < self.capacity:
+            for priority, _, sample in other_pq:
+                num_seen += 1
+                if priority > pq[0][0]:
+                    heapreplace(pq, (priority, num_seen, sample))
+            return
+
+        pq.extend((priority, seen_at, sample) for seen_at, (priority, _, sample) in enumerate(other_pq, num_seen + 1))
+
+        if len(pq) > self.capacity:
+            pq = nlargest(self.capacity, pq)
+            heapify(pq)
+            self.pq = pq
+            self.heap = True
+
+        elif len(pq) == self.capacity:
+            heapify(pq)
+            self.heap = True
 
 
 class LimitedDataSet(list):
@@ -424,6 +830,8 @@ class StatsEngine(object):
         self._custom_events = SampledDataSet()
         self._span_events = SampledDataSet()
         self._span_stream = None
+        self._spare_data_sets = {}
+        self._sampling_parent = None
         self.__sql_stats_table = {}
         self.__slow_transaction = None
         self.__slow_transaction_map = {}
@@ -496,8 +904,10 @@ class StatsEngine(object):
         stats = self.__stats_table.get(key)
         if stats is None:
             stats = ApdexStats(apdex_t=metric.apdex_t)
+            stats.merge_apdex_metric(metric)
             self.__stats_table[key] = stats
-        stats.merge_apdex_metric(metric)
+        else:
+            stats.merge_apdex_metric(metric)
 
         return key
 
@@ -528,7 +938,12 @@ class StatsEngine(object):
 
         key = (metric.name, metric.scope or "")
         stats = self.__stats_table.get(key)
-        if stats is None:
+        if type(metric) is AggregateTimeMetric:
+            if stats is None:
+                self.__stats_table[key] = _aggregate_time_stats(metric)
+            else:
+                stats.merge_stats(_aggregate_time_stats(metric))
+        elif stats is None:
             stats = TimeStats(
                 call_count=1,
                 total_call_time=metric.duration,
@@ -548,13 +963,51 @@ class StatsEngine(object):
         transaction, merging the data with any data from prior time
         metrics with the same name and scope.
 
+        Metrics with the same name and scope are first aggregated locally
+        so that each distinct metric only has to be merged into the stats
+        table once. Returns the number of distinct metrics merged.
+
         """
 
         if not self.__settings:
-            return
+            return 0
+
+        # Scope is forced to be empty string if None as
+        # scope of None is reserved for apdex metrics.
+
+        aggregated = {}
 
         for metric in metrics:
-            self.record_time_metric(metric)
+            key = (metric.name, metric.scope or "")
+            stats = aggregated.get(key)
+            if type(metric) is AggregateTimeMetric:
+                if stats is None:
+                    aggregated[key] = _aggregate_time_stats(metric)
+                else:
+                    stats.merge_stats(_aggregate_time_stats(metric))
+            elif stats is None:
+                duration = metric.duration
+                aggregated[key] = TimeStats(
+                    call_count=1,
+                    total_call_time=duration,
+                    total_exclusive_call_time=metric.exclusive,
+                    min_call_time=duration,
+                    max_call_time=duration,
+                    sum_of_squares=duration ** 2,
+                )
+            else:
+                stats.merge_raw_time_metric(metric.duration, metric.exclusive)
+
+        stats_table = self.__stats_table
+
+        for key, other in six.iteritems(aggregated):
+            stats = stats_table.get(key)
+            if stats is None:
+                stats_table[key] = other
+            else:
+                stats.merge_stats(other)
+
+        return len(aggregated)
 
     def record_exception(self, exc=None, value=None, tb=None, params=None, ignore_errors=None):
         # Deprecation Warning
@@ -903,7 +1356,9 @@ class StatsEngine(object):
 
         self.merge_custom_metrics(transaction.custom_metrics.metrics())
 
-        self.record_time_metrics(transaction.time_metrics(self))
+        merged = self.record_time_metrics(transaction.time_metrics(self))
+
+        internal_count_metric("Supportability/Python/RecordTransaction/TimeMetrics/Merged", merged)
 
         # Capture any errors if error collection is enabled.
         # Only retain maximum number allowed per harvest.
@@ -920,9 +1375,12 @@ class StatsEngine(object):
             self.__transaction_errors = self.__transaction_errors[: settings.agent_limits.errors_per_harvest]
 
         if error_collector.capture_events and error_collector.enabled and settings.collect_error_events:
-            events = transaction.error_events(self.__stats_table)
-            for event in events:
-                self._error_events.add(event, priority=transaction.priority)
+            if transaction.errors and not self._should_sample("_error_events", transaction.priority):
+                self._skip_events("_error_events", len(transaction.errors), "Error")
+            else:
+                events = transaction.error_events(self.__stats_table)
+                for event in events:
+                    self._error_events.add(event, priority=transaction.priority)
 
         # Capture any sql traces if transaction tracer enabled.
 
@@ -964,8 +1422,11 @@ class StatsEngine(object):
 
         elif settings.collect_analytics_events and settings.transaction_events.enabled:
 
-            event = transaction.transaction_event(self.__stats_table)
-            self._transaction_events.add(event, priority=transaction.priority)
+            if self._should_sample("_transaction_events", transaction.priority):
+                event = transaction.transaction_event(self.__stats_table)
+                self._transaction_events.add(event, priority=transaction.priority)
+            else:
+                self._skip_events("_transaction_events", 1, "Transaction")
 
         # Merge in custom events
 
@@ -979,8 +1440,37 @@ class StatsEngine(object):
                 for event in transaction.span_protos(settings):
                     self._span_stream.put(event)
             elif transaction.sampled:
-                for event in transaction.span_events(self.__settings):
-                    self._span_events.add(event, priority=transaction.priority)
+                if self._should_sample("_span_events", transaction.priority):
+                    for event in transaction.span_events(self.__settings):
+                        self._span_events.add(event, priority=transaction.priority)
+                else:
+                    self._skip_events("_span_events", transaction.span_event_count(), "Span")
+
+    def _should_sample(self, name, priority):
+        """Checks whether events with the given priority could be kept by
+        the named event data set before they are constructed. For a
+        workarea, the data set of the stats engine it will be merged
+        into is also consulted, as the workarea on its own is empty.
+
+        """
+
+        if priority is None:
+            return True
+
+        if not getattr(self, name).should_sample(priority):
+            return False
+
+        parent = self._sampling_parent
+
+        return parent is None or getattr(parent, name).should_sample(priority)
+
+    def _skip_events(self, name, count, event_type):
+        # Events which would be rejected by the data set are still counted
+        # as having been seen, but are never constructed.
+
+        getattr(self, name).num_seen += count
+
+        internal_count_metric("Supportability/Python/RecordTransaction/Events/Skipped/%s" % event_type, count)
 
     def metric_data(self, normalizer=None):
         """Returns a list containing the low level metric data for
@@ -1322,13 +1812,14 @@ class StatsEngine(object):
         """
 
         self.__settings = settings
-        self.__stats_table = {}
+        self.__stats_table = self._create_stats_table()
         self.__sql_stats_table = {}
         self.__slow_transaction = None
         self.__slow_transaction_map = {}
         self.__slow_transaction_old_duration = None
         self.__transaction_errors = []
         self.__synthetics_transactions = []
+        self._spare_data_sets = {}
 
         self.reset_transaction_events()
         self.reset_error_events()
@@ -1337,7 +1828,9 @@ class StatsEngine(object):
         self.reset_synthetics_events()
         # streams are never reset after instantiation
         if reset_stream:
-            self._span_stream = StreamBuffer(settings.infinite_tracing.span_queue_size)
+            self._span_stream = StreamBuffer(
+                settings.infinite_tracing.span_queue_size, batching=settings.infinite_tracing.batching
+            )
 
     def reset_metric_stats(self):
         """Resets the accumulated statistics back to initial state for
@@ -1345,7 +1838,18 @@ class StatsEngine(object):
 
         """
 
-        self.__stats_table = {}
+        self.__stats_table = self._create_stats_table()
+
+    def _create_stats_table(self):
+        """Returns an empty metric stats table. This is a dictionary of
+        stats objects unless use of the compact metric table is enabled.
+
+        """
+
+        if self.__settings is not None and self.__settings.stats_engine.compact_metric_table:
+            return CompactMetricTable()
+
+        return {}
 
     def reset_transaction_events(self):
         """Resets the accumulated statistics back to initial state for
@@ -1424,7 +1928,7 @@ class StatsEngine(object):
         self.__slow_transaction = None
         self.__synthetics_transactions = []
         self.__sql_stats_table = {}
-        self.__stats_table = {}
+        self.__stats_table = self._create_stats_table()
         self.__transaction_errors = []
 
     def harvest_snapshot(self, flexible=False):
@@ -1440,6 +1944,13 @@ class StatsEngine(object):
         """
         snapshot = self._snapshot()
 
+        # When double buffering is enabled, event data sets are not
+        # reset by creating new ones. Instead the data set being handed
+        # to the snapshot is swapped with a spare which was released back
+        # to the stats engine by a prior snapshot once it had been sent.
+
+        double_buffered = self.double_buffered
+
         # Data types only appear in one place, so during a snapshot it must be
         # represented in either the snapshot or in the current stats object.
         #
@@ -1465,14 +1976,45 @@ class StatsEngine(object):
         for nr_method, stats_methods in EVENT_HARVEST_METHODS.items():
             for stats_method in stats_methods:
                 if nr_method in event_harvest_whitelist:
-                    reset = getattr(whitelist_stats, stats_method)
+                    stats = whitelist_stats
                 else:
-                    reset = getattr(other_stats, stats_method)
+                    stats = other_stats
 
-                reset()
+                if double_buffered and stats is self:
+                    name = EVENT_DATA_SETS[stats_method]
+                    self._swap_data_set(name)
+                    snapshot._swapped_data_sets.add(name)
+                else:
+                    getattr(stats, stats_method)()
 
         return snapshot
 
+    @property
+    def double_buffered(self):
+        settings = self.__settings
+        return bool(
+            settings is not None
+            and settings.stats_engine.double_buffered_harvest
+            and not settings.serverless_mode.enabled
+        )
+
+    def _swap_data_set(self, name):
+        """Replaces the named event data set with an empty spare, only
+        creating a new data set if no spare of the same capacity has been
+        released back to the stats engine.
+
+        """
+
+        current = getattr(self, name)
+        spare = self._spare_data_sets.pop(name, None)
+
+        if spare is None or type(spare) is not type(current) or spare.capacity != current.capacity:
+            spare = type(current)(current.capacity)
+        else:
+            spare.reset()
+
+        setattr(self, name, spare)
+
     def create_workarea(self):
         """Creates and returns a new empty stats engine object. This would
         be used to distill stats from a single web transaction before then
@@ -1482,6 +2024,7 @@ class StatsEngine(object):
 
         stats = copy.copy(self)
         stats.reset_stats(self.__settings)
+        stats._sampling_parent = self
 
         return stats
 
@@ -1519,12 +2062,72 @@ class StatsEngine(object):
         )
 
         self.merge_metric_stats(snapshot)
+
+        if getattr(snapshot, "_swapped_data_sets", None):
+            self._rollback_data_sets(snapshot)
+            return
+
         self._merge_transaction_events(snapshot, rollback=True)
         self._merge_synthetics_events(snapshot, rollback=True)
         self._merge_error_events(snapshot)
         self._merge_custom_events(snapshot, rollback=True)
         self._merge_span_events(snapshot, rollback=True)
 
+    def _rollback_data_sets(self, snapshot):
+        """Performs the rollback of event data sets from a double buffered
+        snapshot. Data sets which were sent are already released, so only
+        those left unsent are replayed. Where the unsent data set holds
+        more samples than the one which has since been accumulating, it
+        is swapped back in and the smaller one merged into it instead.
+
+        """
+
+        for name in EVENT_DATA_SETS.values():
+            events = getattr(snapshot, name)
+
+            if events is None:
+                continue
+
+            current = getattr(self, name)
+
+            if (
+                name in snapshot._swapped_data_sets
+                and type(events) is SampledDataSet
+                and type(current) is SampledDataSet
+                and events.capacity == current.capacity
+                and events.num_samples > current.num_samples
+            ):
+                events.merge(current)
+                setattr(self, name, events)
+                setattr(snapshot, name, None)
+                snapshot._swapped_data_sets.discard(name)
+                self._spare_data_sets[name] = current
+
+            else:
+                current.merge(events)
+                snapshot._release_data_set(name)
+
+    def merge_shard(self, shard):
+        """Merges all data from a stats engine shard. A shard is a stats
+        engine which has had many transactions recorded directly into it
+        by a single thread. Unlike a transaction workarea, the shard can
+        hold many transaction events so the reservoirs are merged in the
+        same way as for a rollback.
+        """
+
+        if not self.__settings:
+            return
+
+        self.merge_metric_stats(shard)
+        self._merge_transaction_events(shard, rollback=True)
+        self._merge_synthetics_events(shard, rollback=True)
+        self._merge_error_events(shard)
+        self._merge_error_traces(shard)
+        self._merge_custom_events(shard, rollback=True)
+        self._merge_span_events(shard, rollback=True)
+        self._merge_sql(shard)
+        self._merge_traces(shard)
+
     def merge_metric_stats(self, snapshot):
         """Merges metric data from a snapshot. This is used both when merging
         data from a single transaction into the main stats engine, and for
@@ -1535,6 +2138,12 @@ class StatsEngine(object):
         if not self.__settings:
             return
 
+        if isinstance(self.__stats_table, CompactMetricTable) and isinstance(
+            snapshot.__stats_table, CompactMetricTable
+        ):
+            self.__stats_table.merge_table(snapshot.__stats_table)
+            return
+
         for key, other in six.iteritems(snapshot.__stats_table):
             stats = self.__stats_table.get(key)
             if not stats:
@@ -1551,14 +2160,16 @@ class StatsEngine(object):
         # If this is a rollback, snapshot is a copy of a previous main
         # StatsEngine, and self is still the current main StatsEngine. Then
         # we are merging multiple events, but still using the reservoir
-        # sampling that gives equal probability for keeping all events
+        # sampling that gives equal probability for keeping all events.
+        # An event skipped before being constructed leaves no sample, but
+        # must still be merged so that it is counted as having been seen.
         events = snapshot.transaction_events
         if not events:
             return
         if rollback:
             self._transaction_events.merge(events)
         else:
-            if events.num_samples == 1:
+            if events.num_samples <= 1:
                 self._transaction_events.merge(events)
 
     def _merge_synthetics_events(self, snapshot, rollback=False):
@@ -1660,24 +2271,90 @@ class StatsEngine(object):
             else:
                 stats.merge_stats(other)
 
+    def merge_forwarded_payload(self, method, payload):
+        """Merges in the metric data or events from a payload which was
+        prepared for the data collector by another process, and has been
+        forwarded by way of the local aggregator.
+
+        """
+
+        if not self.__settings:
+            return
+
+        if method == "metric_data":
+            for key, values in payload[3]:
+                key = (key["name"], key["scope"])
+
+                if key[0].startswith(FORWARDED_EVENT_METRIC_PREFIXES):
+                    continue
+
+                if key[0].startswith("Apdex"):
+                    other = ApdexStats(values[0], values[1], values[2], values[3])
+                    other[4] = values[4]
+                else:
+                    other = TimeStats(*values)
+
+                stats = self.__stats_table.get(key)
+                if not stats:
+                    self.__stats_table[key] = other
+                else:
+                    stats.merge_stats(other)
+
+            return
+
+        name = FORWARDED_EVENT_DATA_SETS.get(method)
+
+        if name is None:
+            return
+
+        sampling_info, events = payload[1], payload[2]
+        data_set = getattr(self, name)
+
+        for event in events:
+            # Synthetics events are sent along with the transaction
+            # events, but are held separately so are not sampled.
+
+            if name == "_transaction_events" and "nr.syntheticsResourceId" in event[0]:
+                self._synthetics_events.add(event)
+            else:
+                data_set.add(event, event[0].get("priority"))
+
+        # Account for the events which were seen but not sampled by the
+        # other process.
+
+        data_set.num_seen += max(sampling_info["events_seen"] - len(events), 0)
+
     def _snapshot(self):
         copy = object.__new__(StatsEngineSnapshot)
         copy.__dict__.update(self.__dict__)
+        copy._swapped_data_sets = set()
         return copy
 
 
 class StatsEngineSnapshot(StatsEngine):
+    def _release_data_set(self, name):
+        # A data set which was swapped out of the stats engine when the
+        # snapshot was taken is owned by the snapshot, so once done with
+        # can be handed back to the stats engine for reuse as its spare.
+
+        data_set = getattr(self, name)
+        setattr(self, name, None)
+
+        if name in self._swapped_data_sets:
+            self._swapped_data_sets.discard(name)
+            self._spare_data_sets[name] = data_set
+
     def reset_transaction_events(self):
-        self._transaction_events = None
+        self._release_data_set("_transaction_events")
 
     def reset_custom_events(self):
-        self._custom_events = None
+        self._release_data_set("_custom_events")
 
     def reset_span_events(self):
-        self._span_events = None
+        self._release_data_set("_span_events")
 
     def reset_synthetics_events(self):
-        self._synthetics_events = None
+        self._release_data_set("_synthetics_events")
 
     def reset_error_events(self):
-        self._error_events = None
+        self._release_data_set("_error_events")
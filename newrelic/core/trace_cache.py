@@ -28,6 +28,11 @@ try:
 except ImportError:
     import _thread as thread
 
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
 from newrelic.core.config import global_settings
 from newrelic.core.loop_node import LoopNode
 
@@ -140,6 +145,22 @@ class TraceCache(object):
     def task_stop(self, task):
         self._cache.pop(id(task), None)
 
+    def set_current(self, thread_id, trace):
+        """Saves the trace as the current trace under the thread ID, or
+        drops the current trace if trace is None. Returns the trace which
+        was previously current.
+
+        """
+
+        restore = self._cache.get(thread_id)
+
+        if trace is not None:
+            self._cache[thread_id] = trace
+        else:
+            self._cache.pop(thread_id, None)
+
+        return restore
+
     def current_transaction(self):
         """Return the transaction object if one exists for the currently
         executing thread.
@@ -391,6 +412,145 @@ class TraceCache(object):
             root.add_child(node)
 
 
+class ContextVarTraceCache(TraceCache):
+    """A trace cache for services running transactions in asyncio tasks,
+    which holds the current trace in a context variable. The current trace
+    is then found without working out the greenlet, task or thread the
+    caller is running in, with asyncio copying the context variable into
+    any task created while a trace is current.
+
+    Traces are still recorded in a plain dictionary keyed by the ID of the
+    task or thread, so they can be found from other tasks and threads,
+    but this is never used to find the current trace. Greenlets are not
+    distinguished from the thread they run in when working out the ID.
+
+    """
+
+    def __init__(self):
+        super(ContextVarTraceCache, self).__init__()
+        self._cache = {}
+        self._current = contextvars.ContextVar("newrelic_current_trace", default=None)
+
+    def current_thread_id(self):
+        asyncio = self.asyncio
+
+        if asyncio:
+            loop = asyncio._get_running_loop()
+            if loop is not None:
+                task = asyncio.current_task(loop)
+                if task is not None:
+                    return id(task)
+
+        return thread.get_ident()
+
+    def current_transaction(self):
+        trace = self._current.get()
+        return trace and trace.transaction
+
+    def current_trace(self):
+        trace = self._current.get()
+
+        # Traces still running in other tasks are completed from the task
+        # the transaction completes in, which can't update the current
+        # trace of the task the trace was running in. A completed trace
+        # has no root so is disregarded.
+
+        if trace is not None and trace.root is None:
+            return None
+
+        return trace
+
+    def set_current(self, thread_id, trace):
+        restore = self._current.get()
+        super(ContextVarTraceCache, self).set_current(thread_id, trace)
+        self._current.set(trace)
+        return restore
+
+    def prepare_for_root(self):
+        trace = self._current.get()
+        if not trace:
+            return None
+
+        if not hasattr(trace, "_task"):
+            return trace
+
+        task = current_task(self.asyncio)
+        if task is not None and id(trace._task) != id(task):
+            self._cache.pop(id(task), None)
+            self._current.set(None)
+            return None
+
+        if trace.root and trace.root.exited:
+            self._cache.pop(self.current_thread_id(), None)
+            self._current.set(None)
+            return None
+
+        return trace
+
+    def save_trace(self, trace):
+        current = self._current.get()
+
+        if current is not None:
+            cache_root = current.root
+            if cache_root and cache_root is not trace.root and not cache_root.exited:
+                # Current trace exists and has a valid root still
+                _logger.error(
+                    "Runtime instrumentation error. Attempt to "
+                    "save a trace from an inactive transaction. "
+                    "Report this issue to New Relic support.\n%s",
+                    "".join(traceback.format_stack()[:-1]),
+                )
+
+                raise TraceCacheActiveTraceError("transaction already active")
+
+        thread_id = trace.thread_id
+
+        self._current.set(trace)
+        self._cache[thread_id] = trace
+
+        # A trace running in the same task as its parent is in the task
+        # the parent was saved in, so the task only needs to be looked up
+        # for the first trace saved in each task.
+
+        parent = trace.parent
+
+        if parent is not None and parent.thread_id == thread_id:
+            task = getattr(parent, "_task", None)
+        else:
+            task = current_task(self.asyncio)
+
+        if task is not None:
+            trace._task = task
+
+    def pop_current(self, trace):
+        if hasattr(trace, "_task"):
+            delattr(trace, "_task")
+
+        parent = trace.parent
+
+        if parent is not None:
+            self._cache[trace.thread_id] = parent
+        else:
+            self._cache.pop(trace.thread_id, None)
+
+        # Where the trace is completed by a child trace running in another
+        # task, the trace was already popped in its own task when exited.
+
+        if self._current.get() is trace:
+            self._current.set(parent)
+
+    def complete_root(self, root):
+        super(ContextVarTraceCache, self).complete_root(root)
+
+        if self._current.get() is root:
+            self._current.set(None)
+
+
+TRACE_CACHE_IMPLEMENTATIONS = {
+    "default": TraceCache,
+    "contextvars": ContextVarTraceCache,
+}
+
 _trace_cache = TraceCache()
 
 
@@ -398,6 +558,34 @@ def trace_cache():
     return _trace_cache
 
 
+def select_trace_cache(implementation):
+    """Selects the implementation of the global trace cache. This needs to
+    be done on startup, before any transactions have been started.
+
+    """
+
+    global _trace_cache
+
+    cls = TRACE_CACHE_IMPLEMENTATIONS.get(implementation)
+
+    if cls is None:
+        _logger.warning("Unknown trace cache implementation %r. Falling back to the default.", implementation)
+        cls = TraceCache
+
+    elif cls is ContextVarTraceCache and contextvars is None:
+        _logger.warning("The contextvars trace cache requires Python 3.7 or later. Falling back to the default.")
+        cls = TraceCache
+
+    if type(_trace_cache) is cls:
+        return
+
+    if _trace_cache._cache:
+        _logger.warning("Unable to change the trace cache implementation while transactions are active.")
+        return
+
+    _trace_cache = cls()
+
+
 def greenlet_loaded(module):
     _trace_cache.greenlet = module
 
@@ -29,12 +29,7 @@ from newrelic.core.attribute import create_user_attributes
 from newrelic.core.attribute_filter import (DST_ERROR_COLLECTOR,
         DST_TRANSACTION_TRACER, DST_TRANSACTION_EVENTS)
 
-from newrelic.common.streaming_utils import SpanProtoAttrs
-
-try:
-    from newrelic.core.infinite_tracing_pb2 import Span
-except:
-    pass
+from newrelic.common.streaming_utils import encode_span
 
 _TransactionNode = namedtuple('_TransactionNode',
         ['settings', 'path', 'type', 'group', 'base_name', 'name_for_metric',
@@ -591,12 +586,12 @@ class TransactionNode(_TransactionNode):
         return intrinsics
 
     def span_protos(self, settings):
-        for i_attrs, u_attrs, a_attrs in self.span_events(
-                    settings, attr_class=SpanProtoAttrs):
-            yield Span(trace_id=self.trace_id,
-                       intrinsics=i_attrs,
-                       user_attributes=u_attrs,
-                       agent_attributes=a_attrs)
+        # Span events are encoded directly as serialized Span messages
+        # rather than being built as Span messages.
+
+        trace_id = self.trace_id
+        for i_attrs, u_attrs, a_attrs in self.span_events(settings):
+            yield encode_span(trace_id, i_attrs, u_attrs, a_attrs)
 
     def span_events(self, settings, attr_class=dict):
         base_attrs = attr_class((
@@ -613,3 +608,6 @@ class TransactionNode(_TransactionNode):
             attr_class=attr_class,
         ):
             yield event
+
+    def span_event_count(self):
+        return self.root.span_event_count()
@@ -0,0 +1,169 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This module implements a bounded queue of completed transactions which
+are recorded against an application by a background worker thread rather
+than on the thread which executed the transaction.
+
+"""
+
+import logging
+import os
+import threading
+import time
+
+from newrelic.packages.six.moves import queue
+
+_logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop", "sample", "inline")
+
+
+class TransactionQueue(object):
+
+    """Queue of completed transaction nodes waiting to be recorded. The
+    worker thread is started on first use, and is restarted if a process
+    fork is detected. When the queue is full, the overflow policy decides
+    what happens to the transaction:
+
+        drop   - The transaction is discarded.
+        sample - The transaction is recorded inline if it was sampled,
+                 otherwise it is discarded.
+        inline - The transaction is recorded inline on the calling thread.
+
+    """
+
+    def __init__(self, name, record, maxsize=1000, overflow_policy="inline"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            _logger.warning(
+                "Unknown transaction recording overflow policy %r. Falling back to recording transactions inline.",
+                overflow_policy,
+            )
+            overflow_policy = "inline"
+
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+
+        self._record = record
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._process_id = None
+
+        self.dropped_count = 0
+        self.inline_count = 0
+
+    @property
+    def depth(self):
+        return self._queue is not None and self._queue.qsize() or 0
+
+    def _start(self):
+        with self._lock:
+            if self._process_id == os.getpid():
+                return
+
+            self._queue = queue.Queue(self.maxsize)
+
+            self._thread = threading.Thread(target=self._run, name="NR-Transaction-Recorder/%s" % self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+            self._process_id = os.getpid()
+
+    def _run(self):
+        transactions = self._queue
+
+        while True:
+            data = transactions.get()
+
+            try:
+                if data is None:
+                    return
+
+                self._record(data)
+
+            except Exception:
+                _logger.exception(
+                    "Unexpected exception when recording a queued "
+                    "transaction. Please report this problem to New Relic "
+                    "support for further investigation."
+                )
+
+            finally:
+                transactions.task_done()
+
+    def put(self, data):
+        """Hands a completed transaction to the worker thread. Returns
+        False if the transaction was not queued and should instead be
+        recorded inline by the caller.
+
+        """
+
+        if self._process_id != os.getpid():
+            self._start()
+
+        try:
+            self._queue.put_nowait(data)
+            return True
+
+        except queue.Full:
+            if self.overflow_policy == "drop" or (self.overflow_policy == "sample" and not data.sampled):
+                with self._lock:
+                    self.dropped_count += 1
+                return True
+
+            with self._lock:
+                self.inline_count += 1
+            return False
+
+    def flush(self, timeout=None):
+        """Waits for all queued transactions to have been recorded, up
+        to the timeout if one is supplied. Returns whether the queue was
+        fully drained.
+
+        """
+
+        transactions = self._queue
+
+        if transactions is None or self._process_id != os.getpid():
+            return True
+
+        deadline = timeout is not None and time.time() + timeout
+
+        with transactions.all_tasks_done:
+            while transactions.unfinished_tasks:
+                if deadline is False:
+                    transactions.all_tasks_done.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0.0:
+                        return False
+                    transactions.all_tasks_done.wait(remaining)
+
+        return True
+
+    def harvest_counts(self):
+        """Returns the number of transactions dropped and recorded inline
+        due to the queue being full since the last call, resetting the
+        counts.
+
+        """
+
+        with self._lock:
+            counts = (self.dropped_count, self.inline_count)
+            self.dropped_count = 0
+            self.inline_count = 0
+
+        return counts
@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from newrelic.api.database_trace import DatabaseTrace, register_database_client
+import weakref
+
+from newrelic.api.database_trace import (DatabaseTrace,
+        CoalescingDatabaseTrace, register_database_client)
 from newrelic.api.function_trace import FunctionTrace
 from newrelic.api.transaction import current_transaction
 from newrelic.common.object_names import callable_name
@@ -28,19 +31,56 @@ class CursorWrapper(ObjectProxy):
         self._nr_dbapi2_module = dbapi2_module
         self._nr_connect_params = connect_params
         self._nr_cursor_params = cursor_params
+        self._nr_last_node = None
+        self._nr_last_transaction = None
+
+    def _nr_database_trace(self, sql, sql_parameters=None,
+            execute_params=None):
+        return CoalescingDatabaseTrace(sql, self._nr_dbapi2_module,
+                self._nr_connect_params, self._nr_cursor_params,
+                sql_parameters, execute_params,
+                previous=self._nr_previous_node())
+
+    def _nr_previous_node(self):
+        # The node for the previous statement is only of use within the
+        # transaction which recorded it, so is dropped once the cursor is
+        # used from another, rather than a long lived or pooled cursor
+        # holding on to its SQL and parameters.
+
+        node = self._nr_last_node
+
+        if node is not None and (self._nr_last_transaction() is not
+                current_transaction()):
+            node = self._nr_last_node = self._nr_last_transaction = None
+
+        return node
+
+    def _nr_save_node(self, trace):
+        node = trace.node
+        transaction = node is not None and current_transaction()
+
+        if transaction:
+            self._nr_last_node = node
+            self._nr_last_transaction = weakref.ref(transaction)
+        else:
+            self._nr_last_node = self._nr_last_transaction = None
 
     def execute(self, sql, parameters=DEFAULT, *args, **kwargs):
         if parameters is not DEFAULT:
-            with DatabaseTrace(sql, self._nr_dbapi2_module,
-                    self._nr_connect_params, self._nr_cursor_params,
-                    parameters, (args, kwargs)):
-                return self.__wrapped__.execute(sql, parameters,
-                        *args, **kwargs)
+            trace = self._nr_database_trace(sql, parameters, (args, kwargs))
+            try:
+                with trace:
+                    return self.__wrapped__.execute(sql, parameters,
+                            *args, **kwargs)
+            finally:
+                self._nr_save_node(trace)
         else:
-            with DatabaseTrace(sql, self._nr_dbapi2_module,
-                    self._nr_connect_params, self._nr_cursor_params,
-                    None, (args, kwargs)):
-                return self.__wrapped__.execute(sql, **kwargs)
+            trace = self._nr_database_trace(sql, None, (args, kwargs))
+            try:
+                with trace:
+                    return self.__wrapped__.execute(sql, **kwargs)
+            finally:
+                self._nr_save_node(trace)
 
     def executemany(self, sql, seq_of_parameters):
         try:
@@ -49,14 +89,14 @@ class CursorWrapper(ObjectProxy):
         except (TypeError, IndexError):
             parameters = DEFAULT
         if parameters is not DEFAULT:
-            with DatabaseTrace(sql, self._nr_dbapi2_module,
-                    self._nr_connect_params, self._nr_cursor_params,
-                    parameters):
-                return self.__wrapped__.executemany(sql, seq_of_parameters)
+            trace = self._nr_database_trace(sql, parameters)
         else:
-            with DatabaseTrace(sql, self._nr_dbapi2_module,
-                    self._nr_connect_params, self._nr_cursor_params):
+            trace = self._nr_database_trace(sql)
+        try:
+            with trace:
                 return self.__wrapped__.executemany(sql, seq_of_parameters)
+        finally:
+            self._nr_save_node(trace)
 
     def callproc(self, procname, parameters=DEFAULT):
         with DatabaseTrace('CALL %s' % procname,
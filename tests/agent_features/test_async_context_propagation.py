@@ -28,8 +28,15 @@ from newrelic.api.function_trace import FunctionTrace, function_trace
 from newrelic.api.memcache_trace import memcache_trace
 from newrelic.api.message_trace import message_trace
 from newrelic.api.time_trace import current_trace
+from newrelic.core import trace_cache as trace_cache_module
 from newrelic.core.config import global_settings
-from newrelic.core.trace_cache import trace_cache
+from newrelic.core.trace_cache import TRACE_CACHE_IMPLEMENTATIONS, trace_cache
+
+
+@pytest.fixture(autouse=True, params=sorted(TRACE_CACHE_IMPLEMENTATIONS))
+def trace_cache_implementation(request, monkeypatch):
+    monkeypatch.setattr(trace_cache_module, "_trace_cache", TRACE_CACHE_IMPLEMENTATIONS[request.param]())
+    return request.param
 
 
 @function_trace("waiter3")
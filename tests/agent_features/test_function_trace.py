@@ -14,8 +14,11 @@
 
 import time
 
+from newrelic.api import function_trace as function_trace_module
 from newrelic.api.background_task import background_task
-from newrelic.api.function_trace import FunctionTrace
+from newrelic.api.function_trace import FunctionTrace, FunctionTraceWrapper
+from newrelic.common.async_wrapper import async_wrapper
+from newrelic.common.object_names import callable_name
 
 from testing_support.fixtures import (validate_transaction_metrics,
         validate_tt_parenting)
@@ -127,3 +130,62 @@ def test_function_trace_settings():
 def test_function_trace_settings_no_transaction():
     with FunctionTrace("test_trace") as trace:
         assert not trace.settings
+
+
+class _Base(object):
+    def method(self):
+        pass
+
+
+_Base.method = FunctionTraceWrapper(_Base.method)
+
+
+class _Derived(_Base):
+    pass
+
+
+@validate_transaction_metrics(
+        'test_function_trace:test_function_trace_wrapper_method_names',
+        scoped_metrics=[
+            ('Function/test_function_trace:_Base.method', 2),
+            ('Function/test_function_trace:_Derived.method', 1)],
+        background_task=True)
+@background_task()
+def test_function_trace_wrapper_method_names():
+    # The name derived for a method is held against the class it is bound
+    # to, so is still that of the class of the instance.
+
+    _Base().method()
+    _Derived().method()
+    _Base().method()
+
+
+def test_function_trace_wrapper_details_resolved_once(monkeypatch):
+    calls = []
+
+    def counted(name, function):
+        def _counted(*args, **kwargs):
+            calls.append(name)
+            return function(*args, **kwargs)
+        return _counted
+
+    monkeypatch.setattr(function_trace_module, 'async_wrapper',
+            counted('async_wrapper', async_wrapper))
+    monkeypatch.setattr(function_trace_module, 'callable_name',
+            counted('callable_name', callable_name))
+
+    def _function():
+        pass
+
+    traced = FunctionTraceWrapper(_function)
+
+    @background_task(name='test_function_trace_wrapper_details_resolved_once')
+    def _test():
+        for _ in range(3):
+            traced()
+
+    _test()
+    _test()
+    traced()
+
+    assert sorted(calls) == ['async_wrapper', 'callable_name']
@@ -0,0 +1,96 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import pytest
+
+from newrelic.api.background_task import background_task
+from newrelic.api.function_trace import FunctionTrace
+from newrelic.api.time_trace import current_trace
+from newrelic.core import trace_cache as trace_cache_module
+from newrelic.core.trace_cache import (
+    ContextVarTraceCache,
+    TraceCache,
+    select_trace_cache,
+    trace_cache,
+)
+
+
+@pytest.fixture
+def restore_trace_cache(monkeypatch):
+    monkeypatch.setattr(trace_cache_module, "_trace_cache", trace_cache())
+
+
+@pytest.mark.parametrize(
+    "implementation,cls",
+    (
+        ("default", TraceCache),
+        ("contextvars", ContextVarTraceCache),
+        ("unknown", TraceCache),
+    ),
+)
+def test_select_trace_cache(restore_trace_cache, implementation, cls):
+    select_trace_cache(implementation)
+    assert type(trace_cache()) is cls
+
+
+def test_context_var_trace_cache_threads(restore_trace_cache):
+    import threading
+
+    select_trace_cache("contextvars")
+
+    traces = []
+
+    @background_task(name="test_context_var_trace_cache_threads")
+    def _test():
+        traces.append(current_trace())
+
+    threads = [threading.Thread(target=_test) for _ in range(2)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(traces) == 2
+    assert traces[0] is not traces[1]
+    assert current_trace() is None
+    assert not trace_cache()._cache
+
+
+def test_context_var_trace_cache_tasks(event_loop, restore_trace_cache):
+    select_trace_cache("contextvars")
+
+    roots = []
+
+    @background_task(name="test_context_var_trace_cache_tasks")
+    async def _test():
+        root = current_trace()
+
+        for _ in range(3):
+            with FunctionTrace("segment") as trace:
+                await asyncio.sleep(0)
+                assert current_trace() is trace
+
+            assert current_trace() is root
+
+        roots.append(root)
+
+    event_loop.run_until_complete(asyncio.gather(*(_test() for _ in range(10))))
+
+    assert len(set(id(root) for root in roots)) == 10
+    assert current_trace() is None
+    assert not trace_cache()._cache
@@ -0,0 +1,97 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from testing_support.fixtures import (
+    dt_enabled,
+    override_application_settings,
+    validate_transaction_metrics,
+    validate_tt_segment_params,
+)
+from testing_support.validators.validate_span_events import validate_span_events
+
+from newrelic.api.background_task import background_task
+from newrelic.api.function_trace import FunctionTrace
+from newrelic.api.transaction import current_transaction
+from newrelic.common.object_wrapper import transient_function_wrapper
+
+COLLAPSED_METRIC = "Supportability/Python/Transaction/Nodes/Collapsed"
+
+_budget_settings = {
+    "agent_limits.transaction_nodes_maximum": 5,
+    "span_events.enabled": True,
+}
+
+
+def _exercise():
+    for _ in range(20):
+        with FunctionTrace("leaf"):
+            pass
+
+    for _ in range(10):
+        with FunctionTrace("other"):
+            pass
+
+    # Nodes with children of their own are retained.
+
+    with FunctionTrace("outer"):
+        with FunctionTrace("leaf"):
+            pass
+
+
+def validate_transaction_children(count):
+    @transient_function_wrapper("newrelic.core.stats_engine", "StatsEngine.record_transaction")
+    def _validate(wrapped, instance, args, kwargs):
+        transaction = args[0]
+        assert len(transaction.root.children) == count, transaction.root.children
+        return wrapped(*args, **kwargs)
+
+    return _validate
+
+
+@override_application_settings(_budget_settings)
+@validate_transaction_metrics(
+    "test_transaction_node_budget:test_node_budget",
+    background_task=True,
+    scoped_metrics=[("Function/leaf", 21), ("Function/other", 10), ("Function/outer", 1)],
+    rollup_metrics=[("Function/leaf", 21), ("Function/other", 10), ("Function/outer", 1)],
+    custom_metrics=[(COLLAPSED_METRIC, 26)],
+)
+@validate_transaction_children(5 + 3)
+@validate_span_events(count=7, exact_intrinsics={"name": "Function/leaf"})
+@validate_span_events(count=1, exact_intrinsics={"name": "Function/other"})
+@validate_tt_segment_params(present_params=("call_count",))
+@dt_enabled
+@background_task()
+def test_node_budget():
+    # Span events are only created for sampled transactions, and must not
+    # be displaced by those left by earlier tests in the same harvest.
+
+    transaction = current_transaction()
+    transaction._sampled = True
+    transaction._priority = 10.0
+
+    _exercise()
+
+
+@override_application_settings({"agent_limits.transaction_nodes_maximum": None})
+@validate_transaction_metrics(
+    "test_transaction_node_budget:test_node_budget_disabled",
+    background_task=True,
+    scoped_metrics=[("Function/leaf", 21), ("Function/other", 10)],
+    custom_metrics=[(COLLAPSED_METRIC, None)],
+)
+@validate_transaction_children(31)
+@background_task()
+def test_node_budget_disabled():
+    _exercise()
@@ -35,13 +35,60 @@ def record_span(request, context):
         yield RecordStatus(messages_seen=1)
 
 
+def split_span_batch(data):
+    # SpanBatch has the single field "repeated Span spans = 1", so is a
+    # sequence of length delimited serialized spans.
+    data = bytearray(data)
+    spans = []
+    offset = 0
+
+    while offset < len(data):
+        assert data[offset] == 0x0A
+        offset += 1
+
+        length = shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+
+        spans.append(Span.FromString(bytes(data[offset : offset + length])))
+        offset += length
+
+    return spans
+
+
+def record_span_batch(request, context):
+    metadata = dict(context.invocation_metadata())
+    assert 'agent_run_token' in metadata
+    assert 'license_key' in metadata
+
+    for batch in request:
+        for span in batch:
+            status_code = span.intrinsics.get('status_code', None)
+            status_code = status_code and getattr(
+                grpc.StatusCode, status_code.string_value)
+            if status_code is grpc.StatusCode.OK:
+                return
+            elif status_code:
+                context.abort(status_code, "Abort triggered by client")
+
+        yield RecordStatus(messages_seen=len(batch))
+
+
 HANDLERS = (
     grpc.method_handlers_generic_handler(
         "com.newrelic.trace.v1.IngestService",
         {
             "RecordSpan": grpc.stream_stream_rpc_method_handler(
                 record_span, Span.FromString, RecordStatus.SerializeToString
-            )
+            ),
+            "RecordSpanBatch": grpc.stream_stream_rpc_method_handler(
+                record_span_batch, split_span_batch, RecordStatus.SerializeToString
+            ),
         },
     ),
 )
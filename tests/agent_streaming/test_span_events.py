@@ -43,3 +43,30 @@ def test_span_stream_is_singleton():
 
     # The workarea span stream should be equal to the global span stream
     assert stats_engine.span_stream is workarea.span_stream
+
+
+def test_encoded_span_matches_span_message():
+    from newrelic.common.streaming_utils import SpanProtoAttrs, encode_span
+    from newrelic.core.infinite_tracing_pb2 import Span
+
+    intrinsics = {
+        "name": u"Function/café",
+        "timestamp": 1600000000000,
+        "duration": 0.25,
+        "sampled": True,
+        "nr.entryPoint": False,
+        "negative": -2,
+    }
+    user_attributes = {"long": "x" * 200}
+    agent_attributes = {"http.statusCode": 200}
+
+    expected = Span(
+        trace_id="trace-id",
+        intrinsics=SpanProtoAttrs(intrinsics),
+        user_attributes=SpanProtoAttrs(user_attributes),
+        agent_attributes=SpanProtoAttrs(agent_attributes),
+    )
+
+    span = Span.FromString(encode_span("trace-id", intrinsics, user_attributes, agent_attributes))
+
+    assert span == expected
@@ -104,3 +104,28 @@ def test_close_while_awaiting_reconnect(mock_grpc_server, monkeypatch):
     rpc.close()
     # Make sure the processing_thread is closed
     assert not rpc.response_processing_thread.is_alive()
+
+
+def test_batched_spans_sent(mock_grpc_server, buffer_empty_event):
+    endpoint = "localhost:%s" % mock_grpc_server
+    stream_buffer = StreamBuffer(10, batching=True)
+
+    rpc = StreamingRpc(
+        endpoint, stream_buffer, DEFAULT_METADATA, record_metric, ssl=False
+    )
+
+    assert rpc.batching
+
+    rpc.connect()
+
+    span = Span(intrinsics={}, agent_attributes={}, user_attributes={})
+
+    buffer_empty_event.clear()
+    for _ in range(5):
+        stream_buffer.put(span)
+
+    assert buffer_empty_event.wait(5)
+    assert not stream_buffer._queue
+
+    rpc.close()
+    assert not rpc.response_processing_thread.is_alive()
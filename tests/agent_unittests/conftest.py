@@ -25,6 +25,7 @@ from testing_support.fixtures import (  # noqa: F401; pylint: disable=W0611
 )
 
 from newrelic.core.agent import agent_instance
+from newrelic.packages import six
 
 _default_settings = {
     "transaction_tracer.explain_threshold": 0.0,
@@ -38,6 +39,9 @@ collector_agent_registration = collector_agent_registration_fixture(
     app_name="Python Agent Test (agent_unittests)", default_settings=_default_settings
 )
 
+if six.PY2:
+    collect_ignore = ["test_harvest_scheduler.py"]
+
 
 try:
     # python 2.x
@@ -22,7 +22,11 @@ import pytest
 
 from newrelic.common import certs, system_info
 from newrelic.common.agent_http import DeveloperModeClient
-from newrelic.common.encoding_utils import json_decode, serverless_payload_decode
+from newrelic.common.encoding_utils import (
+    json_decode,
+    json_encode,
+    serverless_payload_decode,
+)
 from newrelic.common.utilization import CommonUtilization
 from newrelic.core.agent_protocol import AgentProtocol, ServerlessModeProtocol
 from newrelic.core.config import finalize_application_settings, global_settings
@@ -267,6 +271,49 @@ def test_status_code_exceptions(status_code, expected_exc, log_level, caplog):
     assert "123LICENSEKEY" not in message
 
 
+class StreamingHttpClientRecorder(HttpClientRecorder):
+    STREAM_PAYLOADS = True
+
+    def send_request(
+        self,
+        method="POST",
+        path="/agent_listener/invoke_raw_method",
+        params=None,
+        headers=None,
+        payload=None,
+    ):
+        if not isinstance(payload, bytes):
+            payload = StreamedPayload(b"".join(payload))
+
+        request = Request(method=method, path=path, params=params, headers=headers, payload=payload)
+        self.SENT.append(request)
+
+        return 200, b'{"return_value": null}'
+
+
+class StreamedPayload(bytes):
+    pass
+
+
+@pytest.mark.parametrize("stream_payloads", (True, False))
+def test_protocol_stream_payloads(stream_payloads):
+    settings = finalize_application_settings({"harvest.stream_payloads": stream_payloads})
+    protocol = AgentProtocol(settings, client_cls=StreamingHttpClientRecorder)
+
+    payload = ("1234567", {"reservoir_size": 2}, [[{"a": 1}, {}, {}], [{"b": 2}, {}, {}]])
+    protocol.send("analytic_event_data", payload)
+
+    request = HttpClientRecorder.SENT[0]
+    assert request.params["method"] == "analytic_event_data"
+
+    assert isinstance(request.payload, StreamedPayload) is stream_payloads
+    assert json_decode(request.payload.decode("utf-8")) == json_decode(json_encode(payload))
+
+    # Payloads are never streamed to a client which does not support it.
+    protocol = AgentProtocol(settings, client_cls=HttpClientRecorder)
+    assert not protocol._stream_payloads
+
+
 def test_protocol_http_error_causes_retry():
     protocol = AgentProtocol(finalize_application_settings(), client_cls=HttpClientException)
     with pytest.raises(RetryDataForRequest):
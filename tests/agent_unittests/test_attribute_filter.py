@@ -0,0 +1,154 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from newrelic.core.attribute import (
+    create_agent_attributes,
+    create_user_attributes,
+    resolve_agent_attributes,
+)
+from newrelic.core.attribute_filter import (
+    DST_ALL,
+    DST_ERROR_COLLECTOR,
+    DST_NONE,
+    DST_SPAN_EVENTS,
+    DST_TRANSACTION_EVENTS,
+    DST_TRANSACTION_TRACER,
+    AttributeFilter,
+)
+
+
+def _settings(**settings):
+    result = {
+        "attributes.enabled": True,
+        "transaction_events.attributes.enabled": True,
+        "transaction_tracer.attributes.enabled": True,
+        "error_collector.attributes.enabled": True,
+        "browser_monitoring.attributes.enabled": False,
+        "span_events.attributes.enabled": True,
+        "transaction_segments.attributes.enabled": True,
+    }
+    result.update((name.replace("__", "."), value) for name, value in settings.items())
+    return result
+
+
+def _linear_apply(attribute_filter, name, default_destinations):
+    # The rules applied one at a time in order, as they were before being
+    # compiled into masks.
+
+    destinations = attribute_filter.enabled_destinations & default_destinations
+
+    for rule in attribute_filter.rules:
+        if rule.name_match(name):
+            if rule.is_include:
+                destinations |= rule.destinations & attribute_filter.enabled_destinations
+            else:
+                destinations &= ~rule.destinations
+
+    return destinations
+
+
+_RULES_SETTINGS = _settings(
+    attributes__include=["request.*", "request.headers.host", "a*"],
+    attributes__exclude=["request.headers.*", "ab", "*"],
+    transaction_events__attributes__include=["request.headers.*", "abc*"],
+    transaction_events__attributes__exclude=["request.parameters.*"],
+    span_events__attributes__exclude=["request.*", "a*"],
+    error_collector__attributes__include=["ab*", "a"],
+    browser_monitoring__attributes__include=["request.*"],
+)
+
+_NAMES = (
+    "",
+    "a",
+    "ab",
+    "abc",
+    "abcd",
+    "b",
+    "request",
+    "request.",
+    "request.method",
+    "request.headers.host",
+    "request.headers.accept",
+    "request.parameters.id",
+)
+
+
+def test_compiled_rules_match_linear_apply():
+    attribute_filter = AttributeFilter(_RULES_SETTINGS)
+
+    for name in _NAMES:
+        for default_destinations in (DST_NONE, DST_ALL, DST_TRANSACTION_TRACER | DST_SPAN_EVENTS):
+            expected = _linear_apply(attribute_filter, name, default_destinations)
+            assert attribute_filter.apply(name, default_destinations) == expected, (name, default_destinations)
+
+
+def test_apply_many():
+    attribute_filter = AttributeFilter(_RULES_SETTINGS)
+
+    name_defaults = {"request.method": DST_ERROR_COLLECTOR}
+    results = attribute_filter.apply_many(_NAMES, DST_TRANSACTION_EVENTS, name_defaults)
+
+    assert results == [attribute_filter.apply(name, name_defaults.get(name, DST_TRANSACTION_EVENTS)) for name in _NAMES]
+
+
+def test_apply_many_disabled():
+    attribute_filter = AttributeFilter(_settings(attributes__enabled=False))
+
+    assert attribute_filter.apply_many(_NAMES, DST_ALL) == [DST_NONE] * len(_NAMES)
+
+
+def test_cache_evicts_oldest():
+    attribute_filter = AttributeFilter(_settings(attributes__cache_size=3))
+
+    for i in range(5):
+        attribute_filter.apply("request.id.%d" % i, DST_ALL)
+
+    assert list(attribute_filter.cache) == [("request.id.%d" % i, DST_ALL) for i in range(2, 5)]
+
+
+def test_create_and_resolve_attributes():
+    attribute_filter = AttributeFilter(_settings(attributes__exclude=["user.secret"]))
+
+    user_attributes = create_user_attributes({"user.name": "name", "user.secret": "secret"}, attribute_filter)
+
+    assert [(a.name, a.value, a.destinations) for a in user_attributes] == [
+        ("user.name", "name", attribute_filter.enabled_destinations),
+        ("user.secret", "secret", DST_NONE),
+    ]
+
+    agent_attributes = {"request.method": "GET", "request.uri": None, "other": "value"}
+
+    assert [a.name for a in create_agent_attributes(agent_attributes, attribute_filter)] == ["request.method", "other"]
+
+    assert resolve_agent_attributes(agent_attributes, attribute_filter, DST_TRANSACTION_EVENTS) == {
+        "request.method": "GET"
+    }
+
+
+def test_compiled_rules_match_linear_apply_many_rules():
+    # Request ID like names, so that most attributes miss the cache,
+    # filtered against many overlapping rules.
+
+    attribute_filter = AttributeFilter(
+        _settings(
+            attributes__include=["custom.%d.*" % i for i in range(25)],
+            attributes__exclude=["custom.%d.secret" % i for i in range(25)] + ["custom.1*"],
+        )
+    )
+
+    attributes = dict(("custom.%d.request.%d" % (i % 30, i), i) for i in range(200))
+    attributes.update(("custom.%d.secret" % i, i) for i in range(30))
+
+    for attribute in create_user_attributes(attributes, attribute_filter):
+        assert attribute.destinations == _linear_apply(attribute_filter, attribute.name, DST_ALL), attribute.name
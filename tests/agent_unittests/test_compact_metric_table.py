@@ -0,0 +1,136 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.metric import ApdexMetric, TimeMetric
+from newrelic.core.stats_engine import (
+    ApdexStats,
+    CompactMetricTable,
+    CountStats,
+    StatsEngine,
+    TimeStats,
+)
+
+NUM_METRICS = 5000
+
+
+def stats_engine(compact):
+    settings = finalize_application_settings({"stats_engine.compact_metric_table": compact})
+    engine = StatsEngine()
+    engine.reset_stats(settings)
+    return engine
+
+
+def record_metrics(engine, count=NUM_METRICS, repeat=2):
+    for i in range(repeat):
+        for j in range(count):
+            duration = (i + 1) * 0.1 + j * 0.001
+            engine.record_time_metric(
+                TimeMetric(name="Function/%d" % j, scope="WebTransaction/Foo", duration=duration, exclusive=None)
+            )
+        engine.record_apdex_metric(
+            ApdexMetric(name="Apdex/Foo", satisfying=1, tolerating=i, frustrating=0, apdex_t=0.5 - i * 0.1)
+        )
+        engine.record_custom_metric("Custom/Value", i + 0.5)
+        engine.record_custom_metric("Custom/Count", {"count": 3})
+    return engine
+
+
+def metric_data(engine):
+    return sorted(((k["name"], k["scope"]), list(v)) for k, v in engine.metric_data())
+
+
+def test_compact_metric_table_enabled():
+    assert isinstance(stats_engine(True).stats_table, CompactMetricTable)
+    assert isinstance(stats_engine(False).stats_table, dict)
+
+
+def test_compact_metric_table_matches_dict():
+    compact = record_metrics(stats_engine(True), count=50)
+    default = record_metrics(stats_engine(False), count=50)
+
+    assert compact.metrics_count() == default.metrics_count() == 53
+    assert metric_data(compact) == metric_data(default)
+
+
+def test_compact_metric_table_merge_matches_dict():
+    results = []
+
+    for compact in (True, False):
+        engine = record_metrics(stats_engine(compact), count=20)
+        workarea = record_metrics(engine.create_workarea(), count=40, repeat=1)
+        engine.merge(workarea)
+        engine.merge_custom_metrics([("Custom/Count", CountStats(call_count=2))])
+        results.append(metric_data(engine))
+
+    assert results[0] == results[1]
+
+
+def test_compact_metric_table_stats_types():
+    table = record_metrics(stats_engine(True), count=1).stats_table
+
+    items = dict(table.items())
+    assert type(items[("Function/0", "WebTransaction/Foo")]) is TimeStats
+    assert type(items[("Apdex/Foo", "")]) is ApdexStats
+    assert type(items[("Custom/Count", "")]) is CountStats
+
+    row = table[("Function/0", "WebTransaction/Foo")]
+    assert row.call_count == 2
+    assert row.min_call_time == 0.1
+    assert row.max_call_time == 0.2
+
+    # Copies are detached from the table.
+    detached = copy.copy(row)
+    row.merge_raw_time_metric(1.0)
+    assert detached.call_count == 2
+    assert row.call_count == 3
+
+    assert table.get(("Unknown", "")) is None
+    assert ("Apdex/Foo", "") in table
+
+
+def record_durations(engine, name, durations):
+    for duration in durations:
+        engine.record_time_metric(
+            TimeMetric(name=name, scope="WebTransaction/Foo", duration=duration, exclusive=duration / 2)
+        )
+    return engine
+
+
+def test_compact_metric_table_merge_exact():
+    engine = record_durations(stats_engine(True), "Function/a", (1.0, 2.0, 3.0))
+    workarea = record_durations(engine.create_workarea(), "Function/a", (4.0, 5.0))
+    record_durations(workarea, "Function/b", (0.5,))
+
+    engine.merge(workarea)
+
+    row = engine.stats_table[("Function/a", "WebTransaction/Foo")]
+    assert row.call_count == 5
+    assert row.total_call_time == 15.0
+    assert row.total_exclusive_call_time == 7.5
+    assert row.min_call_time == 1.0
+    assert row.max_call_time == 5.0
+    assert row.sum_of_squares == 55.0
+
+    row = engine.stats_table[("Function/b", "WebTransaction/Foo")]
+    assert row.call_count == 1
+    assert row.total_call_time == 0.5
+
+    # The table merged from is left unchanged.
+
+    row = workarea.stats_table[("Function/a", "WebTransaction/Foo")]
+    assert row.call_count == 2
+    assert row.total_call_time == 9.0
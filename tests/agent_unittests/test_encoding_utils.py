@@ -0,0 +1,120 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import zlib
+
+import pytest
+
+from newrelic.common.agent_http import HttpClient
+from newrelic.common.encoding_utils import (
+    json_encode,
+    json_encode_chunks,
+    json_encode_iter,
+)
+from newrelic.core.stats_engine import SampledDataSet
+
+NUM_EVENTS = 10000
+
+
+def span_events():
+    events = SampledDataSet(NUM_EVENTS)
+    for i in range(NUM_EVENTS):
+        events.add(
+            [
+                {
+                    "type": "Span",
+                    "guid": "%016x" % i,
+                    "traceId": "4485b89db608aece",
+                    "name": "Function/module:function_%d" % (i % 100),
+                    "timestamp": 1524764430000 + i,
+                    "duration": i * 0.001,
+                    "category": "generic",
+                },
+                {"user": u"☃", "bytes": b"\xff"},
+                {},
+            ],
+            priority=1.0 + i,
+        )
+    return events
+
+
+@pytest.mark.parametrize(
+    "payload",
+    (
+        lambda: (),
+        lambda: [],
+        lambda: {"a": [1, 2]},
+        lambda: ("1234567", {"reservoir_size": 3}, [[{"a": 1}, {}, {}], [{"b": 2}, {}, {}]]),
+        lambda: ("1234567", (x for x in ([1], [2]))),
+        lambda: [b"\xff", u"☃", None, 1.5, [[[1]]]],
+    ),
+)
+def test_json_encode_iter(payload):
+    # Payloads are created on demand as generators can only be consumed
+    # once.
+
+    assert "".join(json_encode_iter(payload())) == json_encode(payload())
+
+
+def test_json_encode_chunks():
+    payload = ("1234567", {"reservoir_size": NUM_EVENTS}, span_events())
+
+    chunks = list(json_encode_chunks(payload, chunk_size=1024))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+    assert b"".join(chunks) == json_encode(payload).encode("utf-8")
+
+
+@pytest.mark.parametrize("method", ("gzip", "deflate"))
+def test_compress_chunks(method):
+    payload = ("1234567", {"reservoir_size": NUM_EVENTS}, span_events())
+    expected = json_encode(payload).encode("utf-8")
+
+    body, size, compression_time = HttpClient._compress_chunks(
+        json_encode_chunks(payload), 64 * 1024, method=method
+    )
+
+    assert size == len(expected)
+    assert compression_time is not None
+    assert zlib.decompress(body, 31 if method == "gzip" else 15) == expected
+
+    # Payloads under the threshold are not compressed.
+    body, size, compression_time = HttpClient._compress_chunks(iter((b"[1,", b"2]")), 64)
+    assert body == b"[1,2]"
+    assert size == 5
+    assert compression_time is None
+
+
+def test_compress_chunks_decodes_to_payload():
+    payload = ("1234567", {"reservoir_size": NUM_EVENTS}, span_events())
+    expected = json.loads(json_encode(payload))
+
+    chunks = []
+
+    def capture_chunks():
+        for chunk in json_encode_chunks(payload, chunk_size=1024):
+            chunks.append(len(chunk))
+            yield chunk
+
+    body = HttpClient._compress_chunks(capture_chunks(), 64 * 1024)[0]
+
+    assert json.loads(zlib.decompress(body, 31).decode("utf-8")) == expected
+
+    # Only a chunk of the uncompressed payload is held at any one time,
+    # each being no more than a single event over the chunk size.
+
+    assert len(chunks) > 1
+    assert max(chunks) < 2048
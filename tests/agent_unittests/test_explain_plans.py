@@ -0,0 +1,158 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+from newrelic.core.database_utils import SQLDatabase, SQLStatement, explain_plan
+from newrelic.core.explain_plans import ExplainPlanWorker
+
+CONNECT_PARAMS = ((), {"database": "test"})
+
+
+class FakeCursor(object):
+    def __init__(self, module):
+        self.module = module
+        self.description = [("QUERY PLAN",)]
+
+    def execute(self, query, *args, **kwargs):
+        self.module.queries.append(query)
+        self.module.executing.wait(5.0)
+
+    def fetchall(self):
+        return [("Seq Scan on users",)]
+
+
+class FakeConnection(object):
+    def __init__(self, module):
+        self.module = module
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.module)
+
+    def rollback(self):
+        self.module.rollbacks += 1
+
+    def close(self):
+        self.module.closed += 1
+
+
+class FakeDBModule(object):
+    __name__ = "fake_dbapi2"
+
+    _nr_database_product = "Fake"
+    _nr_explain_query = "EXPLAIN"
+    _nr_explain_stmts = ("select",)
+
+    NotSupportedError = NotImplementedError
+
+    def __init__(self):
+        self.queries = []
+        self.connects = 0
+        self.rollbacks = 0
+        self.closed = 0
+
+        # Cleared to make explain plan queries block.
+        self.executing = threading.Event()
+        self.executing.set()
+
+    def connect(self, *args, **kwargs):
+        self.connects += 1
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def module():
+    return FakeDBModule()
+
+
+@pytest.fixture
+def worker():
+    worker = ExplainPlanWorker("Test", ttl=60.0)
+    yield worker
+    worker.shutdown()
+
+
+def statement(module, sql):
+    return SQLStatement(sql, SQLDatabase(module))
+
+
+def explain(session, module, sql):
+    return explain_plan(session, statement(module, sql), CONNECT_PARAMS, None, None, None, "obfuscated")
+
+
+def test_explain_plan_worker_caches_plans(module, worker):
+    expected = (["QUERY PLAN"], [("Seq Scan on users",)])
+
+    with worker.session(5.0) as session:
+        assert explain(session, module, "SELECT * FROM users WHERE id = 1") == expected
+
+    # The same statement with different literal values uses the cached
+    # explain plan.
+
+    with worker.session(5.0) as session:
+        assert explain(session, module, "SELECT * FROM users WHERE id = 2") == expected
+        assert session.cache_hits == 1
+
+    assert module.queries == ["EXPLAIN SELECT * FROM users WHERE id = 1"]
+
+
+def test_explain_plan_worker_reuses_connections(module, worker):
+    for i in range(3):
+        with worker.session(5.0) as session:
+            explain(session, module, "SELECT * FROM table_%d" % i)
+
+    assert len(module.queries) == 3
+    assert module.connects == 1
+    assert module.rollbacks == 3
+    assert module.closed == 0
+
+    worker.shutdown()
+    worker._thread.join(5.0)
+
+    assert module.closed == 1
+
+
+def test_explain_plan_worker_time_budget(module, worker):
+    module.executing.clear()
+
+    with worker.session(0.1) as session:
+        start = time.time()
+        assert explain(session, module, "SELECT * FROM users") is None
+        assert explain(session, module, "SELECT * FROM orders") is None
+        assert time.time() - start < 1.0
+        assert session.skipped == 2
+
+    # Plans still being gathered when the budget ran out are available in
+    # a subsequent harvest.
+
+    module.executing.set()
+
+    with worker.session(5.0) as session:
+        assert explain(session, module, "SELECT * FROM users")
+        assert explain(session, module, "SELECT * FROM orders")
+
+    assert len(module.queries) == 2
+
+
+def test_explain_plan_worker_cache_expiry(module, worker):
+    worker.ttl = 0.0
+
+    for _ in range(2):
+        with worker.session(5.0) as session:
+            explain(session, module, "SELECT * FROM users")
+
+    assert len(module.queries) == 2
@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import random
 import pytest
 import six
 import tempfile
+import threading
 import time
 
 from newrelic.common.object_wrapper import (transient_function_wrapper,
@@ -26,7 +28,11 @@ from testing_support.fixtures import (override_generic_settings,
 
 from newrelic.common.agent_http import DeveloperModeClient
 from newrelic.core.application import Application
-from newrelic.core.stats_engine import CustomMetrics, SampledDataSet
+from newrelic.core.harvest_uploads import (HarvestUpload, HarvestUploadPool,
+        send_concurrently)
+from newrelic.core.internal_metrics import InternalTraceContext
+from newrelic.core.stats_engine import (CustomMetrics, SampledDataSet,
+        StatsEngine)
 from newrelic.core.transaction_node import TransactionNode
 from newrelic.core.root_node import RootNode
 from newrelic.core.custom_event import create_custom_event
@@ -901,3 +907,529 @@ def test_get_agent_commands_raises():
     app.connect_to_data_collector(None)
     with pytest.raises(RetryDataForRequest):
         app.process_agent_commands()
+
+
+@override_generic_settings(settings, {
+    'developer_mode': True,
+    'license_key': '**NOT A LICENSE KEY**',
+    'feature_flag': set(),
+    'transaction_recording.sharded_stats': True,
+})
+def test_sharded_stats_transaction_count(transaction_node):
+    app = Application('Python Agent Test (Harvest Loop)')
+    app.connect_to_data_collector(None)
+
+    # Keep each thread alive until all have recorded a transaction so
+    # that thread IDs are not reused.
+
+    recorded = threading.Semaphore(0)
+    finish = threading.Event()
+
+    def _record():
+        app.record_transaction(transaction_node)
+        recorded.release()
+        finish.wait()
+
+    threads = [threading.Thread(target=_record) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        recorded.acquire()
+
+    # Recorded into the per thread shards, not the main stats engine
+    assert app._transaction_count == 0
+    assert len(app._stats_shards) == 3
+    assert ('OtherTransaction/Function/main', '') not in \
+            app._stats_engine.stats_table
+
+    finish.set()
+    for t in threads:
+        t.join()
+
+    app.merge_stats_shards()
+
+    assert app._transaction_count == 3
+    stats = app._stats_engine.stats_table[
+            ('OtherTransaction/Function/main', '')]
+    assert stats.call_count == 3
+
+    # Shards belonging to threads which have exited are discarded
+    assert not app._stats_shards
+
+
+@override_generic_settings(settings, {
+    'developer_mode': True,
+    'license_key': '**NOT A LICENSE KEY**',
+    'feature_flag': set(),
+    'transaction_recording.sharded_stats': True,
+})
+def test_sharded_stats_harvest(transaction_node):
+    endpoints_called = []
+
+    @validate_metric_payload([('OtherTransaction/Function/main', 2)],
+            endpoints_called)
+    def _test():
+        app = Application('Python Agent Test (Harvest Loop)')
+        app.connect_to_data_collector(None)
+
+        app.record_transaction(transaction_node)
+        app.record_transaction(transaction_node)
+
+        # The shard for the current thread is retained between harvests
+        shard = app._stats_shards[threading.current_thread().ident]
+
+        app.harvest()
+
+        assert app._transaction_count == 0
+        assert shard.transaction_count == 0
+        assert app._stats_shards
+
+    _test()
+    assert 'metric_data' in endpoints_called
+
+
+@override_generic_settings(settings, {
+    'developer_mode': True,
+    'license_key': '**NOT A LICENSE KEY**',
+    'feature_flag': set(),
+    'transaction_recording.background': True,
+})
+def test_background_transaction_recording(transaction_node):
+    endpoints_called = []
+
+    @validate_metric_payload([
+            ('OtherTransaction/Function/main', 2),
+            ('Supportability/Python/RecordTransaction/Queue/Depth', 1),
+            ('Supportability/Python/RecordTransaction/Queue/Dropped', 0),
+            ('Supportability/Python/RecordTransaction/Queue/Inline', 0)],
+            endpoints_called)
+    def _test():
+        app = Application('Python Agent Test (Harvest Loop)')
+        app.connect_to_data_collector(None)
+
+        app.record_transaction(transaction_node)
+        app.record_transaction(transaction_node)
+
+        transaction_queue = app._transaction_queue
+        assert transaction_queue._thread.name == \
+                'NR-Transaction-Recorder/Python Agent Test (Harvest Loop)'
+
+        # Queued transactions are all recorded before the final harvest
+        app.harvest(shutdown=True)
+
+        assert app._transaction_count == 0
+        assert transaction_queue.depth == 0
+
+    _test()
+    assert 'metric_data' in endpoints_called
+
+
+def test_span_event_count(transaction_node):
+    events = list(transaction_node.span_events(transaction_node.settings))
+    assert transaction_node.span_event_count() == len(events)
+
+
+def test_deferred_event_construction(transaction_node):
+    stats_settings = finalize_application_settings({
+        'agent_run_id': '1234567',
+        'distributed_tracing.enabled': True,
+        'event_harvest_config.harvest_limits.analytic_event_data': 5,
+        'event_harvest_config.harvest_limits.error_event_data': 5,
+        'event_harvest_config.harvest_limits.span_event_data': 5,
+    })
+
+    engine = StatsEngine()
+    engine.reset_stats(stats_settings)
+
+    # Fill the reservoirs of the parent stats engine with events of a
+    # higher priority than the transaction.
+
+    data_sets = (engine.transaction_events, engine.error_events,
+            engine.span_events)
+    for data_set in data_sets:
+        for _ in range(5):
+            data_set.add({}, priority=transaction_node.priority + 1.0)
+
+    internal_metrics = CustomMetrics()
+
+    with InternalTraceContext(internal_metrics):
+        workarea = engine.create_workarea()
+        workarea.record_transaction(transaction_node)
+
+    num_spans = transaction_node.span_event_count()
+    num_errors = len(transaction_node.errors)
+
+    assert workarea.transaction_events.num_seen == 1
+    assert workarea.error_events.num_seen == num_errors
+    assert workarea.span_events.num_seen == num_spans
+
+    for data_set in (workarea.transaction_events, workarea.error_events,
+            workarea.span_events):
+        assert data_set.num_samples == 0
+
+    metrics = dict(internal_metrics.metrics())
+    prefix = 'Supportability/Python/RecordTransaction/Events/Skipped/'
+    assert metrics[prefix + 'Transaction'].call_count == 1
+    assert metrics[prefix + 'Error'].call_count == num_errors
+    assert metrics[prefix + 'Span'].call_count == num_spans
+
+    engine.merge(workarea)
+
+    assert engine.transaction_events.num_seen == 5 + 1
+    assert engine.transaction_events.num_samples == 5
+    assert engine.error_events.num_seen == 5 + num_errors
+    assert engine.error_events.num_samples == 5
+    assert engine.span_events.num_seen == 5 + num_spans
+    assert engine.span_events.num_samples == 5
+
+    # Once the parent has been reset the events are constructed again.
+
+    engine.reset_span_events()
+    workarea = engine.create_workarea()
+    workarea.record_transaction(transaction_node)
+    assert workarea.span_events.num_seen == num_spans
+    assert workarea.span_events.num_samples == 5
+
+
+def test_record_transaction_merged_time_metrics(transaction_node):
+    engine = StatsEngine()
+    engine.reset_stats(finalize_application_settings({
+        'agent_run_id': '1234567',
+    }))
+
+    expected = set((metric.name, metric.scope or '')
+            for metric in transaction_node.time_metrics(engine))
+
+    internal_metrics = CustomMetrics()
+
+    with InternalTraceContext(internal_metrics):
+        engine.record_transaction(transaction_node)
+
+    metrics = dict(internal_metrics.metrics())
+    stats = metrics[
+            'Supportability/Python/RecordTransaction/TimeMetrics/Merged']
+
+    assert stats.call_count == len(expected)
+
+
+_concurrent_uploads_settings = {
+    'developer_mode': True,
+    'license_key': '**NOT A LICENSE KEY**',
+    'feature_flag': set(),
+    'distributed_tracing.enabled': True,
+    'harvest.concurrent_uploads': True,
+}
+
+
+@override_generic_settings(settings, _concurrent_uploads_settings)
+def test_concurrent_uploads_harvest(transaction_node):
+    endpoints_called = []
+    upload_threads = {}
+
+    @transient_function_wrapper('newrelic.core.agent_protocol',
+            'AgentProtocol.send')
+    def capture_thread(wrapped, instance, args, kwargs):
+        def _bind_params(method, *args, **kwargs):
+            return method
+
+        upload_threads[_bind_params(*args, **kwargs)] = \
+                threading.current_thread().name
+        return wrapped(*args, **kwargs)
+
+    @validate_metric_payload([
+            ('Supportability/Python/Harvest/Upload/analytic_event_data', 1),
+            ('Supportability/Python/Harvest/Upload/span_event_data', 1),
+            ('Supportability/Python/Harvest/Upload/custom_event_data', 1),
+            ('Supportability/Python/Harvest/Upload/error_event_data', 1),
+            ('Supportability/Python/Harvest/Upload/error_data', 1)],
+            endpoints_called)
+    @capture_thread
+    def _test():
+        app = Application('Python Agent Test (Harvest Loop)')
+        app.connect_to_data_collector(None)
+
+        app.record_transaction(transaction_node)
+        app.harvest()
+
+        assert app._stats_engine.span_events.num_seen == 0
+        assert app._stats_engine.custom_events.num_seen == 0
+
+    _test()
+
+    for endpoint in ('analytic_event_data', 'span_event_data',
+            'custom_event_data', 'error_event_data', 'error_data'):
+        assert endpoint in endpoints_called
+        assert upload_threads[endpoint] == \
+                'NR-Harvest-Upload/Python Agent Test (Harvest Loop)'
+
+    # Metric data is only sent once all other uploads are done
+    assert endpoints_called.index('metric_data') > 4
+
+
+@failing_endpoint('span_event_data')
+@override_generic_settings(settings, _concurrent_uploads_settings)
+def test_concurrent_uploads_failure(transaction_node):
+    endpoints_called = []
+
+    @validate_metric_payload(endpoints_called=endpoints_called)
+    def _test():
+        app = Application('Python Agent Test (Harvest Loop)')
+        app.connect_to_data_collector(None)
+
+        app.record_transaction(transaction_node)
+        app.harvest()
+
+        # Only the data which failed to be sent is rolled back
+        assert app._stats_engine.span_events.num_seen
+        assert app._stats_engine.custom_events.num_seen == 0
+        assert app._stats_engine.error_events.num_seen == 0
+
+    _test()
+
+    assert 'custom_event_data' in endpoints_called
+    assert 'metric_data' not in endpoints_called
+
+
+@pytest.mark.parametrize('timeout_settings', (
+    {'harvest.upload_timeout': 0.05},
+    {'harvest.upload_timeouts.custom_event_data': 0.05},
+))
+def test_concurrent_uploads_timeout(transaction_node, timeout_settings):
+    endpoints_called = []
+    unblock = threading.Event()
+
+    @transient_function_wrapper('newrelic.core.agent_protocol',
+            'AgentProtocol.send')
+    def slow_endpoint(wrapped, instance, args, kwargs):
+        def _bind_params(method, *args, **kwargs):
+            return method
+
+        if _bind_params(*args, **kwargs) == 'custom_event_data':
+            unblock.wait(5.0)
+
+        return wrapped(*args, **kwargs)
+
+    @override_generic_settings(settings, dict(_concurrent_uploads_settings,
+            **timeout_settings))
+    @validate_metric_payload([
+            ('Supportability/Python/Harvest/Upload/custom_event_data/Timeout', 1),
+            ('Supportability/Python/Harvest/Upload/span_event_data', 1)],
+            endpoints_called)
+    @slow_endpoint
+    def _test():
+        app = Application('Python Agent Test (Harvest Loop)')
+        app.connect_to_data_collector(None)
+
+        app.record_transaction(transaction_node)
+        app.harvest()
+
+        # Data still in flight is not rolled back
+        assert app._stats_engine.custom_events.num_seen == 0
+
+    try:
+        _test()
+    finally:
+        unblock.set()
+
+    assert 'metric_data' in endpoints_called
+
+
+def test_upload_pool_bounded():
+    pool = HarvestUploadPool('test_upload_pool_bounded', 1)
+    unblock = threading.Event()
+    sent = []
+
+    blocked = HarvestUpload('custom_event_data', unblock.wait,
+            lambda: sent.append('custom_event_data'))
+    queued = HarvestUpload('error_data', lambda: sent.append('sent'),
+            lambda: sent.append('error_data'))
+
+    try:
+        # The upload queued behind the one which is blocked is never
+        # started, so it is treated as having failed.
+
+        with pytest.raises(RetryDataForRequest):
+            send_concurrently([blocked, queued], CustomMetrics(), pool,
+                    timeout=0.05)
+
+        threads = [thread for thread in threading.enumerate()
+                if thread.name == 'NR-Harvest-Upload/test_upload_pool_bounded']
+        assert len(threads) == 1
+
+    finally:
+        unblock.set()
+        pool.shutdown()
+
+    for thread in threads:
+        thread.join(1.0)
+
+    # The cancelled upload is skipped by the worker once it is free.
+
+    assert sent == ['custom_event_data']
+    assert not queued.done.is_set()
+
+
+def test_abandoned_upload_metrics_merged():
+    pool = HarvestUploadPool('test_abandoned_upload_metrics_merged', 1)
+    unblock = threading.Event()
+    sent = []
+
+    def _send():
+        unblock.wait()
+        raise RetryDataForRequest('failed after timing out')
+
+    abandoned = HarvestUpload('custom_event_data', _send,
+            lambda: sent.append('custom_event_data'))
+
+    try:
+        # The upload still being sent when it times out is treated as
+        # having been sent.
+
+        metrics = CustomMetrics()
+        send_concurrently([abandoned], metrics, pool, timeout=0.05)
+
+        assert sent == ['custom_event_data']
+        assert ('Supportability/Python/Harvest/Upload/custom_event_data/'
+                'Lost') not in metrics
+
+        unblock.set()
+        assert abandoned.done.wait(1.0)
+
+        # The failure of the abandoned upload is counted, and merged in
+        # on the next call once it has completed.
+
+        metrics = CustomMetrics()
+        send_concurrently([], metrics, pool, timeout=0.05)
+
+        merged = dict(metrics.metrics())
+        lost = merged['Supportability/Python/Harvest/Upload/'
+                'custom_event_data/Lost']
+        assert lost.call_count == 1
+
+    finally:
+        unblock.set()
+        pool.shutdown()
+
+
+_spool_directory = tempfile.mkdtemp()
+
+
+@failing_endpoint('custom_event_data')
+@override_generic_settings(settings, {
+    'developer_mode': True,
+    'license_key': '**NOT A LICENSE KEY**',
+    'feature_flag': set(),
+    'harvest.spool.enabled': True,
+    'harvest.spool.directory': _spool_directory,
+})
+def test_spooled_payloads_replayed(transaction_node):
+    endpoints_called = []
+
+    @validate_metric_payload([
+            ('Supportability/Python/Harvest/Spool/Spooled', 2)],
+            endpoints_called)
+    def _harvest_failure(app):
+        app.harvest()
+
+    @validate_metric_payload([
+            ('Supportability/Python/Harvest/Spool/Replayed', 2)],
+            endpoints_called)
+    def _harvest_replay(app):
+        app.harvest()
+
+    app = Application('Python Agent Test (Harvest Loop)')
+    app.connect_to_data_collector(None)
+
+    app.record_transaction(transaction_node)
+    _harvest_failure(app)
+
+    # The custom events are spooled rather than being rolled back, with
+    # the error data which follows being spooled without being sent.
+    # The metric data is still sent.
+
+    assert app._stats_engine.custom_events.num_seen == 0
+    assert endpoints_called.count('custom_event_data') == 1
+    assert 'error_data' not in endpoints_called
+    assert 'metric_data' in endpoints_called
+
+    spool = app._payload_spool
+    assert spool.pending
+
+    # Harvest again once the backoff period has passed.
+
+    spool._next_attempt = 0.0
+    _harvest_replay(app)
+
+    assert endpoints_called.count('custom_event_data') == 2
+    assert endpoints_called.count('error_data') == 1
+    assert not spool.pending
+
+    app.internal_agent_shutdown(restart=False)
+    assert app._payload_spool is None
+
+
+@override_generic_settings(settings, {
+    'developer_mode': True,
+    'license_key': '**NOT A LICENSE KEY**',
+    'feature_flag': set(),
+})
+def test_local_aggregator_harvest(transaction_node):
+    from newrelic.core.local_aggregator import LocalAggregator
+
+    class Agent(object):
+        def application(self, app_name):
+            return daemon
+
+    daemon = Application('Python Agent Test (Harvest Loop)')
+    daemon.connect_to_data_collector(None)
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'aggregator.sock')
+    aggregator = LocalAggregator(socket_path, Agent(),
+            {'Python Agent Test (Harvest Loop)': []})
+    aggregator.start()
+
+    try:
+        settings.local_aggregator.socket_path = socket_path
+
+        worker = Application('Python Agent Test (Harvest Loop)')
+        worker.connect_to_data_collector(None)
+
+    finally:
+        settings.local_aggregator.socket_path = None
+
+    try:
+        endpoints_called = []
+
+        @validate_metric_payload(endpoints_called=endpoints_called)
+        def _harvest_worker():
+            worker.record_transaction(transaction_node)
+            worker.harvest()
+
+        _harvest_worker()
+
+        # Harvest payloads are sent to the local aggregator rather than
+        # to the data collector.
+
+        for endpoint in ('analytic_event_data', 'custom_event_data',
+                'error_event_data', 'error_data', 'metric_data'):
+            assert endpoint not in endpoints_called
+
+        assert worker._stats_engine.custom_events.num_seen == 0
+
+        endpoints_called = []
+
+        @validate_metric_payload([
+                ('OtherTransaction/Function/main', 1),
+                ('Supportability/Events/Customer/Seen', 101)],
+                endpoints_called)
+        def _harvest_daemon():
+            daemon.harvest()
+
+        _harvest_daemon()
+
+        for endpoint in ('analytic_event_data', 'custom_event_data',
+                'error_event_data', 'error_data', 'metric_data'):
+            assert endpoint in endpoints_called
+
+    finally:
+        aggregator.stop()
@@ -0,0 +1,113 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.harvest_scheduler import AsyncioHarvestScheduler
+
+
+class FakeAgent(object):
+    def __init__(self, report_period_ms=50):
+        self.settings = finalize_application_settings({"event_harvest_config.report_period_ms": report_period_ms})
+        self.harvests = []
+        self.shutdown = threading.Event()
+
+    def global_settings(self):
+        return self.settings
+
+    def _harvest_shutdown_is_set(self):
+        return self.shutdown.is_set()
+
+    def _harvest(self, kind):
+        # Harvests make blocking calls so must not be run on the loop.
+        time.sleep(0.05)
+        self.harvests.append((kind, threading.current_thread()))
+
+    def _perform_flexible_harvest(self):
+        self._harvest("flexible")
+
+    def _perform_default_harvest(self):
+        self._harvest("default")
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def run_scheduler(loop, agent, duration):
+    scheduler = AsyncioHarvestScheduler(agent)
+    scheduler.default_period = 0.12
+
+    ticks = []
+
+    async def _run():
+        assert scheduler.attach()
+
+        end = loop.time() + duration
+        while loop.time() < end:
+            ticks.append(loop.time())
+            await asyncio.sleep(0.005)
+
+        agent.shutdown.set()
+        scheduler.shutdown()
+        await asyncio.sleep(0.05)
+
+    loop.run_until_complete(_run())
+
+    return scheduler, ticks
+
+
+def test_harvest_scheduler_runs_harvests(loop):
+    agent = FakeAgent()
+    scheduler, ticks = run_scheduler(loop, agent, 0.3)
+
+    kinds = [kind for kind, _ in agent.harvests]
+    assert kinds.count("flexible") >= 2
+    assert kinds.count("default") >= 1
+
+    # Harvests are run off the event loop, which carries on running
+    # while a harvest is in progress.
+
+    assert all(thread is not threading.current_thread() for _, thread in agent.harvests)
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.04
+
+
+def test_harvest_scheduler_stops_on_shutdown(loop):
+    agent = FakeAgent()
+    scheduler, _ = run_scheduler(loop, agent, 0.1)
+
+    count = len(agent.harvests)
+    loop.run_until_complete(asyncio.sleep(0.15))
+
+    assert len(agent.harvests) == count
+    assert scheduler._task is None
+
+    # Once shutdown, the scheduler can not be attached again.
+
+    assert not scheduler.attach(loop)
+
+
+def test_harvest_scheduler_attach_without_loop():
+    scheduler = AsyncioHarvestScheduler(FakeAgent())
+
+    assert not scheduler.attach()
+    assert scheduler.process_id is None
@@ -132,6 +132,24 @@ def insecure_server():
         yield server
 
 
+def keep_alive_response(self):
+    self.server.connections.append(self.connection)
+    content_length = int(self.headers.get("Content-Length", 0))
+    if content_length:
+        self.rfile.read(content_length)
+    self.send_response(200)
+    self.send_header("Content-Length", "0")
+    self.end_headers()
+
+
+@pytest.fixture(scope="module")
+def keep_alive_server():
+    server = InsecureServer(handler=keep_alive_response)
+    server.httpd.RequestHandlerClass.protocol_version = "HTTP/1.1"
+    with server:
+        yield server
+
+
 @pytest.mark.parametrize(
     "scheme,host,port,username,password,expected",
     (
@@ -259,6 +277,74 @@ def test_http_close_connection(server):
     client.close_connection()
 
 
+def test_http_release_connection(keep_alive_server):
+    client = InsecureHttpClient("localhost", keep_alive_server.port)
+
+    status, _ = client.send_request()
+    assert status == 200
+
+    client.release_connection()
+    assert client._connection_attr is None
+
+
+def test_http_keep_alive_connection_reused(keep_alive_server):
+    internal_metrics = CustomMetrics()
+
+    client = InsecureHttpClient("localhost", keep_alive_server.port, keep_alive=True, idle_timeout=60.0)
+
+    try:
+        with InternalTraceContext(internal_metrics):
+            for _ in range(3):
+                status, _ = client.send_request()
+                assert status == 200
+
+                # The connection is held on to after each harvest.
+
+                client.release_connection()
+                assert client._connection_attr is not None
+
+    finally:
+        client.close_connection()
+
+    internal_metrics = dict(internal_metrics.metrics())
+
+    assert internal_metrics["Supportability/Python/Collector/Connection/New"][0] == 1
+    assert internal_metrics["Supportability/Python/Collector/Connection/Reused"][0] == 2
+    assert internal_metrics["Supportability/Python/Collector/Connection/Handshake"][0] == 1
+
+
+def test_http_keep_alive_idle_timeout(keep_alive_server):
+    internal_metrics = CustomMetrics()
+
+    client = InsecureHttpClient("localhost", keep_alive_server.port, keep_alive=True, idle_timeout=60.0)
+
+    try:
+        with InternalTraceContext(internal_metrics):
+            status, _ = client.send_request()
+            assert status == 200
+
+            connection = client._connection_attr
+
+            # Pretend the connection has been idle for longer than the
+            # idle timeout, so it is replaced on the next request.
+
+            client._last_used -= 120.0
+
+            status, _ = client.send_request()
+            assert status == 200
+
+            assert client._connection_attr is not connection
+            assert connection.pool is None
+
+    finally:
+        client.close_connection()
+
+    internal_metrics = dict(internal_metrics.metrics())
+
+    assert internal_metrics["Supportability/Python/Collector/Connection/New"][0] == 2
+    assert "Supportability/Python/Collector/Connection/Reused" not in internal_metrics
+
+
 def test_http_close_connection_in_context_manager():
     client = HttpClient("localhost", 1000)
     with client:
@@ -276,7 +362,8 @@ def test_http_close_connection_in_context_manager():
         (ApplicationModeClient, "deflate", 100),
     ),
 )
-def test_http_payload_compression(server, client_cls, method, threshold):
+@pytest.mark.parametrize("streamed", (False, True))
+def test_http_payload_compression(server, client_cls, method, threshold, streamed):
     payload = b"*" * 20
 
     internal_metrics = CustomMetrics()
@@ -289,7 +376,11 @@ def test_http_payload_compression(server, client_cls, method, threshold):
         compression_threshold=threshold,
     ) as client:
         with InternalTraceContext(internal_metrics):
-            status, data = client.send_request(payload=payload, params={"method": "test"})
+            if streamed:
+                chunks = iter((payload[:7], payload[7:]))
+                status, data = client.send_request(payload=chunks, params={"method": "test"})
+            else:
+                status, data = client.send_request(payload=payload, params={"method": "test"})
 
     assert status == 200
     data = data.split(b"\n")
@@ -0,0 +1,198 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import os
+import shutil
+import stat
+import tempfile
+
+import pytest
+
+import newrelic.core.local_aggregator as local_aggregator
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.local_aggregator import (
+    AggregatorClient,
+    AggregatorUnavailable,
+    LocalAggregator,
+)
+from newrelic.core.stats_engine import StatsEngine
+
+
+class FakeApplication(object):
+    def __init__(self, active=True):
+        self.active = active
+        self.merged = []
+
+    def merge_forwarded_payload(self, method, payload):
+        if self.active:
+            self.merged.append((method, payload))
+        return self.active
+
+
+class FakeAgent(object):
+    def __init__(self):
+        self.applications = {}
+        self.activated = []
+
+    def application(self, app_name):
+        return self.applications.get(app_name)
+
+    def activate_application(self, app_name, linked_applications=None):
+        self.activated.append((app_name, linked_applications))
+
+
+@pytest.fixture
+def socket_path():
+    directory = tempfile.mkdtemp()
+    try:
+        yield os.path.join(directory, "aggregator.sock")
+    finally:
+        shutil.rmtree(directory)
+
+
+@pytest.fixture
+def aggregator(socket_path):
+    aggregator = LocalAggregator(socket_path, FakeAgent(), {"app": ["linked"]})
+    aggregator.start()
+    try:
+        yield aggregator
+    finally:
+        aggregator.stop()
+
+
+def test_aggregator_merges_payload(aggregator):
+    application = aggregator.agent.applications["app"] = FakeApplication()
+
+    client = AggregatorClient(aggregator.path, "app", ["linked"])
+    client.send("custom_event_data", ["1234", {"events_seen": 1}, [[{"type": "Custom"}, {}]]])
+
+    assert application.merged == [("custom_event_data", ["1234", {"events_seen": 1}, [[{"type": "Custom"}, {}]]])]
+
+
+def test_aggregator_activates_application(aggregator):
+    client = AggregatorClient(aggregator.path, "app", ["other"])
+
+    # The payload is rejected until the application is active, so the
+    # worker process sends it itself.
+
+    with pytest.raises(AggregatorUnavailable):
+        client.send("error_data", ["1234", []])
+
+    # The application is linked to the applications configured for the
+    # local aggregator, not those sent by the worker process.
+
+    assert aggregator.agent.activated == [("app", ["linked"])]
+
+    aggregator.agent.applications["app"] = FakeApplication(active=False)
+
+    with pytest.raises(AggregatorUnavailable):
+        client.send("error_data", ["1234", []])
+
+
+def test_aggregator_rejects_unconfigured_application(aggregator):
+    client = AggregatorClient(aggregator.path, "unknown")
+
+    with pytest.raises(AggregatorUnavailable):
+        client.send("error_data", ["1234", []])
+
+    assert aggregator.agent.activated == []
+
+
+def test_aggregator_socket_permissions(aggregator):
+    assert stat.S_IMODE(os.stat(aggregator.path).st_mode) == 0o600
+
+
+@pytest.mark.parametrize(
+    "limit",
+    [
+        "_MAXIMUM_MESSAGE_SIZE",
+        "_MAXIMUM_DECOMPRESSED_SIZE",
+    ],
+)
+def test_aggregator_rejects_large_message(aggregator, monkeypatch, limit):
+    application = aggregator.agent.applications["app"] = FakeApplication()
+
+    monkeypatch.setattr(local_aggregator, limit, 1024)
+
+    client = AggregatorClient(aggregator.path, "app")
+
+    # Random data is used so the message doesn't compress below the limit.
+
+    value = binascii.hexlify(os.urandom(4096)).decode("ascii")
+
+    with pytest.raises(AggregatorUnavailable):
+        client.send("custom_event_data", ["1234", {"events_seen": 1}, [[{"type": "Custom"}, {"value": value}]]])
+
+    assert application.merged == []
+
+
+def test_aggregator_not_running(socket_path):
+    client = AggregatorClient(socket_path, "app")
+
+    with pytest.raises(AggregatorUnavailable):
+        client.send("metric_data", ["1234", 0, 1, []])
+
+
+def test_aggregator_stop_removes_socket(socket_path):
+    aggregator = LocalAggregator(socket_path, FakeAgent(), {"app": []})
+    aggregator.start()
+
+    assert os.path.exists(socket_path)
+
+    aggregator.stop()
+
+    assert not os.path.exists(socket_path)
+
+
+def test_stats_engine_merge_forwarded_payload():
+    stats = StatsEngine()
+    stats.reset_stats(finalize_application_settings())
+
+    stats.record_custom_metric("Custom/Value", 2.0)
+
+    stats.merge_forwarded_payload(
+        "metric_data",
+        [
+            "1234",
+            0,
+            1,
+            [
+                [{"name": "Custom/Value", "scope": ""}, [2, 4.0, 4.0, 1.0, 3.0, 10.0]],
+                [{"name": "Apdex/Function/app", "scope": ""}, [1, 2, 0, 0.5, 0.5, 0]],
+            ],
+        ],
+    )
+
+    def metric(name):
+        return [value for key, value in stats.metric_data() if key["name"] == name][0]
+
+    assert list(metric("Custom/Value")) == [3, 6.0, 6.0, 1.0, 3.0, 14.0]
+    assert list(metric("Apdex/Function/app")) == [1, 2, 0, 0.5, 0.5, 0]
+
+    stats.merge_forwarded_payload(
+        "analytic_event_data",
+        [
+            "1234",
+            {"reservoir_size": 10, "events_seen": 5},
+            [
+                [{"type": "Transaction", "priority": 1.5}, {}, {}],
+                [{"type": "Transaction", "nr.syntheticsResourceId": "r"}, {}, {}],
+            ],
+        ],
+    )
+
+    assert stats.transaction_events.num_samples == 1
+    assert stats.transaction_events.num_seen == 4
+    assert len(stats.synthetics_events) == 1
@@ -0,0 +1,229 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+import pytest
+from testing_support.mock_external_http_server import MockExternalHTTPServer
+
+from newrelic.common.agent_http import InsecureHttpClient
+from newrelic.core.agent_protocol import AgentProtocol
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.data_collector import Session
+from newrelic.core.internal_metrics import InternalTraceContext
+from newrelic.core.payload_spool import PayloadSpool
+from newrelic.core.stats_engine import CustomMetrics
+from newrelic.network.exceptions import RetryDataForRequest
+
+try:
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from urllib.parse import parse_qs, urlparse
+
+
+def collector_response(self):
+    content_length = int(self.headers.get("Content-Length", 0))
+    body = self.rfile.read(content_length) if content_length else b""
+    method = parse_qs(urlparse(self.path).query)["method"][0]
+
+    self.server.requests.append((method, json.loads(body.decode("utf-8"))))
+
+    if self.server.fail:
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return
+
+    response = b'{"return_value": null}'
+
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+
+@pytest.fixture
+def collector():
+    with MockExternalHTTPServer(handler=collector_response) as server:
+        server.httpd.requests = []
+        server.httpd.fail = False
+        yield server
+
+
+def spool_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".spool"))
+
+
+def test_spool_append_and_replay(tmpdir):
+    directory = str(tmpdir)
+    spool = PayloadSpool(directory, "app", segment_size=1)
+
+    for i in range(3):
+        assert spool.append("custom_event_data", ["run", {"index": i}, ["x" * 50]])
+
+    # Each record fills a segment, so has a segment of its own.
+
+    assert len(spool_files(directory)) == 3
+    assert spool.pending
+
+    sent = []
+    assert spool.replay(lambda method, payload: sent.append((method, payload))) == 3
+
+    assert sent == [("custom_event_data", ["run", {"index": i}, ["x" * 50]]) for i in range(3)]
+    assert not spool.pending
+    assert spool_files(directory) == []
+
+
+def test_spool_discards_oldest_segment(tmpdir):
+    directory = str(tmpdir)
+    spool = PayloadSpool(directory, "app", max_size=100, segment_size=1)
+
+    metrics = CustomMetrics()
+
+    with InternalTraceContext(metrics):
+        for i in range(10):
+            assert spool.append("error_data", ["run", [str(i) * 100]])
+
+    metrics = dict(metrics.metrics())
+
+    dropped = metrics["Supportability/Python/Harvest/Spool/Dropped"][0]
+    assert dropped
+    assert metrics["Supportability/Python/Harvest/Spool/Spooled"][0] == 10
+
+    sent = []
+    spool.replay(lambda method, payload: sent.append(payload[1][0][0]))
+
+    # The most recent payloads are the ones kept.
+
+    assert sent == [str(i) for i in range(dropped, 10)]
+
+
+def test_spool_replay_backoff(tmpdir):
+    spool = PayloadSpool(str(tmpdir), "app")
+
+    for i in range(3):
+        spool.append("span_event_data", ["run", {}, [i]])
+
+    sent = []
+
+    def send(method, payload):
+        if len(sent) == 1:
+            raise RetryDataForRequest()
+        sent.append(payload[2][0])
+
+    assert spool.replay(send) == 1
+    assert spool.deferring()
+    assert spool._backoff == spool.initial_backoff
+
+    spool.failed()
+    assert spool._backoff == 2 * spool.initial_backoff
+
+    spool.succeeded()
+    assert not spool.deferring()
+
+    assert spool.replay(lambda method, payload: sent.append(payload[2][0])) == 2
+    assert sent == [0, 1, 2]
+
+
+def test_spool_too_large_payload(tmpdir):
+    spool = PayloadSpool(str(tmpdir), "app", max_size=16)
+
+    assert not spool.append("error_data", ["run", ["too large"]])
+    assert not spool.pending
+
+
+def test_spool_private_directory():
+    spool = PayloadSpool(None, "app")
+
+    assert spool.append("error_data", ["run", [0]])
+
+    directory = spool.directory
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert len(spool_files(directory)) == 1
+
+    spool.close()
+
+    assert not os.path.exists(directory)
+
+
+def test_spool_rejects_shared_directory(tmpdir):
+    directory = str(tmpdir.mkdir("shared"))
+    os.chmod(directory, 0o777)
+
+    spool = PayloadSpool(directory, "app")
+
+    assert not spool.append("error_data", ["run", [0]])
+    assert spool_files(directory) == []
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="Symbolic links are not supported.")
+def test_spool_does_not_follow_symlinks(tmpdir):
+    directory = str(tmpdir)
+    target = tmpdir.join("target")
+    target.write("original")
+
+    spool = PayloadSpool(directory, "app")
+    os.symlink(str(target), os.path.join(directory, "app-%d-%08d.spool" % (os.getpid(), 1)))
+
+    assert not spool.append("error_data", ["run", [0]])
+    assert target.read() == "original"
+
+
+def test_session_spools_while_collector_unreachable(collector, tmpdir):
+    settings = finalize_application_settings({"agent_run_id": "1234"})
+    settings.host = "localhost"
+    settings.port = collector.port
+
+    class StandInSession(Session):
+        def __init__(self, settings):
+            self._protocol = AgentProtocol(settings, client_cls=InsecureHttpClient)
+            self._rpc = None
+
+    session = StandInSession(settings)
+    spool = session.spool = PayloadSpool(str(tmpdir), "app")
+
+    requests = collector.httpd.requests
+    collector.httpd.fail = True
+
+    session.send_custom_events({"events_seen": 1}, [["custom"]])
+
+    # Once sending has failed, payloads are spooled without trying to
+    # send them.
+
+    session.send_error_events({"events_seen": 1}, [["error"]])
+
+    assert [method for method, _ in requests] == ["custom_event_data"]
+    assert session.replay_spooled_payloads() == 0
+
+    # Metric data is not spooled, so is still rolled back on failure.
+
+    with pytest.raises(RetryDataForRequest):
+        session.send_metric_data(0, 1, [])
+
+    # Replay once the collector can be reached again, in a later agent
+    # run, once the backoff period has passed.
+
+    del requests[:]
+    collector.httpd.fail = False
+    settings.agent_run_id = "5678"
+    spool._next_attempt = 0.0
+
+    assert session.replay_spooled_payloads() == 2
+
+    assert requests == [
+        ("custom_event_data", ["5678", {"events_seen": 1}, [["custom"]]]),
+        ("error_event_data", ["5678", {"events_seen": 1}, [["error"]]]),
+    ]
+    assert not spool.pending
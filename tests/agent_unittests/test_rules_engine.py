@@ -0,0 +1,122 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from newrelic.core.rules_engine import RulesEngine
+
+
+def rule(match_expression, replacement="", eval_order=0, **kwargs):
+    values = {
+        "match_expression": match_expression,
+        "replacement": replacement,
+        "ignore": False,
+        "eval_order": eval_order,
+        "terminate_chain": False,
+        "each_segment": False,
+        "replace_all": False,
+    }
+    values.update(kwargs)
+    return values
+
+
+RULES = [
+    rule(r"^/users/\d+", "/users/*", eval_order=1),
+    rule(r"^/static/.*", "/static/*", eval_order=2, terminate_chain=True),
+    rule(r"\.php$", ".*", eval_order=3),
+    rule(r"^[0-9a-f]{32}$", "*", eval_order=4, each_segment=True),
+    rule(r"^/health$", "/health", eval_order=5, ignore=True),
+    rule(r"^/(a+)/\1$", "/repeat", eval_order=6),
+    rule(r"/orders/(\d+)", r"/orders/\\1", eval_order=7, replace_all=True),
+]
+
+NAMES = [
+    "/users/42/profile",
+    "/static/css/site.css",
+    "/index.php",
+    "/items/0123456789abcdef0123456789abcdef/view",
+    "/health",
+    "/aa/aa",
+    "/orders/1/orders/2",
+    "/unmatched/path",
+    b"/users/\xe9",
+]
+
+
+@pytest.mark.parametrize("cache_size,fuse_rules", ((100, False), (0, True), (100, True)))
+def test_rules_engine_matches_default(cache_size, fuse_rules):
+    default = RulesEngine(RULES)
+    engine = RulesEngine(RULES, cache_size=cache_size, fuse_rules=fuse_rules)
+
+    for _ in range(2):
+        for name in NAMES:
+            assert engine.normalize(name) == default.normalize(name), name
+
+
+def test_rules_engine_cache_eviction():
+    engine = RulesEngine(RULES, cache_size=2)
+
+    engine.normalize("/a")
+    engine.normalize("/b")
+    engine.normalize("/a")
+    engine.normalize("/c")
+
+    # The least recently used name is the one evicted.
+    assert list(engine._cache) == ["/a", "/c"]
+    assert engine.harvest_counts() == (1, 3)
+    assert engine.harvest_counts() == (0, 0)
+
+
+def test_rules_engine_no_rules_not_cached():
+    engine = RulesEngine([], cache_size=10)
+
+    assert engine.normalize(b"/path") == (u"/path", False)
+    assert not engine._cache
+    assert engine.harvest_counts() == (0, 0)
+
+
+def test_rules_engine_fused_passes():
+    passes = RulesEngine._fuse_rules(RulesEngine(RULES).rules)
+
+    # The segment rule and the rule using a backreference in its pattern
+    # are applied on their own, with the remaining runs being combined.
+    assert [(match_any_re is not None, len(rules)) for match_any_re, rules in passes] == [
+        (True, 3),
+        (False, 1),
+        (False, 1),
+        (False, 1),
+        (False, 1),
+    ]
+
+
+def test_rules_engine_many_rules():
+    rules = [rule(r"^/prefix%d/" % i, "/p/", eval_order=i) for i in range(20)]
+    rules.append(rule(r"^\d+$", "*", eval_order=20, each_segment=True))
+    names = ["/users/%d/orders/%d" % (i % 10, i % 7) for i in range(100)] + ["/prefix%d/x" % i for i in range(20)]
+
+    default = RulesEngine(rules)
+    cached = RulesEngine(rules, cache_size=1000)
+    fused = RulesEngine(rules, fuse_rules=True)
+
+    for _ in range(5):
+        for name in names:
+            expected = default.normalize(name)
+            assert cached.normalize(name) == expected, name
+            assert fused.normalize(name) == expected, name
+
+    # Each distinct name is normalized once, with repeats served from
+    # the cache.
+
+    distinct = len(set(names))
+    assert cached.harvest_counts() == (5 * len(names) - distinct, distinct)
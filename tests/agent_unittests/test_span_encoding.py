@@ -0,0 +1,152 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+
+import pytest
+
+from newrelic.common.streaming_utils import SpanBatch, StreamBuffer, encode_span
+
+# The protocol buffers library isn't a dependency of these tests, so the
+# serialized messages are checked with a minimal decoder of the wire format.
+
+
+def decode_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def decode_fields(data):
+    data = bytearray(data)
+    fields = []
+    offset = 0
+
+    while offset < len(data):
+        tag, offset = decode_varint(data, offset)
+        number, wire_type = tag >> 3, tag & 0x7
+
+        if wire_type == 0:
+            value, offset = decode_varint(data, offset)
+        elif wire_type == 1:
+            (value,) = struct.unpack("<d", bytes(data[offset : offset + 8]))
+            offset += 8
+        else:
+            assert wire_type == 2
+            length, offset = decode_varint(data, offset)
+            value = bytes(data[offset : offset + length])
+            offset += length
+
+        fields.append((number, value))
+
+    return fields
+
+
+def decode_attribute_value(data):
+    ((number, value),) = decode_fields(data)
+
+    if number == 1:
+        return value.decode("utf-8")
+    elif number == 2:
+        return bool(value)
+    elif number == 3:
+        return value - (1 << 64) if value >= (1 << 63) else value
+    return value
+
+
+def decode_span(data):
+    span = {"trace_id": "", 2: {}, 3: {}, 4: {}}
+
+    for number, value in decode_fields(data):
+        if number == 1:
+            span["trace_id"] = value.decode("utf-8")
+        else:
+            (_, key), (_, attribute_value) = decode_fields(value)
+            span[number][key.decode("utf-8")] = decode_attribute_value(attribute_value)
+
+    return span["trace_id"], span[2], span[3], span[4]
+
+
+def test_encode_span():
+    intrinsics = {
+        "name": u"Function/café",
+        "timestamp": 1600000000000,
+        "duration": 0.25,
+        "sampled": True,
+        "nr.entryPoint": False,
+        "negative": -2,
+        "large": 1 << 70,
+        "empty": "",
+    }
+    user_attributes = {"long": "x" * 200}
+    agent_attributes = {"http.statusCode": 200, "zero": 0}
+
+    span = encode_span("trace-id", intrinsics, user_attributes, agent_attributes)
+
+    expected_intrinsics = dict(intrinsics)
+    expected_intrinsics["large"] = str(1 << 70)
+
+    assert decode_span(span) == ("trace-id", expected_intrinsics, user_attributes, agent_attributes)
+
+
+def test_encode_span_empty():
+    assert encode_span(None, {}, {}, {}) == b""
+
+
+@pytest.mark.parametrize("spans", (1, 3, SpanBatch.max_spans + 1))
+def test_stream_buffer_batching(spans):
+    stream_buffer = StreamBuffer(200, batching=True)
+
+    for i in range(spans):
+        stream_buffer.put(encode_span("trace-id", {"index": i}, {}, {}))
+
+    indexes = []
+    batches = 0
+
+    iterator = iter(stream_buffer)
+
+    while stream_buffer._queue:
+        batch = next(iterator)
+        batches += 1
+
+        fields = decode_fields(batch)
+        assert len(fields) <= SpanBatch.max_spans
+
+        for number, span in fields:
+            assert number == 1
+            indexes.append(decode_span(span)[1]["index"])
+
+    assert indexes == list(range(spans))
+    assert batches == (spans - 1) // SpanBatch.max_spans + 1
+
+
+def test_span_batch_buffer_reused():
+    batch = SpanBatch()
+    span = encode_span("trace-id", {"name": "span"}, {}, {})
+
+    batch.add(span)
+    batch.add(span)
+    assert len(batch) == 2
+
+    data = batch.serialize()
+    assert [value for _, value in decode_fields(data)] == [span, span]
+
+    assert len(batch) == 0
+    batch.add(span)
+    assert batch.serialize() == data[: len(data) // 2]
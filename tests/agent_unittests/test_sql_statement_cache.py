@@ -0,0 +1,119 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+import pytest
+
+from newrelic.core.database_utils import (
+    SQLDatabase,
+    SQLStatement,
+    SQLStatementCache,
+    _sql_shape,
+)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), os.pardir, "cross_agent", "fixtures", "sql_parsing.json")
+
+
+class DummyDBModule(object):
+    _nr_quoting_style = "single"
+
+
+def load_statements():
+    with open(FIXTURE, "r") as fh:
+        tests = json.load(fh)
+    return [test["input"] for test in tests]
+
+
+def parsed(statement):
+    return statement.operation, statement.target
+
+
+def counts(cache):
+    return {name: count for name, count in cache.harvest_counts().items() if count}
+
+
+@pytest.mark.parametrize(
+    "sql,shape",
+    (
+        ("SELECT * FROM users WHERE id = 42", "SELECT * FROM users WHERE id = ?"),
+        ("SELECT * FROM users WHERE id IN (1, 2, 3)", "SELECT * FROM users WHERE id IN (?)"),
+        ("SELECT * FROM users WHERE name = 'o''brien'", "SELECT * FROM users WHERE name = ?"),
+        ("SELECT * FROM t1 WHERE x LIKE 'a%'", "SELECT * FROM t1 WHERE x LIKE ?"),
+        ('SELECT * FROM "table 1" WHERE x = 1.5', 'SELECT * FROM "table 1" WHERE x = ?'),
+        ("INSERT INTO 'table' VALUES (:1, :name)", "INSERT INTO 'table' VALUES (:1, :name)"),
+        ("SELECT * FROM t -- comment", None),
+        ("SELECT * FROM t /* comment */", None),
+    ),
+)
+def test_sql_shape(sql, shape):
+    assert _sql_shape(sql) == shape
+
+
+def test_sql_statement_cache_matches_parsing():
+    # A single entry exact cache means almost every lookup falls through
+    # to the shape cache.
+
+    cache = SQLStatementCache(maximum=1)
+    database = SQLDatabase(DummyDBModule)
+
+    statements = load_statements()
+
+    for _ in range(2):
+        for sql in statements:
+            assert parsed(cache.get(sql, DummyDBModule)) == parsed(SQLStatement(sql, database)), sql
+
+
+def test_sql_statement_cache_shape_reuse():
+    cache = SQLStatementCache()
+
+    for i in range(1, 4):
+        statement = cache.get("SELECT * FROM users WHERE id IN (%s)" % ", ".join(["%d" % i] * i), DummyDBModule)
+        if i > 1:
+            # Taken from the earlier statement of the same shape.
+            assert statement._uncommented is None
+        assert parsed(statement) == ("select", "users")
+
+    assert counts(cache) == {"Exact/Misses": 3, "Shape/Misses": 1, "Shape/Hits": 2}
+
+
+def test_sql_statement_cache_exact_eviction():
+    cache = SQLStatementCache(maximum=2, memory_limit=20, shape_maximum=0)
+
+    first = cache.get("SELECT 1", DummyDBModule)
+    cache.get("SELECT 2", DummyDBModule)
+    assert cache.get("SELECT 1", DummyDBModule) is first
+
+    # Evicted as the least recently used when the count is exceeded.
+    cache.get("SELECT 3", DummyDBModule)
+    assert list(cache._statements) == [("SELECT 1", DummyDBModule), ("SELECT 3", DummyDBModule)]
+
+    # Evicted as the total length of the statements exceeds the limit.
+    cache.get("SELECT 1234567890", DummyDBModule)
+    assert list(cache._statements) == [("SELECT 1234567890", DummyDBModule)]
+    assert cache._statements_size == 17
+
+    assert counts(cache) == {"Exact/Hits": 1, "Exact/Misses": 4, "Exact/Evictions": 3}
+    assert counts(cache) == {}
+
+
+def test_sql_statement_cache_shape_eviction():
+    cache = SQLStatementCache(shape_maximum=1)
+
+    cache.get("SELECT * FROM a WHERE x = 1", DummyDBModule)
+    cache.get("SELECT * FROM b WHERE x = 1", DummyDBModule)
+    cache.get("SELECT * FROM a WHERE x = 2", DummyDBModule)
+
+    assert counts(cache) == {"Exact/Misses": 3, "Shape/Misses": 3, "Shape/Evictions": 2}
@@ -0,0 +1,149 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+import pytest
+from testing_support.fixtures import override_generic_settings
+
+from newrelic.core.config import global_settings
+from newrelic.core.database_utils import (
+    SQLStatement,
+    _normalize_sql,
+    _obfuscate_sql,
+    _parse_operation,
+    _parse_target,
+    _tokenize_sql,
+    _uncomment_sql,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, "cross_agent", "fixtures")
+
+QUOTING_STYLES = {
+    "sqlite": "single",
+    "mysql": "single+double",
+    "postgres": "single+dollar",
+    "oracle": "single+oracle",
+    "cassandra": "single",
+}
+
+
+class DummyDB(object):
+    def __init__(self, quoting_style="single"):
+        self.quoting_style = quoting_style
+
+
+def load_fixture(*path):
+    with open(os.path.join(FIXTURES, *path), "r") as fh:
+        return json.load(fh)
+
+
+def obfuscation_tests():
+    # Statements with quotes within comments are excluded as the regular
+    # expressions obfuscate the quotes before removing the comments.
+
+    tests = load_fixture("sql_obfuscation", "sql_obfuscation.json")
+    return [
+        (test["sql"], QUOTING_STYLES[dialect])
+        for test in tests
+        if not test.get("pathological")
+        for dialect in test["dialects"]
+    ]
+
+
+def parsing_tests():
+    return [test["input"] for test in load_fixture("sql_parsing.json")]
+
+
+def regex_path(sql, database):
+    obfuscated = _uncomment_sql(_obfuscate_sql(sql, database))
+    uncommented = _uncomment_sql(sql)
+    operation = _parse_operation(uncommented)
+    return obfuscated, _normalize_sql(obfuscated), operation, _parse_target(uncommented, operation)
+
+
+def single_pass(sql, database):
+    obfuscated, normalized, uncommented = _tokenize_sql(sql, database)
+    operation = _parse_operation(uncommented)
+    return obfuscated, normalized, operation, _parse_target(uncommented, operation)
+
+
+@pytest.mark.parametrize("sql,quoting_style", obfuscation_tests())
+def test_tokenize_matches_regex_obfuscation(sql, quoting_style):
+    database = DummyDB(quoting_style)
+    assert single_pass(sql, database) == regex_path(sql, database)
+
+
+@pytest.mark.parametrize("sql", parsing_tests())
+def test_tokenize_matches_regex_parsing(sql):
+    database = DummyDB()
+    assert single_pass(sql, database) == regex_path(sql, database)
+
+
+@pytest.mark.parametrize(
+    "sql,quoting_style,obfuscated,normalized",
+    (
+        (
+            "SELECT * FROM t WHERE a IN (1, 2, 'x') AND b = %s",
+            "single",
+            "SELECT * FROM t WHERE a IN (?, ?, ?) AND b = %s",
+            "SELECT*FROM t WHERE a IN(?)AND b=?",
+        ),
+        (
+            "SELECT * FROM t WHERE a = :1 AND b = %(b)s",
+            "single",
+            "SELECT * FROM t WHERE a = :1 AND b = %(b)s",
+            "SELECT*FROM t WHERE a=?AND b=?",
+        ),
+        ("SELECT $a$x$a$, $1 FROM t", "single+dollar", "SELECT ?, $? FROM t", "SELECT?,$?FROM t"),
+        ("SELECT * FROM t WHERE a = ( )", "single", "SELECT * FROM t WHERE a = ( )", "SELECT*FROM t WHERE a=(?)"),
+        ("SELECT * FROM t WHERE a = 'unterminated", "single", "?", "?"),
+        # Literals are only recognised at the start of a word, so unlike
+        # the regular expressions, identifiers are left intact.
+        ("SELECT col0x1f FROM t", "single", "SELECT col0x1f FROM t", "SELECT col0x1f FROM t"),
+    ),
+)
+def test_tokenize_sql(sql, quoting_style, obfuscated, normalized):
+    assert _tokenize_sql(sql, DummyDB(quoting_style))[:2] == (obfuscated, normalized)
+
+
+@override_generic_settings(global_settings(), {"sql_parser.single_pass": True})
+def test_sql_statement_single_pass():
+    statement = SQLStatement("/* c */ SELECT * FROM users WHERE id IN (1, 2)", DummyDB())
+
+    assert statement.obfuscated == " SELECT * FROM users WHERE id IN (?, ?)"
+    assert statement.normalized == "SELECT*FROM users WHERE id IN(?)"
+    assert statement.operation == "select"
+    assert statement.target == "users"
+
+
+def long_statements():
+    return [
+        "SELECT "
+        + ", ".join("alias_%d.column_%d AS result_%d" % (i % 7, i, i) for i in range(300))
+        + " FROM a JOIN b ON a.id = b.a_id WHERE "
+        + " AND ".join(
+            "alias_%d.c%d = '%s' OR alias_%d.d%d IN (1, 2, 3)" % (i % 7, i, "v" * i, i % 7, i) for i in range(100)
+        ),
+        "SELECT id FROM users WHERE id IN (%s)" % ", ".join(str(i) for i in range(2000)),
+        "INSERT INTO events (id, name, value) VALUES "
+        + ", ".join("(%d, 'name %d', %d.5)" % (i, i, i) for i in range(300)),
+    ]
+
+
+@pytest.mark.parametrize("sql", long_statements())
+def test_tokenize_matches_regex_long_statements(sql):
+    database = DummyDB()
+    assert single_pass(sql, database) == regex_path(sql, database)
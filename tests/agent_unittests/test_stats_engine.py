@@ -0,0 +1,269 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from newrelic.core.config import finalize_application_settings
+from newrelic.core.metric import AggregateTimeMetric, TimeMetric
+from newrelic.core.stats_engine import SampledDataSet, StatsEngine
+
+
+@pytest.fixture
+def stats_engine():
+    engine = StatsEngine()
+    engine.reset_stats(finalize_application_settings())
+    return engine
+
+
+def double_buffered_engine(double_buffered=True):
+    engine = StatsEngine()
+    engine.reset_stats(finalize_application_settings({"stats_engine.double_buffered_harvest": double_buffered}))
+    return engine
+
+
+def time_metrics():
+    for i in range(100):
+        yield TimeMetric(
+            name="Datastore/statement/Redis/get", scope="OtherTransaction/Celery/task", duration=0.25, exclusive=0.25
+        )
+        yield TimeMetric(name="Datastore/all", scope="", duration=0.25, exclusive=None)
+    yield TimeMetric(name="Function/task", scope=None, duration=50.0, exclusive=0.0)
+
+
+def test_record_time_metrics_merged_count(stats_engine):
+    assert stats_engine.record_time_metrics(time_metrics()) == 3
+    assert stats_engine.metrics_count() == 3
+
+    # A second transaction merges into the existing metrics.
+    assert stats_engine.record_time_metrics(time_metrics()) == 3
+    assert stats_engine.metrics_count() == 3
+
+
+def test_record_time_metrics_matches_record_time_metric(stats_engine):
+    expected = StatsEngine()
+    expected.reset_stats(stats_engine.settings)
+
+    for _ in range(2):
+        stats_engine.record_time_metrics(time_metrics())
+        for metric in time_metrics():
+            expected.record_time_metric(metric)
+
+    assert sorted(stats_engine.stats_table) == sorted(expected.stats_table)
+
+    for key, stats in expected.stats_table.items():
+        assert stats_engine.stats_table[key] == pytest.approx(stats)
+
+    stats = stats_engine.stats_table[("Datastore/statement/Redis/get", "OtherTransaction/Celery/task")]
+    assert stats.call_count == 200
+    assert stats.total_call_time == 50.0
+    assert stats.min_call_time == 0.25
+    assert stats.max_call_time == 0.25
+
+
+def test_record_time_metrics_no_settings():
+    assert StatsEngine().record_time_metrics(time_metrics()) == 0
+
+
+def test_record_aggregate_time_metrics(stats_engine):
+    durations = (0.25, 0.5, 0.75)
+
+    expected = StatsEngine()
+    expected.reset_stats(stats_engine.settings)
+    expected.record_time_metrics(
+        TimeMetric(name="Datastore/all", scope="", duration=duration, exclusive=duration) for duration in durations
+    )
+
+    aggregate = AggregateTimeMetric(
+        name="Datastore/all",
+        scope="",
+        duration=1.5,
+        exclusive=1.5,
+        call_count=3,
+        min_call_time=0.25,
+        max_call_time=0.75,
+        sum_of_squares=sum(duration ** 2 for duration in durations),
+    )
+
+    stats_engine.record_time_metrics([aggregate])
+    assert stats_engine.stats_table[("Datastore/all", "")] == expected.stats_table[("Datastore/all", "")]
+
+    stats_engine.record_time_metric(aggregate)
+    stats = stats_engine.stats_table[("Datastore/all", "")]
+    assert stats.call_count == 6
+    assert stats.min_call_time == 0.25
+    assert stats.max_call_time == 0.75
+
+
+def record_events(engine, count):
+    for i in range(count):
+        engine.span_events.add({"id": i}, priority=i)
+        engine.custom_events.add({"id": i}, priority=i)
+
+
+def test_double_buffered_harvest_reuses_data_sets():
+    engine = double_buffered_engine()
+    record_events(engine, 10)
+
+    span_events = engine.span_events
+    snapshot = engine.harvest_snapshot()
+    assert snapshot.span_events is span_events
+    assert engine.span_events is not span_events
+
+    # Sending the data hands the data set back as the spare buffer.
+    snapshot.reset_span_events()
+    assert snapshot.span_events is None
+
+    record_events(engine, 5)
+    snapshot = engine.harvest_snapshot()
+    assert engine.span_events is span_events
+    assert engine.span_events.num_seen == 0
+    assert engine.span_events.num_samples == 0
+    assert snapshot.span_events.num_seen == 5
+
+
+def test_double_buffered_harvest_disabled():
+    engine = double_buffered_engine(False)
+    assert not engine.double_buffered
+
+    snapshot = engine.harvest_snapshot()
+    span_events = snapshot.span_events
+    snapshot.reset_span_events()
+
+    engine.harvest_snapshot()
+    assert engine.span_events is not span_events
+
+
+def test_double_buffered_rollback_unsent():
+    engine = double_buffered_engine()
+    record_events(engine, 10)
+
+    snapshot = engine.harvest_snapshot()
+    custom_events = snapshot.custom_events
+
+    # Span events were sent so only custom events are rolled back. The
+    # unsent data set holds more samples than the new one so is swapped
+    # back in rather than being replayed.
+
+    snapshot.reset_span_events()
+    record_events(engine, 2)
+    engine.rollback(snapshot)
+
+    assert engine.span_events.num_seen == 2
+    assert engine.custom_events is custom_events
+    assert engine.custom_events.num_seen == 12
+    assert sorted(e["id"] for e in engine.custom_events) == [0, 0, 1, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+def test_double_buffered_rollback_matches_default():
+    results = []
+
+    for double_buffered in (True, False):
+        engine = double_buffered_engine(double_buffered)
+        record_events(engine, 2000)
+        snapshot = engine.harvest_snapshot()
+        record_events(engine, 100)
+        engine.rollback(snapshot)
+
+        data_sets = (engine.span_events, engine.custom_events)
+        results.append([(data_set.num_seen, sorted(e["id"] for e in data_set)) for data_set in data_sets])
+
+    assert results[0] == results[1]
+
+
+def test_double_buffered_harvest_cycles():
+    engine = double_buffered_engine()
+    data_sets = set()
+
+    # Over repeated harvests the same two data sets are swapped in and
+    # out, with each snapshot holding only the events recorded since
+    # the previous harvest.
+
+    for count in range(1, 6):
+        record_events(engine, count)
+        snapshot = engine.harvest_snapshot()
+
+        assert snapshot.span_events.num_seen == count
+        assert sorted(e["id"] for e in snapshot.span_events) == list(range(count))
+
+        data_sets.add(id(snapshot.span_events))
+        snapshot.reset_span_events()
+
+    assert len(data_sets) == 2
+
+    # Data which wasn't sent is restored by a rollback.
+
+    record_events(engine, 3)
+    snapshot = engine.harvest_snapshot()
+    engine.rollback(snapshot)
+
+    assert engine.span_events.num_seen == 3
+    assert sorted(e["id"] for e in engine.span_events) == [0, 1, 2]
+
+
+def sampled_data_set(capacity, priorities):
+    data_set = SampledDataSet(capacity)
+    for priority in priorities:
+        data_set.add({"priority": priority}, priority=priority)
+    return data_set
+
+
+def sampled_priorities(data_set):
+    return sorted(sample["priority"] for sample in data_set)
+
+
+@pytest.mark.parametrize("count", (5, 10, 100))
+def test_sampled_data_set_add(count):
+    priorities = [(i * 7919) % count for i in range(count)]
+    data_set = sampled_data_set(10, priorities)
+
+    assert data_set.num_seen == count
+    assert data_set.num_samples == min(count, 10)
+    assert sampled_priorities(data_set) == sorted(priorities)[-10:]
+    assert data_set.heap is (count >= 10)
+
+
+@pytest.mark.parametrize(
+    "capacity,count,other_count",
+    (
+        (100, 10, 20),  # Under capacity after the merge
+        (100, 60, 60),  # Selection of combined samples
+        (100, 500, 5),  # Few samples pushed onto a full reservoir
+        (100, 5, 500),
+        (0, 5, 5),
+    ),
+)
+def test_sampled_data_set_merge(capacity, count, other_count):
+    priorities = [(i * 7919) % 1000 for i in range(count)]
+    other_priorities = [(i * 104729) % 1000 + 0.5 for i in range(other_count)]
+
+    data_set = sampled_data_set(capacity, priorities)
+    data_set.merge(sampled_data_set(capacity, other_priorities))
+
+    expected = sampled_data_set(capacity, priorities + other_priorities)
+
+    assert data_set.num_seen == expected.num_seen == count + other_count
+    assert sampled_priorities(data_set) == sampled_priorities(expected)
+    assert data_set.heap is expected.heap
+
+    # Sampling continues correctly after the merge.
+    data_set.add({"priority": 5000}, priority=5000)
+    assert 5000 in sampled_priorities(data_set) or not capacity
+
+
+def test_sampled_data_set_merge_equal_priorities():
+    data_set = sampled_data_set(10, [1.0] * 8)
+    data_set.merge(sampled_data_set(10, [1.0] * 8))
+
+    assert data_set.num_samples == 10
+    assert data_set.num_seen == 16
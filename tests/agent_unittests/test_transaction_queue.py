@@ -0,0 +1,102 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import pytest
+
+from newrelic.core.transaction_queue import TransactionQueue
+
+
+class Transaction(object):
+    def __init__(self, sampled=False):
+        self.sampled = sampled
+
+
+@pytest.fixture
+def blocked_queue():
+    # A queue holding one transaction, with the worker blocked on
+    # recording a second so that any further transactions overflow.
+
+    started = threading.Event()
+    unblock = threading.Event()
+    recorded = []
+
+    def record(data):
+        started.set()
+        unblock.wait()
+        recorded.append(data)
+
+    def _blocked_queue(overflow_policy):
+        transaction_queue = TransactionQueue("app", record, 1, overflow_policy)
+        assert transaction_queue.put(Transaction())
+        started.wait()
+        assert transaction_queue.put(Transaction())
+        return transaction_queue
+
+    yield _blocked_queue, recorded
+
+    unblock.set()
+
+
+def test_transaction_queue_records():
+    recorded = []
+    transaction_queue = TransactionQueue("app", recorded.append)
+
+    transactions = [Transaction() for _ in range(10)]
+    for transaction in transactions:
+        assert transaction_queue.put(transaction)
+
+    assert transaction_queue.flush(timeout=5.0)
+    assert recorded == transactions
+    assert transaction_queue.depth == 0
+
+
+def test_transaction_queue_record_exception():
+    recorded = []
+
+    def record(data):
+        if not data.sampled:
+            raise ValueError()
+        recorded.append(data)
+
+    transaction_queue = TransactionQueue("app", record)
+    transaction_queue.put(Transaction())
+    transaction_queue.put(Transaction(sampled=True))
+
+    # The worker survives a failure to record a transaction
+    assert transaction_queue.flush(timeout=5.0)
+    assert len(recorded) == 1
+
+
+@pytest.mark.parametrize(
+    "overflow_policy,sampled,queued,counts",
+    (
+        ("drop", True, True, (1, 0)),
+        ("sample", False, True, (1, 0)),
+        ("sample", True, False, (0, 1)),
+        ("inline", False, False, (0, 1)),
+        ("unknown", False, False, (0, 1)),
+    ),
+)
+def test_transaction_queue_overflow(blocked_queue, overflow_policy, sampled, queued, counts):
+    blocked_queue, recorded = blocked_queue
+    transaction_queue = blocked_queue(overflow_policy)
+
+    assert transaction_queue.put(Transaction(sampled=sampled)) is queued
+    assert transaction_queue.depth == 1
+    assert not transaction_queue.flush(timeout=0.01)
+
+    assert transaction_queue.harvest_counts() == counts
+    assert transaction_queue.harvest_counts() == (0, 0)
@@ -42,15 +42,17 @@ def _make_case_insensitive(rules):
             rule['replacement'] = rule['replacement'].lower()
     return rules
 
+@pytest.mark.parametrize('cache_size,fuse_rules', ((0, False), (100, False), (0, True)))
 @pytest.mark.parametrize('test_group', _load_tests())
-def test_rules_engine(test_group):
+def test_rules_engine(test_group, cache_size, fuse_rules):
 
     # FIXME: The test fixture assumes that matching is case insensitive when it
     # is not. To avoid errors, just lowercase all rules, inputs, and expected
     # values.
     insense_rules = _make_case_insensitive(test_group['rules'])
     test_rules = _prepare_rules(insense_rules)
-    rules_engine = RulesEngine(test_rules)
+    rules_engine = RulesEngine(test_rules, cache_size=cache_size,
+            fuse_rules=fuse_rules)
 
     for test in test_group['tests']:
 
@@ -60,6 +62,9 @@ def test_rules_engine(test_group):
 
         result, ignored = rules_engine.normalize(input_str)
 
+        # A cached result must be the same as the original.
+        assert rules_engine.normalize(input_str) == (result, ignored)
+
         # When a transaction is to be ignored, the test fixture expects that
         # "expected" is None.
         if ignored:
@@ -16,7 +16,7 @@ import json
 import os
 import pytest
 
-from newrelic.core.database_utils import SQLStatement
+from newrelic.core.database_utils import SQLStatement, _tokenize_sql
 
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -58,8 +58,10 @@ class DummyDB(object):
         self.quoting_style = quoting_style
 
 
+@pytest.mark.parametrize('single_pass', (False, True))
 @pytest.mark.parametrize(_parameters, load_tests())
-def test_sql_obfuscation(obfuscated, dialects, sql, pathological):
+def test_sql_obfuscation(obfuscated, dialects, sql, pathological,
+        single_pass):
 
     if pathological:
         pytest.skip()
@@ -68,6 +70,9 @@ def test_sql_obfuscation(obfuscated, dialects, sql, pathological):
 
     for quoting_style in quoting_styles:
         database = DummyDB(quoting_style)
-        statement = SQLStatement(sql, database)
-        actual_obfuscated = statement.obfuscated
+        if single_pass:
+            actual_obfuscated = _tokenize_sql(sql, database)[0]
+        else:
+            statement = SQLStatement(sql, database)
+            actual_obfuscated = statement.obfuscated
         assert actual_obfuscated in obfuscated
@@ -0,0 +1,209 @@
+# Copyright 2010 New Relic, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3 as database
+
+import pytest
+
+from testing_support.fixtures import (dt_enabled,
+        override_application_settings, validate_transaction_metrics)
+from testing_support.validators.validate_span_events import (
+        validate_span_events)
+
+from newrelic.api.background_task import background_task
+from newrelic.api.time_trace import current_trace
+from newrelic.api.transaction import current_transaction
+
+DATABASE_NAME = ':memory:'
+
+INSERT_METRIC = 'Datastore/statement/SQLite/datastore_sqlite/insert'
+
+_coalesce_settings = {
+    'datastore_tracer.coalesce_statements.enabled': True,
+    'transaction_tracer.explain_threshold': 10.0,
+    'transaction_tracer.stack_trace_threshold': 10.0,
+    'span_events.enabled': True,
+}
+
+_disabled_settings = dict(_coalesce_settings)
+_disabled_settings['datastore_tracer.coalesce_statements.enabled'] = False
+
+_slow_settings = dict(_coalesce_settings)
+_slow_settings['transaction_tracer.explain_threshold'] = 0.0
+
+
+def _create_table(cursor):
+    cursor.execute('create table datastore_sqlite (a integer, b text)')
+
+
+@override_application_settings(_coalesce_settings)
+@validate_transaction_metrics('test_coalesce_statements:test_coalesce_execute',
+        scoped_metrics=[(INSERT_METRIC, 50)],
+        rollup_metrics=[(INSERT_METRIC, 50), ('Datastore/all', 52)],
+        background_task=True)
+@validate_span_events(count=1, exact_intrinsics={'name': INSERT_METRIC},
+        exact_agents={'db.callCount': 50})
+@validate_span_events(count=0, exact_intrinsics={'name': INSERT_METRIC},
+        unexpected_agents=['db.callCount'])
+@dt_enabled
+@background_task()
+def test_coalesce_execute():
+    connection = database.connect(DATABASE_NAME)
+    cursor = connection.cursor()
+    _create_table(cursor)
+
+    for i in range(25):
+        cursor.execute('insert into datastore_sqlite values (?, ?)', (i, 'a'))
+
+    # Statements which only differ in the literal values are coalesced.
+
+    for i in range(25):
+        cursor.execute("insert into datastore_sqlite values (%d, 'b')" % i)
+
+
+@override_application_settings(_coalesce_settings)
+@validate_transaction_metrics('test_coalesce_statements:test_coalesce_interrupted',
+        scoped_metrics=[(INSERT_METRIC, 4)],
+        background_task=True)
+@validate_span_events(count=2, exact_intrinsics={'name': INSERT_METRIC},
+        exact_agents={'db.callCount': 2})
+@dt_enabled
+@background_task()
+def test_coalesce_interrupted():
+    connection = database.connect(DATABASE_NAME)
+    cursor = connection.cursor()
+    other = connection.cursor()
+    _create_table(cursor)
+
+    for values in ((1, 'a'), (2, 'b')):
+        cursor.execute('insert into datastore_sqlite values (?, ?)', values)
+
+    other.execute('select * from datastore_sqlite')
+
+    for values in ((3, 'c'), (4, 'd')):
+        cursor.execute('insert into datastore_sqlite values (?, ?)', values)
+
+
+@pytest.mark.parametrize('settings', (_disabled_settings, _slow_settings))
+def test_coalesce_not_applied(settings):
+    @override_application_settings(settings)
+    @validate_transaction_metrics('test_coalesce_not_applied',
+            scoped_metrics=[(INSERT_METRIC, 5)],
+            background_task=True)
+    @validate_span_events(count=5, exact_intrinsics={'name': INSERT_METRIC},
+            unexpected_agents=['db.callCount'])
+    @dt_enabled
+    @background_task(name='test_coalesce_not_applied')
+    def _test():
+        connection = database.connect(DATABASE_NAME)
+        cursor = connection.cursor()
+        _create_table(cursor)
+
+        for i in range(5):
+            cursor.execute('insert into datastore_sqlite values (?, ?)', (i, 'a'))
+
+    _test()
+
+
+@override_application_settings(_coalesce_settings)
+@validate_transaction_metrics('test_coalesce_statements:test_coalesce_error',
+        scoped_metrics=[(INSERT_METRIC, 3)],
+        background_task=True)
+@validate_span_events(count=1, exact_intrinsics={'name': INSERT_METRIC},
+        exact_agents={'db.callCount': 2})
+@validate_span_events(count=1, exact_intrinsics={'name': INSERT_METRIC},
+        expected_agents=['error.class'], unexpected_agents=['db.callCount'])
+@dt_enabled
+@background_task()
+def test_coalesce_error():
+    connection = database.connect(DATABASE_NAME)
+    cursor = connection.cursor()
+    _create_table(cursor)
+
+    for values in ((1, 'a'), (2, 'b')):
+        cursor.execute('insert into datastore_sqlite values (?, ?)', values)
+
+    # A statement which fails is given its own node.
+
+    with pytest.raises(database.Error):
+        cursor.execute('insert into datastore_sqlite values (?, ?)', (1, 2, 3))
+
+
+@override_application_settings(_coalesce_settings)
+@background_task()
+def test_coalesce_previous_node_unchanged():
+    connection = database.connect(DATABASE_NAME)
+    cursor = connection.cursor()
+    _create_table(cursor)
+
+    cursor.execute('insert into datastore_sqlite values (?, ?)', (1, 'a'))
+    previous = cursor._nr_last_node
+
+    cursor.execute('insert into datastore_sqlite values (?, ?)', (2, 'b'))
+
+    assert cursor._nr_last_node.call_count == 2
+    assert cursor._nr_last_node.agent_attributes['db.callCount'] == 2
+    assert 'db.callCount' not in previous.agent_attributes
+
+
+@override_application_settings(_coalesce_settings)
+def test_coalesce_cursor_shared_between_transactions():
+    connection = database.connect(DATABASE_NAME)
+    cursor = connection.cursor()
+    _create_table(cursor)
+
+    @background_task(name='test_coalesce_cursor_shared_between_transactions')
+    def _first():
+        cursor.execute('insert into datastore_sqlite values (?, ?)', (1, 'a'))
+        assert cursor._nr_previous_node() is not None
+
+    @background_task(name='test_coalesce_cursor_shared_between_transactions')
+    def _second():
+        # The node recorded in the previous transaction is dropped rather
+        # than being passed on as the previous node.
+
+        assert cursor._nr_previous_node() is None
+        assert cursor._nr_last_node is None
+
+    _first()
+    _second()
+
+
+@override_application_settings(_coalesce_settings)
+@background_task()
+def test_coalesce_parent_bookkeeping():
+    connection = database.connect(DATABASE_NAME)
+    cursor = connection.cursor()
+    _create_table(cursor)
+
+    parent = current_trace()
+    transaction = current_transaction()
+
+    children = len(parent.children)
+    node_count = transaction._trace_node_count
+
+    for i in range(5):
+        cursor.execute('insert into datastore_sqlite values (?, ?)', (i, 'a'))
+
+    # The coalesced calls replace the node for the statement rather than
+    # being counted as further nodes or outstanding children.
+
+    assert len(parent.children) == children + 1
+    assert parent.child_count == children + 1
+    assert transaction._trace_node_count == node_count + 1
+
+    node = parent.children[-1]
+
+    assert node.call_count == 5
+    assert node is cursor._nr_last_node
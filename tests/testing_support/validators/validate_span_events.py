@@ -84,6 +84,9 @@ def validate_span_events(
         mismatches = []
         matching_span_events = 0
         for captured_event in captured_events:
+            if Span and isinstance(captured_event, bytes):
+                captured_event = Span.FromString(captured_event)
+
             if Span and isinstance(captured_event, Span):
                 intrinsics = captured_event.intrinsics
                 user_attrs = captured_event.user_attributes